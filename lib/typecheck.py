@@ -142,15 +142,39 @@ __all__ = [ "takes", "InputParameterError", "returns", "ReturnValueError",
             "by_regex", "with_attr", "one_of", "set_of" ]
 
 no_check = False # set this to True to turn all checks off
+sample_rate = 1 # check only one in every sample_rate calls of each method
 
 ################################################################################
 
+import os
 from inspect import getargspec, isfunction, isbuiltin, isclass
 from types import NoneType
 from re import compile as regex
 
 ################################################################################
 
+def configure(mode):
+    "Sets checking mode: on, off, or N to check only one call in N"
+
+    # decorators consult no_check when they are applied, i.e., at import time,
+    # whereas sample_rate is consulted at every call
+
+    global no_check, sample_rate
+    mode = str(mode).strip().lower()
+    if mode in ("off", "no", "false", "0"):
+        no_check = True
+    elif mode in ("on", "yes", "true", "1", ""):
+        no_check, sample_rate = False, 1
+    elif mode.isdigit():
+        no_check, sample_rate = False, int(mode)
+    else:
+        raise ValueError("unknown type checking mode: %s" % mode)
+
+# e.g., PASKET_TYPECHECK=off ./run.py ... or PASKET_TYPECHECK=100 ./run.py ...
+configure(os.environ.get("PASKET_TYPECHECK", "on"))
+
+################################################################################
+
 def base_names(C):
     "Returns list of base class names for a given class"
     return [ x.__name__ for x in C.__mro__ ]
@@ -356,8 +380,16 @@ def takes(*args, **kwargs):
         def takes_proxy(method):
             
             method_args, method_defaults = getargspec(method)[0::3]
+            calls = [0]
 
             def takes_invocation_proxy(*args, **kwargs):
+
+                # skip all but one in every sample_rate calls
+
+                if sample_rate > 1:
+                    calls[0] += 1
+                    if calls[0] % sample_rate:
+                        return method(*args, **kwargs)
     
                 # append the default parameters
 
@@ -410,10 +442,17 @@ def returns(sometype):
     else:
 
         def returns_proxy(method):
+
+            calls = [0]
             
             def returns_invocation_proxy(*args, **kwargs):
                 
                 result = method(*args, **kwargs)
+
+                if sample_rate > 1:
+                    calls[0] += 1
+                    if calls[0] % sample_rate:
+                        return result
                 
                 if not checker.check(result):
                     raise ReturnValueError("%s() has returned an invalid "
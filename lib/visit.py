@@ -8,6 +8,18 @@ import inspect
 
 __all__ = ['on', 'when']
 
+# number of dispatches per (node type, exact or fallback), if counting
+_counts = None
+
+def count_dispatches(b):
+  global _counts
+  _counts = {} if b else None
+
+
+def dispatches():
+  return _counts
+
+
 def on(param_name):
   def f(fn):
     dispatcher = Dispatcher(param_name, fn)
@@ -22,8 +34,7 @@ def when(param_type):
     if not isinstance(dispatcher, Dispatcher):
       dispatcher = dispatcher.dispatcher
     dispatcher.add_target(param_type, fn)
-    def ff(*args, **kw):
-      return dispatcher(*args, **kw)
+    ff = dispatcher.entry()
     ff.dispatcher = dispatcher
     return ff
   return f
@@ -33,26 +44,61 @@ class Dispatcher(object):
   def __init__(self, param_name, fn):
     frame = inspect.currentframe().f_back.f_back
     top_level = frame.f_locals == frame.f_globals
-    self.param_index = inspect.getargspec(fn).args.index(param_name)
+    spec = inspect.getargspec(fn)
+    self.param_index = spec.args.index(param_name)
     self.param_name = param_name
+    # the usual visit(self, node), which can be dispatched w/o repacking arguments
+    self.is_binary = self.param_index == 1 and len(spec.args) == 2 \
+        and not spec.varargs and not spec.keywords
     self.targets = {}
+    # targets per concrete type: exact ones, along with fallbacks resolved so far
+    self.table = {}
+
+  # all the targets for superclasses of the given type, in order of registration
+  # then cached, so that issubclass checks happen once per type
+  def resolve(self, typ):
+    issub = issubclass
+    t = self.targets
+    fns = [t[k] for k in t.iterkeys() if issub(typ, k)]
+    def d(*args, **kw):
+      return [fn(*args, **kw) for fn in fns]
+    self.table[typ] = d
+    return d
+
+  def count(self, typ):
+    key = (typ.__name__, "exact" if typ in self.targets else "fallback")
+    _counts[key] = _counts.get(key, 0) + 1
 
   def __call__(self, *args, **kw):
     typ = args[self.param_index].__class__
-    d = self.targets.get(typ)
-    if d is not None:
-      return d(*args, **kw)
-    else:
-      issub = issubclass
-      t = self.targets
-      ks = t.iterkeys()
-      return [t[k](*args, **kw) for k in ks if issub(typ, k)]
+    if _counts is not None: self.count(typ)
+    d = self.table.get(typ)
+    if d is None: d = self.resolve(typ)
+    return d(*args, **kw)
+
+  # function to be bound as a method, which dispatches in a single frame
+  def entry(self):
+    if not self.is_binary:
+      def ff(*args, **kw):
+        return self(*args, **kw)
+      return ff
+
+    table, resolve, count = self.table, self.resolve, self.count
+    def ff(obj, node):
+      typ = node.__class__
+      if _counts is not None: count(typ)
+      d = table.get(typ)
+      if d is None: d = resolve(typ)
+      return d(obj, node)
+    return ff
 
   def add_target(self, typ, target):
     self.targets[typ] = target
+    # fallbacks may change
+    self.table.clear()
+    self.table.update(self.targets)
 
 
 class BaseNode(object):
   def accept(self, visitor):
     return visitor.visit(self)
-
@@ -1,9 +1,12 @@
+import cPickle as pickle
+import multiprocessing
 import os
 import traceback
 import logging
 import logging.config
 import subprocess
 import sys
+import time
 
 from lib.enum import enum
 from lib.typecheck import *
@@ -95,6 +98,7 @@ C.SNG = enum(AUX=u"AuxSingleton", \
 C.sng_roles = [C.SNG.SNG, C.SNG.GET]
 
 # artificial classes that may not appear on samples but should be kept
+# along with the ones added while rewriting the current template (see meta.artifacts)
 _artifacts = [ \
   u"Platform", \
   C.GUI.TOOL, C.GUI.QUE, C.GUI.EVT, C.GUI.IVK, \
@@ -104,20 +108,19 @@ _artifacts = [ \
 @takes(list_of(unicode))
 @returns(nothing)
 def add_artifacts(cnames):
-  global _artifacts
-  _artifacts.extend(cnames)
+  register_artifacts(cnames)
 
 
 @takes(nothing)
 @returns(list_of(unicode))
 def get_artifacts():
-  global _artifacts
-  return _artifacts
+  return _artifacts + artifacts()
 
 
 import util
 from sample import Sample
-from meta import class_lookup
+from meta import class_lookup, lookup_stats, lookup_stats_reset
+from meta import artifacts, register_artifacts
 from meta.template import Template
 from meta.clazz import Clazz
 import harness
@@ -126,6 +129,7 @@ import rewrite
 import encoder
 import sketch
 import decode
+import profiling
 
 pwd = os.path.dirname(__file__)
 root_dir = os.path.join(pwd, "..")
@@ -156,6 +160,7 @@ conf = {}
 def configure(opt):
   conf["encoding"] = opt.encoding
   conf["sketch"] = opt.sketch
+  conf["cache"] = opt.cache
   conf["timeout"] = opt.timeout
   conf["randassign"] = opt.randassign
   conf["randdegree"] = opt.randdegree
@@ -163,6 +168,11 @@ def configure(opt):
   conf["p_cpus"] = opt.p_cpus
   conf["ntimes"] = opt.ntimes
   conf["verbose"] = opt.verbose
+  conf["jobs"] = opt.jobs
+  conf["subcls"] = opt.subcls
+  conf["bench_subcls"] = opt.bench_subcls
+  conf["profile"] = opt.profile
+  conf["profile_python"] = opt.profile_python
 
 def no_encoding():
   conf["encoding"] = False
@@ -179,55 +189,27 @@ def no_sketch():
 def all_swing():
   conf["pattern"] = ["button_demo", "checkbox_demo", "filechooser_demo"]
          
-@takes(str, list_of(str), list_of(str), list_of(str), str, optional(str))
-@returns(int)
-def main(cmd, smpl_paths, tmpl_paths, patterns, out_dir, log_lv=logging.DEBUG):
-  ## logging configuration
-  logging.config.fileConfig(os.path.join(pwd, "logging.conf"))
-  logging.getLogger().setLevel(log_lv)
-
-  ## check custom codegen was built
-  codegen_jar = os.path.join("codegen", "lib", "codegen.jar")
-  if not os.path.isfile(codegen_jar):
-    raise Exception("can't find " + codegen_jar)
-
-  if cmd == "android":
-    tmpl_paths.append(adr_tmpl)
-  elif cmd == "gui":
-    tmpl_paths.append(gui_tmpl)
-
+# run the pipeline for a single pattern or demo:
+# parse, harness, rewrite, encode, and sketch
+# returns the frozen template and the path to sketch output (None if sketch fails)
+def run_demo(p, cmd, smpl_paths, tmpl_paths, _patterns, out_dir, opts, codegen_jar):
+  logging.info("demo: " + p)
+  lookup_stats_reset()
+  _smpl_paths = smpl_paths[:]
+  _tmpl_paths = tmpl_paths[:]
+
+  _smpl_paths.append(os.path.join(smpl_dir, cmd, p))
   if cmd == "pattern":
-    _patterns = patterns[:]
+    client_path = os.path.join(tmpl_dir, cmd, p)
   else: ## android or gui
-    _patterns = [C.P.ACCA, C.P.ACCU, C.P.ACCM, C.P.ADP, \
-        C.P.BLD, C.P.FAC, C.P.SNG, C.P.PRX, C.P.OBS, C.P.STA]
-
-  opts = [] ## sketch options
-  if conf["verbose"]:
-    opts.extend(["-V", "10"])
-  if conf["timeout"]:
-    opts.extend(["--fe-timeout", str(conf["timeout"])])
-    opts.extend(["--slv-timeout", str(conf["timeout"])])
-  # place to keep sketch's temporary files
-  opts.extend(["--fe-tempdir", out_dir])
-  opts.append("--fe-keep-tmp")
-
-  tmpls = []
-  output_paths = []
-  for p in patterns: ## for each pattern or demo
-    logging.info("demo: " + p)
-    _smpl_paths = smpl_paths[:]
-    _tmpl_paths = tmpl_paths[:]
+    client_path = os.path.join(tmpl_dir, app, cmd, p)
+  _tmpl_paths.append(client_path)
 
-    _smpl_paths.append(os.path.join(smpl_dir, cmd, p))
-    if cmd == "pattern":
-      client_path = os.path.join(tmpl_dir, cmd, p)
-    else: ## android or gui
-      client_path = os.path.join(tmpl_dir, app, cmd, p)
-    _tmpl_paths.append(client_path)
+  ## (smpl|tmpl)_path is either a single file or a folder containing files
 
-    ## (smpl|tmpl)_path is either a single file or a folder containing files
+  prof = profiling.begin(p)
 
+  with prof.phase("parse"):
     ## read and parse templates
     tmpl_files = []
     for tmpl_path in _tmpl_paths:
@@ -249,7 +231,7 @@ def main(cmd, smpl_paths, tmpl_paths, patterns, out_dir, log_lv=logging.DEBUG):
     ## read and parse samples
     smpl_files = []
     for smpl_path in _smpl_paths:
-      smpl_files.extend(util.get_files_from_path(smpl_path, "txt"))
+      smpl_files.extend(sample.get_files(smpl_path))
 
     sample.reset()
     smpls = []
@@ -257,77 +239,235 @@ def main(cmd, smpl_paths, tmpl_paths, patterns, out_dir, log_lv=logging.DEBUG):
       smpl = Sample(fname, tmpl.is_event)
       smpls.append(smpl)
 
-    ## make harness
+  ## make harness
+  with prof.phase("harness"):
     harness.mk_harnesses(cmd, tmpl, smpls)
 
-    ## pattern rewriting
+  ## pattern rewriting
+  with prof.phase("rewrite"):
     rewrite.visit(cmd, smpls, tmpl, _patterns)
     java_sk_dir = os.path.join(out_dir, '_'.join(["java_sk", p]))
     decode.dump(cmd, java_sk_dir, tmpl)
 
-    ## clean up templates
-    #reducer.reduce_anno(smpls, tmpl)
-    #reducer.remove_cls(smpls, tmpl)
+  ## clean up templates
+  #reducer.reduce_anno(smpls, tmpl)
+  #reducer.remove_cls(smpls, tmpl)
+
+  tmpl.freeze()
+
+  ## encode (rewritten) templates into sketch files
+  sk_dir = os.path.join(out_dir, '_'.join(["sk", p]))
+  if conf["encoding"]:
+    ctx = encoder.EncodingContext()
+    with prof.phase("encode"):
+      changed = encoder.to_sk(cmd, smpls, tmpl, sk_dir, ctx)
+    if not changed: logging.info("no changes in sketch files: " + sk_dir)
+    # on the classes just encoded, i.e., before solving adds more
+    if conf.get("bench_subcls"):
+      bench_subcls(p, sk_dir, ctx, out_dir, opts, codegen_jar)
+  else: # not encoding
+    logging.info("pass the encoding phase; rather use previous files")
+  logging.debug("class lookup(s): {lookups} (re-indexed: {rebuilds})".format(**lookup_stats()))
+
+  ## run sketch
+  output_path = os.path.join(out_dir, "output", "{}.txt".format(p))
+  if conf["sketch"]:
+    if os.path.exists(output_path): os.remove(output_path)
+
+    # custom codegen
+    _opts = opts[:]
+    _opts.extend(["--fe-custom-codegen", codegen_jar])
+
+    # timing and DAG-size statistics, to be parsed from the output
+    if profiling.enabled() and "-V" not in _opts:
+      _opts.extend(profiling.sketch_opts)
+
+    if conf["randassign"] or conf["parallel"]:
+      _opts.append("--slv-randassign")
+      _opts.extend(["--bnd-dag-size", "16000000"]) # 16M ~> 8G memory
+
+    if conf["parallel"]:
+      ## Python implementation as a CEGIS (sketch-backend) wrapper
+      #_, r = sketch.be_p_run(sk_dir, output_path)
+      # Java implementation inside sketch-frontend
+      _opts.append("--slv-parallel")
+      if conf["p_cpus"]:
+        _opts.extend(["--slv-p-cpus", str(conf["p_cpus"])])
+      if conf["ntimes"]:
+        _opts.extend(["--slv-ntimes", str(conf["ntimes"])])
+      if conf["randdegree"]: # assume FIXED strategy
+        _opts.extend(["--slv-randdegree", str(conf["randdegree"])])
+      else: # adaptive concretization
+        _opts.extend(["--slv-strategy", "WILCOXON"])
+
+    ## reuse the output of a previous run on the same sketch files and options
+    key = sketch.cache_key(sk_dir, _opts + ["--"] + opts)
+    if sketch.cache_load(key, output_path):
+      logging.info("pass sketch; reuse the previous output: {}".format(output_path))
+      prof.add_sketch(sk_dir, output_path, 0.0, cached=True)
+
+    else:
+      sketch.set_default_option(_opts)
+      start = time.time()
+      with prof.phase("solve"):
+        _, r = sketch.run(sk_dir, output_path)
+      prof.add_sketch(sk_dir, output_path, time.time() - start)
+      if profiling.enabled(): prof.save(profiling.report_path(p))
+      # if sketch fails, halt the process here
+      if not r: return None
+
+      ## run sketch again to obtain control-flows
+      # on a copy, since ctrl_flow_run adds more options
+      sketch.set_default_option(opts[:])
+      with prof.phase("ctrl-flow"):
+        r = sketch.ctrl_flow_run(sk_dir, output_path, out_dir)
+      if not r: return None
+      sketch.cache_store(key, output_path)
+
+  else: # not running sketch
+    logging.info("pass sketch; rather read: {}".format(output_path))
 
-    tmpl.freeze()
-    tmpls.append(tmpl)
+  if profiling.enabled(): prof.save(profiling.report_path(p))
 
-    ## encode (rewritten) templates into sketch files
-    sk_dir = os.path.join(out_dir, '_'.join(["sk", p]))
-    if conf["encoding"]:
-      encoder.to_sk(cmd, smpls, tmpl, sk_dir)
-    else: # not encoding
-      logging.info("pass the encoding phase; rather use previous files")
+  return (tmpl, output_path)
 
-    ## run sketch
-    output_path = os.path.join(out_dir, "output", "{}.txt".format(p))
-    output_paths.append(output_path)
+
+# compare encodings of the subtype relation on the sketch files of a demo:
+# time to encode, size of type.sk, and time to solve (if running sketch)
+def bench_subcls(p, sk_dir, ctx, out_dir, opts, codegen_jar):
+  rows = []
+  for enc, elapsed, size, _sk_dir in encoder.bench_subcls(sk_dir, ctx):
+    solved = "-"
     if conf["sketch"]:
+      output_path = os.path.join(out_dir, "output", "{}_{}.txt".format(p, enc))
       if os.path.exists(output_path): os.remove(output_path)
+      sketch.set_default_option(opts + ["--fe-custom-codegen", codegen_jar])
+      start = time.time()
+      _, r = sketch.run(_sk_dir, output_path)
+      solved = "{:.2f}s".format(time.time() - start) if r else "failed"
+      profiling.current().add_sketch(_sk_dir, output_path, time.time() - start)
+    rows.append("{:>10} {:>10.3f}s {:>12} {:>10}".format(enc, elapsed, size, solved))
+
+  logging.info("subcls encodings of {}:\n{:>10} {:>11} {:>12} {:>10}\n{}".format( \
+      p, "encoding", "python", "type.sk", "sketch", '\n'.join(rows)))
+
+
+# since the rest of the pipeline only reads the frozen template and sketch output,
+# a demo can run in its own process, as long as its result is shipped back
+# (artifacts that rewriters have added are kept at the frozen template)
+def run_demo_worker(args):
+  res = run_demo(*args)
+  if not res: return None
+  tmpl, output_path = res
+  # meta-classes refer to each other deeply
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+  rpt = profiling.current()
+  return pickle.dumps((tmpl, output_path, rpt), pickle.HIGHEST_PROTOCOL)
+
+
+def load_demo_result(res):
+  if not res: return None
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+  tmpl, output_path, rpt = pickle.loads(res)
+  profiling.add_report(rpt)
+  return (tmpl, output_path)
 
-      # custom codegen
-      _opts = opts[:]
-      _opts.extend(["--fe-custom-codegen", codegen_jar])
 
-      if conf["randassign"] or conf["parallel"]:
-        _opts.append("--slv-randassign")
-        _opts.extend(["--bnd-dag-size", "16000000"]) # 16M ~> 8G memory
+@takes(str, list_of(str), list_of(str), list_of(str), str, optional(str))
+@returns(int)
+def main(cmd, smpl_paths, tmpl_paths, patterns, out_dir, log_lv=logging.DEBUG):
+  ## logging configuration
+  logging.config.fileConfig(os.path.join(pwd, "logging.conf"))
+  logging.getLogger().setLevel(log_lv)
 
-      sketch.set_default_option(_opts)
+  ## check custom codegen was built
+  codegen_jar = os.path.join("codegen", "lib", "codegen.jar")
+  if not os.path.isfile(codegen_jar):
+    raise Exception("can't find " + codegen_jar)
 
-      if conf["parallel"]:
-        ## Python implementation as a CEGIS (sketch-backend) wrapper
-        #_, r = sketch.be_p_run(sk_dir, output_path)
-        # Java implementation inside sketch-frontend
-        _opts.append("--slv-parallel")
-        if conf["p_cpus"]:
-          _opts.extend(["--slv-p-cpus", str(conf["p_cpus"])])
-        if conf["ntimes"]:
-          _opts.extend(["--slv-ntimes", str(conf["ntimes"])])
-        if conf["randdegree"]: # assume FIXED strategy
-          _opts.extend(["--slv-randdegree", str(conf["randdegree"])])
-        else: # adaptive concretization
-          _opts.extend(["--slv-strategy", "WILCOXON"])
-        _, r = sketch.run(sk_dir, output_path)
-      else:
-        _, r = sketch.run(sk_dir, output_path)
-      # if sketch fails, halt the process here
-      if not r: sys.exit(1)
+  if cmd == "android":
+    tmpl_paths.append(adr_tmpl)
+  elif cmd == "gui":
+    tmpl_paths.append(gui_tmpl)
 
-      ## run sketch again to obtain control-flows
-      sketch.set_default_option(opts)
-      r = sketch.ctrl_flow_run(sk_dir, output_path, out_dir)
-      if not r: sys.exit(1)
+  if cmd == "pattern":
+    _patterns = patterns[:]
+  else: ## android or gui
+    _patterns = [C.P.ACCA, C.P.ACCU, C.P.ACCM, C.P.ADP, \
+        C.P.BLD, C.P.FAC, C.P.SNG, C.P.PRX, C.P.OBS, C.P.STA]
+
+  opts = [] ## sketch options
+  if conf["verbose"]:
+    opts.extend(["-V", "10"])
+  if conf["timeout"]:
+    opts.extend(["--fe-timeout", str(conf["timeout"])])
+    opts.extend(["--slv-timeout", str(conf["timeout"])])
+  # place to keep sketch's temporary files
+  opts.extend(["--fe-tempdir", out_dir])
+  opts.append("--fe-keep-tmp")
 
-    else: # not running sketch
-      logging.info("pass sketch; rather read: {}".format(output_path))
+  ## reuse ASTs of template files that were parsed before
+  ## as well as sketch outputs on the same sketch files
+  if conf.get("cache", True):
+    util.set_ast_cache(os.path.join(out_dir, "cache", "ast"))
+    sketch.set_cache(os.path.join(out_dir, "cache", "sketch"))
+
+  ## per-demo reports of phase timings and Sketch statistics
+  if conf.get("profile"):
+    profiling.set_profile(os.path.join(out_dir, "profile"))
+  ## cProfile per rewriting visitor
+  if conf.get("profile_python"):
+    profiling.set_profile_python(os.path.join(out_dir, "profile", "python"))
+
+  encoder.set_subcls_encoding(conf.get("subcls", "dense"))
+  ## rewrite only sketch files whose contents change
+  encoder.set_incremental(conf.get("cache", True))
+
+  args = (cmd, smpl_paths, tmpl_paths, _patterns, out_dir, opts, codegen_jar)
+  n_jobs = min(conf.get("jobs", 1) or 1, len(patterns))
+  if n_jobs > 1: ## run demos in parallel, then collect frozen templates
+    logging.info("running {} demo(s), {} at once".format(len(patterns), n_jobs))
+    # a fresh process per demo, since meta-classes and encoder use global states
+    pool = multiprocessing.Pool(n_jobs, maxtasksperchild=1)
+    try:
+      ress = pool.map(run_demo_worker, [ (p,) + args for p in patterns ], 1)
+    finally:
+      pool.close()
+      pool.join()
+    # if sketch fails, halt the process here
+    if not all(ress): sys.exit(1)
+    ress = map(load_demo_result, ress)
+  else:
+    ress = []
+    for p in patterns: ## for each pattern or demo
+      res = run_demo(p, *args)
+      # if sketch fails, halt the process here
+      if not res: sys.exit(1)
+      ress.append(res)
 
-    ## end of loop (per pattern/demo)
+  tmpls = [ tmpl for tmpl, _ in ress ]
+  output_paths = [ output_path for _, output_path in ress ]
 
   ## generate compilable model
   java_dir = os.path.join(out_dir, "java")
-  decode.to_java(cmd, java_dir, tmpls, output_paths, _patterns)
+  prof = profiling.begin(cmd)
+  with prof.phase("decode"):
+    decode.to_java(cmd, java_dir, tmpls, output_paths, _patterns)
   logging.info("synthesis done")
 
+  ## time, CPU time, and peak memory usage per phase and per demo
+  logging.info("phases:\n" + profiling.summary())
+  profiling.save_summary(os.path.join(out_dir, "phases.json"))
+
+  ## decoding runs once for all the demos, hence shared by their reports
+  if profiling.enabled():
+    for p in patterns:
+      path = profiling.report_path(p)
+      if not os.path.isfile(path): continue
+      rpt = profiling.Report.load(path)
+      for ph in prof.phases: rpt.add_phase(**ph)
+      rpt.save(path)
+      logging.info(str(rpt))
+
   return 0
 
@@ -95,6 +95,12 @@ if __name__ == "__main__":
   parser.add_option("-e", "--empty",
     action="store_true", dest="empty", default=False,
     help="print out the list of empty methods")
+  parser.add_option("-c", "--cmd",
+    action="store", dest="cmd", default="android",
+    help="platform of the template, for semantic checking")
+  parser.add_option("--bench",
+    action="store", dest="bench", default=None, type="int",
+    help="measure visitor dispatching over N rounds of pure traversals")
 
   (opt, argv) = parser.parse_args()
 
@@ -120,3 +126,23 @@ if __name__ == "__main__":
     for mtd in counter.empty_mtds:
       print mtd.signature
 
+  # e.g., python -m pasket.analysis.empty --bench 10 template/android
+  if opt.bench:
+    import time
+    from ..rewrite.semantic_checker import SemanticChecker
+    tmpl.accept(SemanticChecker(opt.cmd)) # may fill missing return statements
+
+    v.count_dispatches(True)
+    tmpl.accept(EmptyFinder())
+    tmpl.accept(SemanticChecker(opt.cmd))
+    n_dispatches = sum(v.dispatches().values())
+    v.count_dispatches(False)
+
+    for desc, mk in [("EmptyFinder", EmptyFinder), \
+        ("SemanticChecker", lambda: SemanticChecker(opt.cmd))]:
+      start = time.time()
+      for _ in xrange(opt.bench): tmpl.accept(mk())
+      elapsed = time.time() - start
+      print "{}: {:.3f} s ({} rounds)".format(desc, elapsed, opt.bench)
+    print "dispatches per round (both visitors): {}".format(n_dispatches)
+
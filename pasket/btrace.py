@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+import array
+import mmap
+import os
+import string
+import struct
+import sys
+
+## binary trace format, a compact alternative to text logs of logger agent
+##
+## (little-endian, u: unsigned, i: signed)
+## header:  magic "PKTR", u16 version, u16 reserved,
+##          u32 # of strings, u32 # of objects, u32 # of records, u32 # of values
+## strings: u32 offsets[# of strings + 1] into the blob, then utf-8 blob,
+##          padded to 4 bytes; package, class, method names and values are interned
+## objects: (u32 type, u32 hash) per object, both indices of strings
+##          e.g., javax.swing.JButton@1b6d3586 -> (javax.swing.JButton, 1b6d3586)
+## records: (u8 kind, u8 reserved, i16 depth, u32 pkg, u32 cls, u32 mtd,
+##           u32 offset of values, u32 # of values) per record
+##          kind: ENT (> call), EXT (< return), or EVT (environmental change),
+##          where the sort of an event is at mtd, and pkg and cls are NONE
+## values:  u32 per value, an index of objects if OBJ bit is set, o.w., of strings
+
+magic = "PKTR"
+version = 1
+ext = "trc"
+
+ENT, EXT, EVT = 0, 1, 2
+NONE = 0xffffffff
+OBJ = 0x80000000
+
+_header = struct.Struct("<4sHHIIII")
+_obj = struct.Struct("<II")
+_rec = struct.Struct("<BBhIIIII")
+
+
+# check whether the given file is a binary trace
+def is_btrace(fname):
+  with open(fname, 'rb') as f:
+    return f.read(len(magic)) == magic
+
+
+# u32 array from the given bytes
+def to_u32s(buf):
+  arr = array.array('I')
+  assert arr.itemsize == 4
+  arr.fromstring(buf)
+  if sys.byteorder != "little": arr.byteswap()
+  return arr
+
+
+class Writer(object):
+
+  def __init__(self):
+    self._strs = [] # [ s ]
+    self._str_ids = {} # { s : id }
+    self._objs = [] # [ (typ, hsh) ]
+    self._obj_ids = {} # { (typ, hsh) : id }
+    self._recs = [] # [ (kind, depth, pkg, cls, mtd, off, n) ]
+    self._vals = array.array('I')
+
+  def str_id(self, s):
+    if s is None: return NONE
+    if s not in self._str_ids:
+      self._str_ids[s] = len(self._strs)
+      self._strs.append(s)
+    return self._str_ids[s]
+
+  # a runtime instance, e.g., pkg.Type@hash, or a plain value
+  def val_id(self, val):
+    if '@' not in val: return self.str_id(val)
+    typ, hsh = val.split('@')
+    key = (self.str_id(typ), self.str_id(hsh))
+    if key not in self._obj_ids:
+      self._obj_ids[key] = len(self._objs)
+      self._objs.append(key)
+    return OBJ | self._obj_ids[key]
+
+  def add(self, kind, depth, pkg, cls, mtd, vals):
+    off = len(self._vals)
+    self._vals.extend(map(self.val_id, vals))
+    rec = (kind, depth, self.str_id(pkg), self.str_id(cls), self.str_id(mtd), off, len(vals))
+    self._recs.append(rec)
+
+  # > pkg...cls.mtd(val1, val2, ...)
+  def ent(self, depth, pkg, cls, mtd, vals):
+    self.add(ENT, depth, pkg, cls, mtd, vals)
+
+  # < pkg...cls.mtd(val1, val2, ...)
+  def ext(self, depth, pkg, cls, mtd, vals):
+    self.add(EXT, depth, pkg, cls, mtd, vals)
+
+  # sort(val1, val2, ...)
+  def evt(self, depth, kind, vals):
+    self.add(EVT, depth, None, None, kind, vals)
+
+  def save(self, fname):
+    blob = [ s.encode("utf-8") for s in self._strs ]
+    offs = array.array('I', [0])
+    for b in blob: offs.append(offs[-1] + len(b))
+    blob = ''.join(blob)
+    blob = blob + '\0' * (-len(blob) % 4)
+    vals = array.array('I', self._vals)
+    if sys.byteorder != "little":
+      offs.byteswap()
+      vals.byteswap()
+
+    tmp = "{}.{}".format(fname, os.getpid())
+    with open(tmp, 'wb') as f:
+      f.write(_header.pack(magic, version, 0, \
+          len(self._strs), len(self._objs), len(self._recs), len(self._vals)))
+      f.write(offs.tostring())
+      f.write(blob)
+      f.write(''.join([ _obj.pack(*o) for o in self._objs ]))
+      f.write(''.join([ _rec.pack(rec[0], 0, *rec[1:]) for rec in self._recs ]))
+      f.write(vals.tostring())
+    os.rename(tmp, fname) # atomic, in case of concurrent runs
+
+
+class Reader(object):
+
+  def __init__(self, fname):
+    with open(fname, 'rb') as f:
+      self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    mm = self._mm
+
+    _magic, _version, _, n_strs, n_objs, n_recs, n_vals = _header.unpack_from(mm, 0)
+    if _magic != magic or _version != version:
+      raise Exception("not a binary trace", fname)
+
+    pos = _header.size
+    offs = to_u32s(mm[pos:pos + 4 * (n_strs + 1)])
+    pos = pos + 4 * (n_strs + 1)
+    blob = mm[pos:pos + offs[-1]]
+    self._strs = [ blob[offs[i]:offs[i+1]].decode("utf-8") for i in xrange(n_strs) ]
+    pos = pos + offs[-1] + (-offs[-1] % 4)
+
+    objs = to_u32s(mm[pos:pos + _obj.size * n_objs])
+    self._objs = zip(objs[0::2], objs[1::2])
+    pos = pos + _obj.size * n_objs
+
+    self._recs_pos = pos
+    self._n_recs = n_recs
+    pos = pos + _rec.size * n_recs
+    self._vals = to_u32s(mm[pos:pos + 4 * n_vals])
+
+  def close(self):
+    self._mm.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  @property
+  def strs(self):
+    return self._strs
+
+  # [ (type, hash) ], indices of strings
+  @property
+  def objs(self):
+    return self._objs
+
+  def __len__(self):
+    return self._n_recs
+
+  # (kind, depth, pkg, cls, mtd, [val]), where names are strings (or None),
+  # and values are indices of strings, or of objects if OBJ bit is set
+  def records(self):
+    strs, vals = self._strs, self._vals
+    def to_s(i): return strs[i] if i != NONE else None
+    unpack, pos, size = _rec.unpack_from, self._recs_pos, _rec.size
+    for i in xrange(self._n_recs):
+      kind, _, depth, pkg, cls, mtd, off, n = unpack(self._mm, pos + i * size)
+      yield (kind, depth, to_s(pkg), to_s(cls), to_s(mtd), vals[off:off+n].tolist())
+
+
+# convert a text log of logger agent into a binary trace
+def convert(txt, trc):
+  from sample import call_regex, evt_regex, split_vals
+  from util import explode_mname
+
+  w = Writer()
+  with open(txt) as f:
+    depth = 0
+    for line in f:
+      line = unicode(line.strip())
+      if not line: continue # empty line
+      if line[0] in "><":
+        m = call_regex.match(line)
+        if not m: raise Exception("wrong call sequences", line)
+        pkg, cls, mtd = explode_mname(m.group(2))
+        vals = split_vals(m.group(3))
+        if line[0] == '>':
+          w.ent(depth, pkg, cls, mtd, vals)
+          depth = depth + 1
+        else:
+          depth = depth - 1
+          w.ext(depth, pkg, cls, mtd, vals)
+      elif line[0] in string.ascii_letters:
+        m = evt_regex.match(line)
+        if not m: raise Exception("wrong environmental changes", line)
+        w.evt(depth, m.group(1), split_vals(m.group(2)))
+      else: continue # comments or something
+  w.save(trc)
+
+
+"""
+To import lib.*, run as follows:
+  pasket $ python -m pasket.btrace
+"""
+if __name__ == "__main__":
+  from optparse import OptionParser
+  usage = "usage: python -m pasket.btrace (sample.txt | sample_folder)+"
+  parser = OptionParser(usage=usage)
+  (opt, argv) = parser.parse_args()
+
+  if len(argv) < 1:
+    parser.error("incorrect number of arguments")
+
+  import util
+  for arg in argv:
+    for txt in util.get_files_from_path(arg, "txt"):
+      trc = os.path.splitext(txt)[0] + '.' + ext
+      convert(txt, trc)
+      print "{} ({} bytes) -> {} ({} bytes)".format( \
+          txt, os.path.getsize(txt), trc, os.path.getsize(trc))
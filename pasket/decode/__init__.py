@@ -6,6 +6,7 @@ from lib.typecheck import *
 import lib.const as C
 
 from .. import util
+from .. import profiling
 from ..meta import class_lookup
 from ..meta.template import Template
 from ..meta.clazz import Clazz
@@ -164,6 +165,7 @@ def merge_tmpls(prv, elt):
 
 # translate high-level templates into Java code
 # according to the low-level synthesis result
+@profiling.timed("to_java")
 @takes(str, str, list_of(Template), list_of(str), list_of(str))
 @returns(nothing)
 def to_java(cmd, java_dir, tmpls, output_paths, patterns):
@@ -243,6 +245,7 @@ def to_java(cmd, java_dir, tmpls, output_paths, patterns):
 
 # dump out the given template, which might be
 # either an intermediate AST or the final model
+@profiling.timed("decode.dump")
 @takes(str, str, Template, optional(str))
 @returns(nothing)
 def dump(cmd, dst_dir, tmpl, msg=None):
@@ -7,6 +7,7 @@ import lib.visit as v
 import lib.const as C
 
 from .. import util
+from .output import read
 from ..meta import methods, classes, class_lookup
 from ..meta.template import Template
 from ..meta.clazz import Clazz
@@ -19,29 +20,14 @@ class AccessorUni(object):
 
   __aux_name = C.ACC.AUX+"Uni"
 
-  regex_log = r"log::check_log::(-)(\d+)"
-  
   _invoked = Set()
 
-  @staticmethod
-  def is_method_log(msg):
-    return re.match(AccessorUni.regex_log, msg)
-
-  def add_invoked(self, msg):
-    m = re.match(AccessorUni.regex_log, msg)
-    self._invoked.add(int(m.group(2)))
-
   ## hole assignments for roles
   ## glblInit_accessor_????,StmtAssign,accessor_???? = n
   regex_role = r"(({})_\S+_{})__.* = (\d+)$".format('|'.join(C.acc_roles), __aux_name)
 
-  @staticmethod
-  def simple_role_of_interest(msg):
-    return re.match(AccessorUni.regex_role, msg)
-
   # add a mapping from role variable to its value chosen by sketch
-  def add_simple_role(self, msg):
-    m = re.match(AccessorUni.regex_role, msg)
+  def add_simple_role(self, m):
     v, n = m.group(1), m.group(3)
     self._role[v] = n
 
@@ -68,17 +54,10 @@ class AccessorUni(object):
     self._gs = {}
     
     # interpret the synthesis result
-    with open(self._output, 'r') as f:
-      for line in f:
-        line = line.strip()
-        try:
-          if AccessorUni.is_method_log(line): self.add_invoked(line)
-          items = line.split(',')
-          func, kind, msg = items[0], items[1], ','.join(items[2:])
-	  #if func == "AuxAccessorUni": print items
-          if AccessorUni.simple_role_of_interest(msg): self.add_simple_role(msg)
-        except IndexError: # not a line generated by custom codegen
-          pass # if "Total time" in line: logging.info(line)
+    output = read(self._output)
+    self._invoked.update(output.invoked)
+    for m in output.assigns_of(AccessorUni.regex_role):
+      self.add_simple_role(m)
 
   @property
   def demo(self):
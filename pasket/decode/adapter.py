@@ -6,6 +6,7 @@ import lib.visit as v
 import lib.const as C
 
 from .. import util
+from .output import read
 from ..meta import methods, class_lookup
 from ..meta.template import Template
 from ..meta.clazz import Clazz
@@ -23,13 +24,8 @@ class Adapter(object):
   ## glblInit_accessor_????,StmtAssign,accessor_???? = n
   regex_role = r"(({})_{}).* = (\d+)$".format('|'.join(C.adp_roles), __aux_name)
 
-  @staticmethod
-  def simple_role_of_interest(msg):
-    return re.match(Adapter.regex_role, msg)
-
   # add a mapping from role variable to its value chosen by sketch
-  def add_simple_role(self, msg):
-    m = re.match(Adapter.regex_role, msg)
+  def add_simple_role(self, m):
     v, n = m.group(1), m.group(3)
     self._role[v] = n
 
@@ -46,15 +42,8 @@ class Adapter(object):
     self._adaptee = {} # { Aux... : Adaptee }
     
     # interpret the synthesis result
-    with open(self._output, 'r') as f:
-      for line in f:
-        line = line.strip()
-        try:
-          items = line.split(',')
-          func, kind, msg = items[0], items[1], ','.join(items[2:])
-          if Adapter.simple_role_of_interest(msg): self.add_simple_role(msg)
-        except IndexError: # not a line generated by custom codegen
-          pass # if "Total time" in line: logging.info(line)
+    for m in read(self._output).assigns_of(Adapter.regex_role):
+      self.add_simple_role(m)
 
   @property
   def demo(self):
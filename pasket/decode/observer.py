@@ -7,6 +7,7 @@ import lib.visit as v
 import lib.const as C
 
 from .. import util
+from .output import read
 from ..meta import methods, classes, class_lookup
 from ..meta.template import Template
 from ..meta.clazz import Clazz
@@ -51,13 +52,8 @@ class Observer(object):
   ## glblInit_subject_????,StmtAssign,subject_???? = n
   regex_role = r"((({})(_\d)?)_{}[^_]+)_.* = (\d+)$".format('|'.join(C.obs_roles), C.OBS.AUX)
 
-  @staticmethod
-  def st_of_interest(msg):
-    return re.match(Observer.regex_role, msg)
-
   # add a mapping from role variable to its value chosen by sketch
-  def add_st(self, msg):
-    m = re.match(Observer.regex_role, msg)
+  def add_st(self, m):
     v, n = m.group(1), m.group(5)
     self._role[v] = n
 
@@ -82,16 +78,12 @@ class Observer(object):
     self._handle = {} # { Aux... : Handle }
     
     # interpret the synthesis result
-    with open(self._output, 'r') as f:
-      for line in f:
-        line = line.strip()
-        try:
-          items = line.split(',')
-          func, kind, msg = items[0], items[1], ','.join(items[2:])
-          if Observer.exp_of_interest(msg): self.add_exp(func, msg)
-          if Observer.st_of_interest(msg): self.add_st(msg)
-        except IndexError: # not a line generated by custom codegen
-          pass # if "Total time" in line: logging.info(line)
+    output = read(self._output)
+    for func in output.funcs:
+      for msg in output.msgs(func):
+        if Observer.exp_of_interest(msg): self.add_exp(func, msg)
+    for m in output.assigns_of(Observer.regex_role):
+      self.add_st(m)
 
   @property
   def demo(self):
@@ -0,0 +1,120 @@
+import cPickle as pickle
+import os
+import re
+import threading
+import logging
+
+from lib.typecheck import *
+
+## structured reader of sketch output, along with custom codegen
+## codegen/src/CSV.java emits a record per binary expression and assignment:
+##   func,kind,msg
+## e.g., glblInit_subject_????,StmtAssign,subject_???? = n
+
+# method logs checked by sketch, e.g., log::check_log::-42
+regex_log = re.compile(r"log::check_log::(-)(\d+)")
+
+# hole assignments, e.g., subject_???? = n
+regex_assign = re.compile(r".* = \d+$")
+
+class Output(object):
+
+  def __init__(self, path):
+    self._path = path
+    self._invoked = [] # [ mid ]
+    self._funcs = [] # [ func ], in order of appearance
+    self._by_func = {} # { func : [msg] }
+    self._assigns = [] # [ msg ], in order of appearance
+
+    # single pass over the output
+    with open(path, 'r') as f:
+      for line in f:
+        line = line.strip()
+        m = regex_log.match(line)
+        if m: self._invoked.append(int(m.group(2)))
+        items = line.split(',')
+        if len(items) < 2: continue # not a line generated by custom codegen
+        func, msg = items[0], ','.join(items[2:])
+        if func not in self._by_func:
+          self._funcs.append(func)
+          self._by_func[func] = []
+        self._by_func[func].append(msg)
+        if regex_assign.match(msg): self._assigns.append(msg)
+
+  @property
+  def path(self):
+    return self._path
+
+  # ids of methods whose logs are checked
+  @property
+  def invoked(self):
+    return self._invoked
+
+  # functions that have records
+  @property
+  def funcs(self):
+    return self._funcs
+
+  # records of the given function
+  def msgs(self, func):
+    return self._by_func.get(func, [])
+
+  # hole assignments of role variables, e.g., subject_???? = n
+  @property
+  def assigns(self):
+    return self._assigns
+
+  # matches of the given regex against hole assignments
+  def assigns_of(self, regex):
+    for msg in self._assigns:
+      m = re.match(regex, msg)
+      if m: yield m
+
+
+# in-memory cache, so that decoders of the same demo share a single parsing
+# per thread, so that concurrent runs share nothing but the index files
+_local = threading.local()
+
+def __outputs():
+  if not hasattr(_local, "outputs"):
+    _local.outputs = {} # { path : (stamp, Output) }
+  return _local.outputs
+
+def stamp_of(path):
+  st = os.stat(path)
+  return (st.st_size, st.st_mtime)
+
+
+# read the given sketch output, unless it was parsed before
+# the parsed index is cached next to the output file, i.e., output.txt.idx,
+# hence reruns without sketch can skip parsing
+@takes(str)
+@returns(Output)
+def read(path):
+  _outputs = __outputs()
+  stamp = stamp_of(path)
+  if path in _outputs and _outputs[path][0] == stamp:
+    return _outputs[path][1]
+
+  cached = path + ".idx"
+  output = None
+  if os.path.isfile(cached):
+    try:
+      with open(cached, 'rb') as f:
+        _stamp, _output = pickle.load(f)
+      if _stamp == stamp: output = _output
+    except Exception: # broken cache entry; just parse again
+      logging.debug("ignoring broken cache: " + cached)
+
+  if not output:
+    output = Output(path)
+    try:
+      tmp = "{}.{}".format(cached, os.getpid())
+      with open(tmp, 'wb') as f:
+        pickle.dump((stamp, output), f, pickle.HIGHEST_PROTOCOL)
+      os.rename(tmp, cached) # atomic, in case of concurrent runs
+    except (IOError, OSError): # e.g., read-only folder
+      logging.debug("can't cache the index of " + path)
+
+  _outputs[path] = (stamp, output)
+  return output
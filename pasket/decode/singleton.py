@@ -5,6 +5,7 @@ import lib.const as C
 import lib.visit as v
 
 from .. import util
+from .output import read
 from ..meta import methods, classes, class_lookup
 from ..meta.template import Template
 from ..meta.clazz import Clazz
@@ -19,13 +20,8 @@ class Singleton(object):
   ## glblInit_role_????,StmtAssign,role_???? = n
   regex_role = r"((({})_\S+)_{}).* = (\d+)$".format('|'.join(C.sng_roles), C.SNG.AUX)
 
-  @staticmethod
-  def simple_role_of_interest(msg):
-    return re.match(Singleton.regex_role, msg)
-
   # add a mapping from role variable to its value chosen by sketch
-  def add_simple_role(self, msg):
-    m = re.match(Singleton.regex_role, msg)
+  def add_simple_role(self, m):
     v, n = m.group(1), m.group(4)
     self._role[v] = n
 
@@ -44,15 +40,8 @@ class Singleton(object):
     self._gttrs = []
 
     # interpret the synthesis result
-    with open(self._output, 'r') as f:
-      for line in f:
-        line = line.strip()
-        try:
-          items = line.split(',')
-          func, kind, msg = items[0], items[1], ','.join(items[2:])
-          if Singleton.simple_role_of_interest(msg): self.add_simple_role(msg)
-        except IndexError: # not a line generated by custom codegen
-          pass # if "Total time" in line: logging.info(line)
+    for m in read(self._output).assigns_of(Singleton.regex_role):
+      self.add_simple_role(m)
 
   @property
   def demo(self):
@@ -1,11 +1,15 @@
 import math
 import cStringIO
+import hashlib
 import os
+import shutil
+import time
 import copy as cp
 from itertools import chain, ifilter, ifilterfalse
 from functools import partial
 import re
 import operator as op
+import threading
 from string import Template as T
 import logging
 
@@ -15,6 +19,7 @@ from lib.enum import enum
 
 import util
 import sample
+import profiling
 from meta import methods, classes, class_lookup
 from meta.template import Template
 from meta.clazz import Clazz, find_fld, find_mtds_by_name, find_mtds_by_sig, find_base
@@ -28,8 +33,61 @@ import meta.expression as exp
 # constants regarding sketch
 C.SK = enum(z=u"bit", self=u"self")
 
-# global constants that should be placed at every sketch file
-_const = u''
+
+# per-demo states of the encoding phase, e.g., translations of names
+# each thread has its own context, hence demos can be encoded concurrently
+# a context can be pre-warmed, shared read-only, or pickled to workers
+class EncodingContext(object):
+
+  def __init__(self):
+    # global constants that should be placed at every sketch file
+    self.const = u''
+    self.ty = {} # { tname : new_tname }
+    self.mtds = {} # { cname_mname_... : new_mname }
+    self.collections = set([])
+    self.flds = {} # { cname.fname : new_fname }
+    self.s_flds = {} # { cname.fname : accessor }
+    self.mids = set([])  # to maintain which methods are logged
+    self.inits = set([]) # to maintain which <init> are translated
+    # max # of objects in samples
+    self.max_objs = 0
+    # statistics of the samples being encoded, see smpl_index
+    self.smpl_idx = None
+    # classes encoded at type.sk, i.e., indices of the subtype relation
+    self.clss = []
+    self.sk_files = {} # { path : "new" | "changed" | "unchanged" }
+
+_local = threading.local()
+
+@takes(nothing)
+@returns(EncodingContext)
+def context():
+  ctx = getattr(_local, "ctx", None)
+  if not ctx:
+    ctx = EncodingContext()
+    _local.ctx = ctx
+  return ctx
+
+
+# switch the context of the current thread; returns the previous one
+@takes(EncodingContext)
+@returns(EncodingContext)
+def set_context(ctx):
+  prev = context()
+  _local.ctx = ctx
+  return prev
+
+
+# index of the given samples, built once per context, i.e., per demo
+# (rebuilt if samples differ, e.g., a context carried over to the next demo)
+@takes(list_of(sample.Sample))
+@returns(sample.SampleIndex)
+def smpl_index(smpls):
+  ctx = context()
+  if not ctx.smpl_idx or ctx.smpl_idx.smpls != smpls:
+    ctx.smpl_idx = sample.SampleIndex(smpls)
+  return ctx.smpl_idx
+
 
 # among class declarations in the template
 # exclude subclasses so that only the base class remains
@@ -59,23 +117,22 @@ def rm_subs(clss):
 
 
 # convert the given type name into a newer one
-_ty = {} # { tname : new_tname }
 
 @takes(dict_of(unicode, unicode))
 @returns(nothing)
 def add_ty_map(m):
-  global _ty
-  for key in m: _ty[key] = m[key]
+  ctx = context()
+  for key in m: ctx.ty[key] = m[key]
 
 
 @takes(unicode)
 @returns(unicode)
 def trans_ty(tname):
+  ctx = context()
   _tname = util.sanitize_ty(tname.strip())
   array_regex = r"([^ \[\]]+)((\[\])+)"
   m = re.match(array_regex, _tname)
 
-  global _ty
   r_ty = _tname
   # to avoid primitive types that Sketch doesn't support
   if _tname == C.J.z: r_ty = C.SK.z
@@ -90,13 +147,13 @@ def trans_ty(tname):
     r_ty = trans_ty(m.group(1)) + \
         "[{}]".format(len(methods())) * len(re.findall(r"\[\]", m.group(2)))
   # use memoized type conversion
-  elif _tname in _ty: r_ty = _ty[_tname]
+  elif _tname in ctx.ty: r_ty = ctx.ty[_tname]
   # convert Java collections into an appropriate struct name
   # Map<K,V> / List<T> / ... -> Map_K_V / List_T / ...
   elif util.is_collection(_tname):
     r_ty = '_'.join(util.of_collection(_tname))
     logging.debug("{} => {}".format(_tname, r_ty))
-    _ty[_tname] = r_ty
+    ctx.ty[_tname] = r_ty
 
   return r_ty
 
@@ -118,16 +175,15 @@ def sanitize_mname(mname):
 
 # convert the given method name into a new one
 # considering parameterized types (e.g., collections) and inheritances
-_mtds = {} # { cname_mname_... : new_mname }
 @takes(unicode, unicode, list_of(unicode))
 @returns(unicode)
 def trans_mname(cname, mname, arg_typs=[]):
-  global _mtds
+  ctx = context()
   r_mtd = mname
   mid = u'_'.join([cname, mname] + arg_typs)
   # use memoized method name conversion
-  if mid in _mtds:
-    return _mtds[mid]
+  if mid in ctx.mtds:
+    return ctx.mtds[mid]
   # methods of Java collections
   elif util.is_collection(cname):
     _arg_typs = map(trans_ty, arg_typs)
@@ -144,7 +200,7 @@ def trans_mname(cname, mname, arg_typs=[]):
       r_mtd = '_'.join([mname, util.sanitize_ty(cname)])
 
   r_mtd = sanitize_mname(r_mtd)
-  _mtds[mid] = r_mtd
+  ctx.mtds[mid] = r_mtd
   return r_mtd
 
 
@@ -156,21 +212,20 @@ def trans_lib():
 
 
 # to avoid duplicate structs for collections
-_collections = set([])
 
 # Java collections -> C-style struct (along with basic functions)
 @takes(Clazz)
 @returns(unicode)
 def col_to_struct(cls):
+  ctx = context()
   buf = cStringIO.StringIO()
   cname = cls.name
   sname = trans_ty(cname)
-  global _collections
-  if sname in _collections:
+  if sname in ctx.collections:
     logging.debug("collection: {} (duplicated)".format(cname))
     return u''
   else:
-    _collections.add(sname)
+    ctx.collections.add(sname)
     logging.debug("collection: " + cname)
 
   buf.write("struct ${sname} {\n  int idx;\n")
@@ -360,31 +415,29 @@ def col_to_struct(cls):
   return T(buf.getvalue()).safe_substitute(locals())
 
 
-_flds = {} # { cname.fname : new_fname }
-_s_flds = {} # { cname.fname : accessor }
 
 # from the given base class,
 # generate a virtual struct that encompasses all the class in the hierarchy
 @takes(Clazz)
 @returns(Clazz)
 def to_v_struct(cls):
+  ctx = context()
   cls_v = Clazz(name=cls.name)
 
   fld_ty = Field(clazz=cls_v, typ=C.J.i, name=u"__cid")
   cls_v.flds.append(fld_ty)
 
-  global _ty, _flds, _s_flds
   @takes(dict_of(unicode, Field), Clazz)
   @returns(nothing)
   def per_cls(sup_flds, cls):
     aux_name = None
     # if this class is suppose to be replaced (due to pattern rewriting)
     # apply that replacement first, and then replace that aux type as well
-    if not cls.is_aux and cls.name in _ty:
-      aux_name = _ty[cls.name]
+    if not cls.is_aux and cls.name in ctx.ty:
+      aux_name = ctx.ty[cls.name]
       logging.debug("{} => {}".format(aux_name, cls_v.name))
       # check that aux type is already involved in this family
-      if aux_name not in _ty: _ty[aux_name] = cls_v.name
+      if aux_name not in ctx.ty: ctx.ty[aux_name] = cls_v.name
 
     # keep mappings from original subclasses to the representative
     # so that subclasses can refer to the representative
@@ -392,10 +445,10 @@ def to_v_struct(cls):
     cname = util.sanitize_ty(cls.name)
     if cname != cls_v.name: # exclude the root of this family
       logging.debug("{} => {}".format(cname, cls_v.name))
-      _ty[cname] = cls_v.name
+      ctx.ty[cname] = cls_v.name
       if cls.is_inner: # to handle inner class w/ outer class name
         logging.debug("{} => {}".format(repr(cls), cls_v.name))
-        _ty[unicode(repr(cls))] = cls_v.name
+        ctx.ty[unicode(repr(cls))] = cls_v.name
 
     # if this class implements an interface which has constants,
     # then copy those constants
@@ -413,8 +466,8 @@ def to_v_struct(cls):
       fname = unicode(repr(fld))
       fid = '.'.join([cname, sup_fld])
       logging.debug("{} => {}".format(fid, fname))
-      if fld.is_static: _s_flds[fid] = fname
-      else: _flds[fid] = fname # { ..., B.f1 : f1_A }
+      if fld.is_static: ctx.s_flds[fid] = fname
+      else: ctx.flds[fid] = fname # { ..., B.f1 : f1_A }
 
     cur_flds = cp.deepcopy(sup_flds) # { f1 : f1_A }
     @takes(Field)
@@ -433,10 +486,10 @@ def to_v_struct(cls):
         # if A.f1 exists and B redefines f1, then B.f1 : f1_A
         # except for enum, which can (re)define its own fields
         # e.g., SwingConstands.LEADING vs. GroupLayout.Alignment.LEADING
-        if not cls.is_enum and (fid in _s_flds or fid in _flds): return
+        if not cls.is_enum and (fid in ctx.s_flds or fid in ctx.flds): return
         logging.debug("{} => {}".format(fid, fname))
-        if fld.is_static: _s_flds[fid] = fname
-        else: _flds[fid] = fname # { ..., B.f2 : f2_B }
+        if fld.is_static: ctx.s_flds[fid] = fname
+        else: ctx.flds[fid] = fname # { ..., B.f2 : f2_B }
 
       upd_flds(cname)
       if aux_name: upd_flds(aux_name)
@@ -468,26 +521,24 @@ def trans_fld(fld):
 @takes(Clazz)
 @returns(str)
 def to_struct(cls):
-
+  ctx = context()
   # make mappings from static fields to corresponding accessors
   def gen_s_flds_accessors(cls):
     s_flds = filter(op.attrgetter("is_static"), cls.flds)
-    global _s_flds
     for fld in ifilterfalse(op.attrgetter("is_private"), s_flds):
       cname = fld.clazz.name
       fid = '.'.join([cname, fld.name])
       fname = unicode(repr(fld))
       logging.debug("{} => {}".format(fid, fname))
-      _s_flds[fid] = fname
+      ctx.s_flds[fid] = fname
 
   cname = util.sanitize_ty(cls.name)
-  global _ty
   # if this is an interface, merge this into another family of classes
   # as long as classes that implement this interface are in the same family
   if cls.is_itf:
     # interface may have static constants
     gen_s_flds_accessors(cls)
-    subss = util.flatten_classes(cls.subs, "subs")
+    subss = cls.descendants()
     bases = util.rm_dup(map(lambda sub: find_base(sub), subss))
     # filter out interfaces that extend other interfaces, e.g., Action
     base_clss, _ = util.partition(op.attrgetter("is_class"), bases)
@@ -499,10 +550,10 @@ def to_struct(cls):
       base = base_clss[0]
       base_name = base.name
       logging.debug("{} => {}".format(cname, base_name))
-      _ty[cname] = base_name
+      ctx.ty[cname] = base_name
       if cls.is_inner: # to handle inner interface w/ outer class name
         logging.debug("{} => {}".format(repr(cls), base_name))
-        _ty[unicode(repr(cls))] = base_name
+        ctx.ty[unicode(repr(cls))] = base_name
 
     return ''
 
@@ -516,7 +567,7 @@ def to_struct(cls):
   gen_s_flds_accessors(cls)
 
   # for unique class numbering, add an identity mapping
-  if cname not in _ty: _ty[cname] = cname
+  if cname not in ctx.ty: ctx.ty[cname] = cname
 
   buf = cStringIO.StringIO()
   buf.write("struct " + cname + " {\n  int hash;\n")
@@ -535,13 +586,13 @@ def to_struct(cls):
 @takes(unicode, unicode, optional(bool))
 @returns(unicode)
 def trans_fname(cname, fname, is_static=False):
-  global _flds, _s_flds
+  ctx = context()
   r_fld = fname
   fid = '.'.join([cname, fname])
   if is_static:
-    if fid in _s_flds: r_fld = _s_flds[fid]
+    if fid in ctx.s_flds: r_fld = ctx.s_flds[fid]
   else:
-    if fid in _flds: r_fld = _flds[fid]
+    if fid in ctx.flds: r_fld = ctx.flds[fid]
 
   return r_fld
 
@@ -550,7 +601,7 @@ def trans_fname(cname, fname, is_static=False):
 @takes(Clazz)
 @returns(list_of((Method, Field)))
 def collect_decls(cls, attr):
-  clss = util.flatten_classes([cls], "inners")
+  clss = [cls] + cls.all_inners()
   declss = map(op.attrgetter(attr), clss)
   return util.flatten(declss)
 
@@ -883,11 +934,10 @@ def log_param( (ty, nm) ):
 
 
 # Java member method -> C-style function
-_mids = set([])  # to maintain which methods are logged
-_inits = set([]) # to maintain which <init> are translated
 @takes(list_of(sample.Sample), Method)
 @returns(str)
 def to_func(smpls, mtd):
+  ctx = context()
   buf = cStringIO.StringIO()
   if C.mod.GN in mtd.mods: buf.write(C.mod.GN + ' ')
   elif C.mod.HN in mtd.mods: buf.write(C.mod.HN + ' ')
@@ -922,14 +972,12 @@ def to_func(smpls, mtd):
   if not mtd.is_init and not mtd.is_clinit:
     params.pop()
 
-  clss = util.flatten_classes([mtd.clazz], "subs")
-  logged = (not mtd.is_init) and sample.mtd_appears(smpls, clss, mtd.name)
+  logged = (not mtd.is_init) and smpl_index(smpls).mtd_logged(mtd)
   mid = unicode(repr(mtd))
   m_ent = mid + "_ent()"
   m_ext = mid + "_ext()"
   if logged:
-    global _mids
-    _mids.add(mid)
+    ctx.mids.add(mid)
 
   if logged: # logging method entry (>)
     _log_params = map(log_param, params)
@@ -977,11 +1025,10 @@ def to_func(smpls, mtd):
       buf.write(trans_s(mtd, mtd.body[-1]))
 
   if mtd.is_init:
-    evt_srcs = map(util.sanitize_ty, sample.evt_sources(smpls))
+    evt_srcs = map(util.sanitize_ty, smpl_index(smpls).evt_sources)
     cname = unicode(repr(mtd.clazz))
     if cname in evt_srcs:
-      global _inits
-      _inits.add(cname)
+      ctx.inits.add(cname)
     buf.write("\nreturn {};".format(C.SK.self))
 
   buf.write("\n}\n")
@@ -992,9 +1039,10 @@ def to_func(smpls, mtd):
 @takes(str, list_of(Clazz))
 @returns(nothing)
 def gen_type_sk(sk_dir, bases):
+  ctx = context()
   buf = cStringIO.StringIO()
   buf.write("package type;\n")
-  buf.write(_const)
+  buf.write(ctx.const)
 
   buf.write(trans_lib())
   buf.write('\n')
@@ -1055,59 +1103,200 @@ def gen_type_sk(sk_dir, bases):
     }}
   """.format(C.typ.belongsTo, ", ".join(map(str, belongs))))
 
-  subcls = \
-      map(lambda cls_i: '{' + ", ".join( \
-          map(lambda cls_j: str(cls_i <= cls_j).lower(), classes()) \
-      ) + '}', classes())
-  buf.write("""
+  ctx.clss = classes()[:]
+  buf.write(subcls_marker)
+  buf.write(gen_subcls(_subcls_enc, ctx.clss))
+
+  write_sk(os.path.join(sk_dir, "type.sk"), buf.getvalue())
+  buf.close()
+
+
+## encodings of the subtype relation, i.e., subcls(i, j) iff cls_i <= cls_j
+##   dense: |classes|^2 bit matrix
+##   csr: supertypes of each class in compressed sparse row (Yale) format
+##   interval: descendants of each class as ranges of preorder numbers
+subcls_encodings = ["dense", "csr", "interval"]
+_subcls_enc = subcls_encodings[0]
+
+# comment in front of the subtype relation at type.sk
+subcls_marker = "\n// subtype relation\n"
+
+@takes(str)
+@returns(nothing)
+def set_subcls_encoding(enc):
+  global _subcls_enc
+  if enc not in subcls_encodings:
+    raise Exception("unknown subtype encoding", enc)
+  _subcls_enc = enc
+
+
+# supertypes of each class, as sorted indices of the given classes
+# i.e., j in rows[i] iff cls_i <= cls_j
+# computed from the cached supertype closures, rather than |classes|^2 checks
+@takes(list_of(Clazz))
+@returns(list_of(list_of(int)))
+def subcls_rows(clss):
+  by_name, by_repr = {}, {}
+  objs, prims = [], []
+  for j, cls_j in enumerate(clss):
+    by_name.setdefault(cls_j.name, []).append(j)
+    by_repr.setdefault(repr(cls_j), []).append(j)
+    # see Clazz.__lt__
+    if cls_j.name in C.J.OBJ: objs.append(j)
+    if cls_j.name in C.primitives:
+      prims.append( (C.primitives.index(cls_j.name), j) )
+
+  rows = []
+  for cls_i in clss:
+    names, reprs, p_id = cls_i.sup_closure()
+    row = set(objs)
+    row.update(by_repr[repr(cls_i)]) # reflective
+    for name in names: row.update(by_name.get(name, []))
+    for r in reprs: row.update(by_repr.get(r, []))
+    if p_id is not None:
+      row.update([ j for o_id, j in prims if p_id < o_id ])
+    rows.append(sorted(row))
+  return rows
+
+
+# preorder numbers of classes along the superclass tree
+# so that descendants of a class tend to be numbered consecutively
+@takes(list_of(Clazz), list_of(list_of(int)))
+@returns(list_of(int))
+def subcls_preorder(clss, rows):
+  idx = dict([ (id(cls), i) for i, cls in enumerate(clss) ])
+  children = [ [] for _ in clss ]
+  roots = []
+  for i, cls in enumerate(clss):
+    sup = class_lookup(cls.sup) if cls.sup else None
+    p = idx.get(id(sup)) if sup else None
+    # only along genuine (acyclic) subtype edges
+    if p is not None and p != i and p in rows[i] and i not in rows[p]:
+      children[p].append(i)
+    else: roots.append(i)
+
+  pos = [None] * len(clss)
+  n = 0
+  for root in roots:
+    worklist = [root]
+    while worklist:
+      i = worklist.pop()
+      if pos[i] is not None: continue
+      pos[i] = n
+      n = n + 1
+      worklist.extend(reversed(children[i]))
+  return pos
+
+
+# maximal ranges of consecutive numbers: [1, 2, 3, 5] -> [(1, 3), (5, 5)]
+def to_ranges(ns):
+  ranges = []
+  for n in sorted(ns):
+    if ranges and ranges[-1][1] + 1 == n: ranges[-1] = (ranges[-1][0], n)
+    else: ranges.append( (n, n) )
+  return ranges
+
+
+# Sketch encoding of subcls(i, j) over the given classes
+@takes(str, list_of(Clazz))
+@returns(str)
+def gen_subcls(enc, clss):
+  rows = subcls_rows(clss)
+  n = len(rows)
+  to_s = lambda ns: ", ".join(map(str, ns))
+
+  if enc == "csr":
+    IA, JA = [0], []
+    for row in rows:
+      JA.extend(row)
+      IA.append(len(JA))
+    width = max(map(len, rows)) if rows else 0
+    # padding, so that jA is always in bounds
+    JA.extend([-1] * width)
+    # unrolled search over at most width supertypes
+    conds = [ "(b+{0} < e && _{1}_jA[b+{0}] == j)".format(k, C.typ.subcls) \
+        for k in xrange(width) ]
+    return """
+    #define _{0}_iA {{ {1} }}
+    #define _{0}_jA {{ {2} }}
+    bit {0}(int i, int j) {{
+      int b = _{0}_iA[i];
+      int e = _{0}_iA[i+1];
+      return {3};
+    }}
+  """.format(C.typ.subcls, to_s(IA), to_s(JA), " || ".join(conds) or "false")
+
+  elif enc == "interval":
+    pos = subcls_preorder(clss, rows)
+    # descendants of each class, in preorder numbers
+    descs = [ [] for _ in rows ]
+    for i, row in enumerate(rows):
+      for j in row: descs[j].append(pos[i])
+    ranges = map(to_ranges, descs)
+    width = max(map(len, ranges)) if ranges else 0
+    # padding with empty ranges
+    los = [ [ lo for lo, _ in rs ] + [1] * (width - len(rs)) for rs in ranges ]
+    his = [ [ hi for _, hi in rs ] + [0] * (width - len(rs)) for rs in ranges ]
+    to_m = lambda m: ", ".join([ '{' + to_s(r) + '}' for r in m ])
+    conds = [ "(_{1}_lo[j][{0}] <= p && p <= _{1}_hi[j][{0}])".format(k, C.typ.subcls) \
+        for k in xrange(width) ]
+    return """
+    #define _{0}_pos {{ {1} }}
+    #define _{0}_lo {{ {2} }}
+    #define _{0}_hi {{ {3} }}
+    bit {0}(int i, int j) {{
+      int p = _{0}_pos[i];
+      return {4};
+    }}
+  """.format(C.typ.subcls, to_s(pos), to_m(los), to_m(his), " || ".join(conds) or "false")
+
+  else: # dense
+    def to_row(row):
+      row = set(row)
+      return '{' + ", ".join([ str(j in row).lower() for j in xrange(n) ]) + '}'
+    return """
     #define _{0} {{ {1} }}
     bit {0}(int i, int j) {{
       return _{0}[i][j];
     }}
-  """.format(C.typ.subcls, ", ".join(subcls)))
-
-  ## sub type relations
-  #subcls = []
-  #for cls_i in classes():
-  #  row = []
-  #  for cls_j in classes():
-  #    row.append(int(cls_i <= cls_j))
-  #  subcls.append(row)
-
-  ## sub type relations in yale format 
-  #_, IA, JA = util.yale_format(subcls)
-  #li, lj = len(IA), len(JA)
-  #si = ", ".join(map(str, IA))
-  #sj = ", ".join(map(str, JA))
-  #buf.write("""
-  #  #define _iA {{ {si} }}
-  #  #define _jA {{ {sj} }}
-  #  int iA(int i) {{
-  #    return _iA[i];
-  #  }}
-  #  int jA(int j) {{
-  #    return _jA[j];
-  #  }}
-  #  bit subcls(int i, int j) {{
-  #    int col_i = iA(i);
-  #    int col_j = iA(i+1);
-  #    for (int col = col_i; col < col_j; col++) {{
-  #      if (j == jA(col)) return true;
-  #    }}
-  #    return false;
-  #  }}
-  #""".format(**locals()))
-
-  with open(os.path.join(sk_dir, "type.sk"), 'w') as f:
-    f.write(buf.getvalue())
-    logging.info("encoding " + f.name)
-  buf.close()
+  """.format(C.typ.subcls, ", ".join(map(to_row, rows)))
+
+
+# re-encode the subtype relation of type.sk in every encoding
+# each on a copy of the given sketch folder, i.e., sk_dir_(dense|csr|interval)
+# over the classes that to_sk has just encoded with the given context, i.e., before solving it
+# returns [ (encoding, encoding time, size of type.sk, sketch folder) ]
+@takes(str, EncodingContext)
+@returns(list_of(tuple))
+def bench_subcls(sk_dir, ctx):
+  clss = ctx.clss
+  if not clss: raise Exception("no classes encoded at", sk_dir)
+  with open(os.path.join(sk_dir, "type.sk"), 'r') as f:
+    prefix = f.read().split(subcls_marker)[0]
+
+  res = []
+  for enc in subcls_encodings:
+    start = time.time()
+    subcls = gen_subcls(enc, clss)
+    elapsed = time.time() - start
+
+    _sk_dir = '_'.join([sk_dir, enc])
+    if os.path.isdir(_sk_dir): shutil.rmtree(_sk_dir)
+    shutil.copytree(sk_dir, _sk_dir)
+    type_sk = os.path.join(_sk_dir, "type.sk")
+    with open(type_sk, 'w') as f:
+      f.write(prefix + subcls_marker + subcls)
+    size = os.path.getsize(type_sk)
+    logging.info("subcls ({}): {:.3f}s, type.sk: {} bytes".format(enc, elapsed, size))
+    res.append( (enc, elapsed, size, _sk_dir) )
+  return res
 
 
 # generate cls.sk
 @takes(str, list_of(sample.Sample), Clazz)
 @returns(optional(unicode))
 def gen_cls_sk(sk_dir, smpls, cls):
+  ctx = context()
   mtds = collect_decls(cls, "mtds")
   flds = collect_decls(cls, "flds")
   s_flds = filter(op.attrgetter("is_static"), flds)
@@ -1120,7 +1309,7 @@ def gen_cls_sk(sk_dir, smpls, cls):
 
   buf = cStringIO.StringIO()
   buf.write("package {};\n".format(cname))
-  buf.write(_const)
+  buf.write(ctx.const)
 
   # static fields
   buf.write('\n'.join(map(trans_fld, s_flds)))
@@ -1156,38 +1345,20 @@ def gen_cls_sk(sk_dir, smpls, cls):
     buf.write(to_func(smpls, mtd) + os.linesep)
 
   cls_sk = cname + ".sk"
-  with open(os.path.join(sk_dir, cls_sk), 'w') as f:
-    f.write(buf.getvalue())
-    logging.info("encoding " + f.name)
-    return cls_sk
-
-
-# max # of objects in samples
-max_objs = 0
-
-# generate sample_x.sk
-@takes(str, sample.Sample, Template, Method)
-@returns(nothing)
-def gen_smpl_sk(sk_path, smpl, tmpl, main):
-  buf = cStringIO.StringIO()
-  buf.write("package {};\n".format(smpl.name))
-  buf.write(_const)
-  buf.write("harness void {} () {{\n".format(smpl.name))
-
-  # insert call-return sequences
-  buf.write("""
-    clear_log@log();
-    int[P] log = { 0 };
-  """)
-  global _mids
-  obj_cnt = 0
-  objs = { C.J.N: 0, C.J.FALSE: 0, C.J.TRUE: 1, } # { @Obj...aaa : 2, ... }
-  for i in xrange(10):
-    objs[str(i)] = i
-    obj_cnt = obj_cnt + 1
-
+  write_sk(os.path.join(sk_dir, cls_sk), buf.getvalue())
+  return cls_sk
+
+
+# (>|<) logs to be encoded, along with ids of their methods
+# i.e., except for <init>, exits whose entries are missed,
+# and methods that are not declared in the template or not logged
+# is_logged: whether the method of the given id is logged
+@takes(list_of(sample.CallBase), callable)
+@returns(list_of(tuple))
+def encoded_IOs(ios, is_logged):
+  res = []
   call_stack = []
-  for io in smpl.IOs:
+  for io in ios:
     # ignore <init>
     if io.is_init: continue
     elif isinstance(io, sample.CallExt):
@@ -1203,7 +1374,7 @@ def gen_smpl_sk(sk_path, smpl, tmpl, main):
       mtd = None # find_mtd_by_sig(io.cls, io.mtd, ...)
       if mtd: # found the method that matches the argument types
         mid = repr(mtd)
-        if mid not in _mids: continue
+        if not is_logged(mid): continue
 
       else: # try other possible methods
         mtds = find_mtds_by_name(io.cls, io.mtd)
@@ -1214,12 +1385,55 @@ def gen_smpl_sk(sk_path, smpl, tmpl, main):
           if _gap <= min_gap: # eq is needed for zero parameter
             min_gap = _gap
             mid = repr(mtd)
-            if mid not in _mids: mid = None
+            if not is_logged(mid): mid = None
 
       call_stack.append(mid)
       # ignore methods that are not declared in the template
       if not mid: continue
 
+    res.append( (io, mid) )
+  return res
+
+
+# number of top-level call-return blocks that repeat the previous one,
+# i.e., the same sequence of methods, maybe on different objects
+@takes(list_of(tuple))
+@returns(int)
+def repeated_blocks(ios):
+  blocks = []
+  depth = 0
+  for io, mid in ios:
+    if depth == 0: blocks.append([])
+    if isinstance(io, sample.CallEnt): depth = depth + 1
+    else: depth = depth - 1
+    blocks[-1].append(mid)
+  return len([ i for i in xrange(1, len(blocks)) if blocks[i] == blocks[i-1] ])
+
+
+# generate sample_x.sk
+# ios: (>|<) logs of the sample, maybe trimmed already
+@takes(str, sample.Sample, Template, Method, optional(list_of(sample.CallBase)))
+@returns(nothing)
+def gen_smpl_sk(sk_path, smpl, tmpl, main, ios=None):
+  ctx = context()
+  if ios is None: ios = smpl.IOs
+  buf = cStringIO.StringIO()
+  buf.write("package {};\n".format(smpl.name))
+  buf.write(ctx.const)
+  buf.write("harness void {} () {{\n".format(smpl.name))
+
+  # insert call-return sequences
+  buf.write("""
+    clear_log@log();
+    int[P] log = { 0 };
+  """)
+  obj_cnt = 0
+  objs = { C.J.N: 0, C.J.FALSE: 0, C.J.TRUE: 1, } # { @Obj...aaa : 2, ... }
+  for i in xrange(10):
+    objs[str(i)] = i
+    obj_cnt = obj_cnt + 1
+
+  for io, mid in encoded_IOs(ios, lambda mid: mid in ctx.mids):
     if isinstance(io, sample.CallEnt):
       mid = mid + "_ent()"
     else: # sample.CallExt
@@ -1252,8 +1466,7 @@ def gen_smpl_sk(sk_path, smpl, tmpl, main):
     int len_log = get_log_cnt@log();
     reset_log_cnt@log();
   """)
-  global max_objs
-  max_objs = max(max_objs, obj_cnt)
+  ctx.max_objs = max(ctx.max_objs, obj_cnt)
 
   # invoke class initializers
   for cls in util.flatten_classes(tmpl.classes, "inners"):
@@ -1273,9 +1486,7 @@ def gen_smpl_sk(sk_path, smpl, tmpl, main):
 
   buf.write("assert len_log == get_log_cnt@log();")
   buf.write("\n}\n")
-  with open(sk_path, 'w') as f:
-    f.write(buf.getvalue())
-    logging.info("encoding " + f.name)
+  write_sk(sk_path, buf.getvalue())
   buf.close()
 
 
@@ -1283,11 +1494,11 @@ def gen_smpl_sk(sk_path, smpl, tmpl, main):
 @takes(str, Template)
 @returns(nothing)
 def gen_log_sk(sk_dir, tmpl):
+  ctx = context()
   buf = cStringIO.StringIO()
   buf.write("package log;\n")
-  buf.write(_const)
-  global max_objs
-  buf.write("int O = {}; // # of objects\n".format(max_objs + 1))
+  buf.write(ctx.const)
+  buf.write("int O = {}; // # of objects\n".format(ctx.max_objs + 1))
 
   buf.write("""
     int log_cnt = 0;
@@ -1340,9 +1551,8 @@ def gen_log_sk(sk_dir, tmpl):
     }
   """)
 
-  global _inits
   reg_codes = []
-  for ty in _inits:
+  for ty in ctx.inits:
     cls = class_lookup(ty)
     if not cls: continue
 
@@ -1381,9 +1591,8 @@ def gen_log_sk(sk_dir, tmpl):
     }}
   """.format(C.SK.self, "\nelse ".join(reg_codes)))
 
-  global _ty;
   _clss = []
-  for ty in _ty.keys():
+  for ty in ctx.ty.keys():
     if util.is_collection(ty): continue
     if util.is_array(ty): continue
     cls = class_lookup(ty)
@@ -1407,71 +1616,133 @@ def gen_log_sk(sk_dir, tmpl):
         int {mname}_ext () {{ return -{mtd.id}; }}
       """.format(**locals()))
 
-  with open(os.path.join(sk_dir, "log.sk"), 'w') as f:
-    f.write(buf.getvalue())
-    logging.info("encoding " + f.name)
+  write_sk(os.path.join(sk_dir, "log.sk"), buf.getvalue())
   buf.close()
 
 
-# reset global variables
-@takes(nothing)
+## incremental encoding: a sketch file is (re)written only if its content changes,
+## so that unchanged files keep their mtimes, and changed ones can be reported
+
+_incremental = True
+
+@takes(bool)
 @returns(nothing)
-def reset():
-  global _ty, _mtds, _flds, _s_flds
-  global _collections, _mids, _inits
-  global max_objs
-  _ty = {}
-  _mtds = {}
-  _flds = {}
-  _s_flds = {}
-  _collections = set([])
-  _mids = set([])
-  _inits = set([])
-  max_objs = 0
+def set_incremental(b):
+  global _incremental
+  _incremental = b
 
 
-# translate the high-level templates into low-level sketches
-# using information at the samples
-@takes(str, list_of(sample.Sample), Template, str)
+def digest(content):
+  return hashlib.sha1(content).hexdigest()
+
+
+# path is unicode if it is named after a class, e.g., cls.sk
+@takes((str, unicode), str)
 @returns(nothing)
-def to_sk(cmd, smpls, tmpl, sk_dir):
-  # clean up result directory
-  if os.path.isdir(sk_dir): util.clean_dir(sk_dir)
-  else: os.makedirs(sk_dir)
+def write_sk(path, content):
+  ctx = context()
+  status = "new"
+  if _incremental and os.path.isfile(path):
+    if os.path.getsize(path) == len(content):
+      with open(path, 'r') as f:
+        if digest(f.read()) == digest(content): status = "unchanged"
+    if status == "new": status = "changed"
+
+  ctx.sk_files[path] = status
+  if status == "unchanged":
+    logging.debug("encoding " + path + " (unchanged)")
+    return
+
+  with open(path, 'w') as f:
+    f.write(content)
+    logging.info("encoding " + f.name)
+
 
-  # reset global variables so that we can run this encoding phase per demo
-  reset()
+# remove files that are not generated this time, and report changes
+# returns the names of new, changed, or removed files
+@takes(str)
+@returns(list_of((str, unicode)))
+def report_sk(sk_dir):
+  ctx = context()
+  removed = []
+  for fname in os.listdir(sk_dir):
+    path = os.path.join(sk_dir, fname)
+    if path in ctx.sk_files: continue
+    if os.path.isdir(path): shutil.rmtree(path)
+    else: os.remove(path)
+    removed.append(fname)
+
+  changes = {}
+  for path, status in ctx.sk_files.iteritems():
+    changes.setdefault(status, []).append(os.path.basename(path))
+  changes["removed"] = removed
+  for status in ["new", "changed", "removed"]:
+    fnames = sorted(changes.get(status, []))
+    if fnames: logging.info("{} file(s): {}".format(status, ", ".join(fnames)))
+  logging.info("{}: {} new, {} changed, {} unchanged, {} removed".format( \
+      sk_dir, *[ len(changes.get(k, [])) for k in ["new", "changed", "unchanged", "removed"] ]))
+  return sorted(changes.get("new", []) + changes.get("changed", []) + removed)
+
+
+# translate the high-level templates into low-level sketches
+# using information at the samples
+# returns the names of sketch files that are changed
+# the context, a fresh one unless given, is installed for the current thread
+# while encoding, where trans_* and gen_*_sk read it, and then the previous one is back
+@profiling.timed("to_sk")
+@takes(str, list_of(sample.Sample), Template, str, optional(EncodingContext))
+@returns(list_of((str, unicode)))
+def to_sk(cmd, smpls, tmpl, sk_dir, ctx=None):
+  if not ctx: ctx = EncodingContext()
+  prev = set_context(ctx)
+  try: return __to_sk(cmd, smpls, tmpl, sk_dir, ctx)
+  finally: set_context(prev)
+
+
+def __to_sk(cmd, smpls, tmpl, sk_dir, ctx):
+  # clean up result directory, unless encoding incrementally
+  if not os.path.isdir(sk_dir): os.makedirs(sk_dir)
+  elif not _incremental: util.clean_dir(sk_dir)
 
   # update global constants
+  smpl_idx = smpl_index(smpls)
   def logged(mtd):
     if mtd.is_init: return False
-    clss = util.flatten_classes([mtd.clazz], "subs")
-    return sample.mtd_appears(smpls, clss, mtd.name)
+    return smpl_idx.mtd_logged(mtd)
   mtds = filter(logged, methods())
   if mtds:
     n_params = 2 + max(map(len, map(op.attrgetter("params"), mtds)))
   else: # no meaningful logs in the sample?
     n_params = 2
 
-  n_evts = sample.max_evts(smpls)
+  n_evts = smpl_idx.max_evts
   if cmd == "android":
-    n_views = sample.max_views(smpls)
+    n_views = smpl_idx.max_views
     magic_S = max(3, n_evts + 1, n_views)
   else:
     magic_S = max(5, n_evts + 1) # at least 5, just in case
 
-  n_ios = sample.max_IOs(smpls)
+  # type.sk
+  logging.info("building class hierarchy")
+  tmpl.consist()
+
+  # trim samples ahead, so that the length of logs is as short as possible
+  # at this point, logged methods are a superset of the ones to be encoded
+  logged_mids = set([ repr(mtd) for mtd in methods() if logged(mtd) ])
+  smpl_ios = {} # { sample name : [ (>|<) log ] }
+  for smpl in smpls:
+    ios = encoded_IOs(smpl.IOs, lambda mid: mid in logged_mids)
+    smpl_ios[smpl.name] = [ io for io, _ in ios ]
+    logging.debug("sample {}: {} of {} (>|<) log(s), {} repeated block(s)".format( \
+        smpl.name, len(ios), len(smpl.IOs), repeated_blocks(ios)))
+  n_ios = max(map(len, smpl_ios.values())) if smpls else 0
 
-  global _const
-  _const = u"""
+  ctx.const = u"""
     int P = {}; // length of parameters (0: (>|<)mid, 1: receiver, 2...)
     int S = {}; // length of arrays for Java collections
     int N = {}; // length of logs
   """.format(n_params, magic_S, n_ios)
 
-  # type.sk
-  logging.info("building class hierarchy")
-  tmpl.consist()
   # merge all classes and interfaces, except for primitive types
   clss, _ = util.partition(lambda c: util.is_class_name(c.name), classes())
   bases = rm_subs(clss)
@@ -1491,10 +1762,12 @@ def to_sk(cmd, smpls, tmpl, sk_dir):
     smpl_sk = "sample_" + smpl.name + ".sk"
     smpl_sks.append(smpl_sk)
     sk_path = os.path.join(sk_dir, smpl_sk)
-    gen_smpl_sk(sk_path, smpl, tmpl, tmpl.harness(smpl.name))
+    gen_smpl_sk(sk_path, smpl, tmpl, tmpl.harness(smpl.name), smpl_ios[smpl.name])
 
   # log.sk
   gen_log_sk(sk_dir, tmpl)
+  logging.info("N: {} (w/o trimming: {}), P: {}, O: {}".format( \
+      n_ios, smpl_idx.max_IOs, n_params, ctx.max_objs + 1))
 
   # sample.sk that imports all the other sketch files
   buf = cStringIO.StringIO()
@@ -1523,8 +1796,8 @@ def to_sk(cmd, smpls, tmpl, sk_dir):
   sks = ["log.sk", "type.sk"] + cls_sks + smpl_sks
   for sk in sks:
     buf.write("include \"{}\";\n".format(sk))
-  with open(os.path.join(sk_dir, "sample.sk"), 'w') as f:
-    f.write(buf.getvalue())
-    logging.info("encoding " + f.name)
+  write_sk(os.path.join(sk_dir, "sample.sk"), buf.getvalue())
   buf.close()
 
+  return report_sk(sk_dir)
+
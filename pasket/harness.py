@@ -7,6 +7,7 @@ import lib.const as C
 
 from . import add_artifacts
 import util
+import profiling
 from anno import Anno
 from sample import Sample, CallEnt, CallExt, kind
 from meta import class_lookup
@@ -232,6 +233,7 @@ def mk_harness_pattern(tmpl, cls, smpl):
   cls.add_mtds([harness])
 
 
+@profiling.timed("mk_harnesses")
 @takes(str, Template, list_of(Sample))
 @returns(nothing)
 def mk_harnesses(cmd, tmpl, smpls):
@@ -1,3 +1,5 @@
+import threading
+
 import lib.const as C
 from lib.enum import enum
 
@@ -10,101 +12,327 @@ C.PBST = [C.mod.PB, C.mod.ST]
 C.PRST = [C.mod.PR, C.mod.ST]
 C.sk_mod = [C.mod.GN, C.mod.HN]
 
-# snapshot of meta-class # Field
+# registry of meta-classes, i.e., snapshot of all the fields, methods, and classes
+# along with indices and versions regarding them
+# each thread has its own registry, hence demos can be processed concurrently
+# it has no reference to the other modules, so it can be pickled to workers
+class MetaRegistry(object):
+
+  def __init__(self):
+    # to assign unique id to an instance
+    self.fid = -1
+    # an array of all the instnaces whose id is equal to index being inserted
+    # i.e., Field.flds(fid).id == fid
+    self.flds = []
+    self.mid = -1
+    self.mtds = []
+    self.cid = -1
+    self.clss = []
+    # names of artificial classes added while rewriting, e.g., AuxObserver
+    self.artifacts = []
+
+    # indices for class_lookup, mapping keys to positions at clss
+    # since the first match in clss wins, only the smallest position is kept
+    self.by_name = {} # { name : pos } # e.g., Align
+    self.by_repr = {} # { sanitized full name : pos } # e.g., Demo_CancelAction (inner)
+    self.by_part = {} # { part of full name : pos } # e.g., Align of Alignment_Align (inner)
+    self.idx_dirty = True
+
+    # version of member declarations, e.g., to invalidate Method.vars
+    self.decls_ver = 0
+    # version of class hierarchy, e.g., to invalidate SampleIndex.mtd_logged
+    self.hier_ver = 0
+    # version of types of variables, fields, and methods
+    self.types_ver = 0
+
+    # generation of class names and nesting; cache entries of older ones are stale
+    self.gen = 0
+    # dependencies of cache entries being computed, innermost last
+    self.deps = [] # [ Deps ]
+    # cache entries that looked up names in vain: { name : { dep : holder } }
+    self.dangling = {}
+
+    # methods resolved along the class hierarchy, see clazz.find_mtds_by_*
+    self.resolved = {}
+
+    # statistics regarding class_lookup
+    self.n_lookups = 0
+    self.n_rebuilds = 0
+
+__local = threading.local()
+
+def registry():
+  reg = getattr(__local, "reg", None)
+  if not reg:
+    reg = MetaRegistry()
+    __local.reg = reg
+  return reg
+
+# what a cache entry depends on: classes whose hierarchy or members are read,
+# and names that were looked up in vain, e.g., a superclass not declared yet
+class Deps(object):
+
+  def __init__(self):
+    self.clss = {} # { id(cls) : cls }
+    self.names = set([])
+
+  def merge(self, other):
+    self.clss.update(other.clss)
+    self.names.update(other.names)
+
+# classes whose hierarchy or members are read by the cache entry being computed
+def depends(clss):
+  reg = registry()
+  if reg.deps:
+    d = reg.deps[-1].clss
+    for cls in clss: d[id(cls)] = cls
+
+# holder[key], computed by compute(), unless cached
+# it is dropped once any class it depends on is touched in the given aspects,
+# i.e., "_sup_deps", "_sub_deps" (see hierarchy_touched), or "_decl_deps" (see declarations_touched),
+# a name it looked up in vain is registered, or classes are renamed or reset
+def cached(holder, key, compute, aspects):
+  reg = registry()
+  entry = holder.get(key)
+  if entry and entry[0] == reg.gen:
+    if reg.deps: reg.deps[-1].merge(entry[2])
+    return entry[1]
+
+  deps = Deps()
+  reg.deps.append(deps)
+  try: val = compute()
+  finally: reg.deps.pop()
+  # the enclosing entry, if any, depends on the same ones
+  if reg.deps: reg.deps[-1].merge(deps)
+
+  dep = (id(holder), key)
+  for cls in deps.clss.itervalues():
+    for aspect in aspects: getattr(cls, aspect)[dep] = holder
+  for name in deps.names:
+    reg.dangling.setdefault(name, {})[dep] = holder
+  holder[key] = (reg.gen, val, deps)
+  return val
+
+# drop the cache entries that depend on something touched
+def __invalidate(deps):
+  for (_, key), holder in deps.iteritems(): holder.pop(key, None)
+  deps.clear()
+
+def declarations_version():
+  return registry().decls_ver
+
+# fields or methods (or their names) of the given class have changed
+def declarations_touched(cls=None):
+  registry().decls_ver += 1
+  if cls: __invalidate(cls._decl_deps)
+
+def __tracked(f):
+  def mutator(self, *args, **kwargs):
+    r = f(self, *args, **kwargs)
+    # not yet owned while being unpickled
+    declarations_touched(getattr(self, "_owner", None))
+    return r
+  return mutator
+
+# list of fields or methods of the given class that reports its mutations
+class MemberList(list):
+  def __init__(self, owner, items=[]):
+    list.__init__(self, items)
+    self._owner = owner
+
+for __m in ["append", "extend", "insert", "remove", "pop", "sort", "reverse", \
+    "__setitem__", "__delitem__", "__setslice__", "__delslice__", \
+    "__iadd__", "__imul__"]:
+  setattr(MemberList, __m, __tracked(getattr(list, __m)))
+
+def __hier_tracked(f):
+  def mutator(self, *args, **kwargs):
+    r = f(self, *args, **kwargs)
+    hierarchy_touched(getattr(self, "_owner", None), "_sub_deps")
+    return r
+  return mutator
 
-# to assign unique id to an instance
-__fid = -1
-# an array of all the instnaces whose id is equal to index being inserted
-# i.e., Field.flds(fid).id == fid
-__flds = []
+# list of classes, e.g., inner classes of the given class, that reports its mutations
+class HierarchyList(list):
+  def __init__(self, owner, items=[]):
+    list.__init__(self, items)
+    self._owner = owner
+
+for __m in ["append", "extend", "insert", "remove", "pop", "sort", "reverse", \
+    "__setitem__", "__delitem__", "__setslice__", "__delslice__", \
+    "__iadd__", "__imul__"]:
+  setattr(HierarchyList, __m, __hier_tracked(getattr(list, __m)))
+
+# types of variables, fields, or methods have changed
+def types_touched():
+  registry().types_ver += 1
+
+# version of everything that types of expressions depend on
+def types_version():
+  reg = registry()
+  return (reg.hier_ver, reg.decls_ver, reg.types_ver)
+
+def __typed(f):
+  def mutator(self, *args, **kwargs):
+    r = f(self, *args, **kwargs)
+    types_touched()
+    return r
+  return mutator
+
+# local variables of a method, along with their types, that reports mutations
+class LocalDict(dict): pass
+
+for __m in ["__setitem__", "__delitem__", "update", "pop", "popitem", \
+    "setdefault", "clear"]:
+  setattr(LocalDict, __m, __typed(getattr(dict, __m)))
+
+# snapshot of meta-class # Field
 
 def field_nonce():
-  global __fid
-  __fid = __fid + 1
-  return __fid
+  reg = registry()
+  reg.fid = reg.fid + 1
+  return reg.fid
 
 def fields():
-  global __flds
-  return __flds
+  return registry().flds
 
 def fields_reset(flds=[]):
-  global __fid, __flds
+  reg = registry()
   if flds:
-    __fid = len(flds)
-    __flds = flds
+    reg.fid = len(flds)
+    reg.flds = flds
   else:
-    __fid = -1
-    __flds = []
+    reg.fid = -1
+    reg.flds = []
 
 def register_field(fld):
-  global __flds
-  __flds.append(fld)
+  registry().flds.append(fld)
 
 # snapshot of meta-class # Method
 
-__mid = -1
-__mtds = []
-
 def method_nonce():
-  global __mid
-  __mid = __mid + 1
-  return __mid
+  reg = registry()
+  reg.mid = reg.mid + 1
+  return reg.mid
 
 def methods():
-  global __mtds
-  return __mtds
+  return registry().mtds
 
 def methods_reset(mtds=[]):
-  global __mid, __mtds
+  reg = registry()
   if mtds:
-    __mid = len(mtds)
-    __mtds = mtds
+    reg.mid = len(mtds)
+    reg.mtds = mtds
   else:
-    __mid = -1
-    __mtds = []
+    reg.mid = -1
+    reg.mtds = []
 
 def register_method(mtd):
-  global __mtds
-  __mtds.append(mtd)
+  registry().mtds.append(mtd)
 
 # snapshot of meta-class # Clazz
 
-__cid = -1
-__clss = []
-
 def class_nonce():
-  global __cid
-  __cid = __cid + 1
-  return __cid
+  reg = registry()
+  reg.cid = reg.cid + 1
+  return reg.cid
 
 def classes():
-  global __clss
-  return __clss
+  return registry().clss
 
 def classes_reset(clss=[]):
-  global __cid, __clss
+  reg = registry()
   if clss:
-    __cid = len(clss)
-    __clss = clss
+    reg.cid = len(clss)
+    reg.clss = clss
   else:
-    __cid = -1
-    __clss = []
+    reg.cid = -1
+    reg.clss = []
+  classes_touched()
 
 def register_class(cls):
-  global __clss
-  __clss.append(cls)
+  reg = registry()
+  reg.clss.append(cls)
+  if not reg.idx_dirty: __index_class(reg, len(reg.clss)-1, cls)
+  # a new class may resolve names that were dangling so far, but no others,
+  # since the first match in clss wins
+  names = [cls.name]
+  if cls.is_inner and cls.name is not None:
+    cls_r = repr(cls)
+    names.append(cls_r)
+    names.extend(cls_r.split('_'))
+  for name in names:
+    if name in reg.dangling: __invalidate(reg.dangling.pop(name))
+  reg.hier_ver += 1
+
+# snapshot of artificial classes, e.g., auxiliary classes added by rewriters
+
+def artifacts():
+  return registry().artifacts
+
+def artifacts_reset(cnames=[]):
+  registry().artifacts = cnames[:]
+
+def register_artifacts(cnames):
+  registry().artifacts.extend(cnames)
+
+# class names or nesting have changed, hence indices should be rebuilt
+# and so should be all the cache entries, as any lookup may differ
+def classes_touched():
+  reg = registry()
+  reg.idx_dirty = True
+  reg.gen += 1
+  reg.dangling = {}
+  reg.hier_ver += 1
+
+def hierarchy_version():
+  return registry().hier_ver
+
+# super relations ("_sup_deps") or sub relations and inner classes ("_sub_deps")
+# of the given class have changed
+def hierarchy_touched(cls=None, aspect="_sup_deps"):
+  registry().hier_ver += 1
+  if cls: __invalidate(getattr(cls, aspect))
+
+def __index_class(reg, pos, c):
+  reg.by_name.setdefault(c.name, pos)
+  if c.is_inner and c.name is not None:
+    cls_r = repr(c)
+    reg.by_repr.setdefault(cls_r, pos)
+    for part in cls_r.split('_'):
+      reg.by_part.setdefault(part, pos)
+
+def __rebuild_index(reg):
+  reg.by_name, reg.by_repr, reg.by_part = {}, {}, {}
+  for pos, c in enumerate(reg.clss): __index_class(reg, pos, c)
+  reg.idx_dirty = False
+  reg.n_rebuilds = reg.n_rebuilds + 1
+
+def lookup_stats():
+  reg = registry()
+  return { "lookups": reg.n_lookups, "rebuilds": reg.n_rebuilds }
+
+def lookup_stats_reset():
+  reg = registry()
+  reg.n_lookups = 0
+  reg.n_rebuilds = 0
 
 def class_lookup(cname):
+  reg = registry()
+  reg.n_lookups = reg.n_lookups + 1
+  if reg.idx_dirty: __rebuild_index(reg)
   _cname = util.sanitize_ty(unicode(cname))
-  global __clss
-  for c in __clss:
-    cls_r = repr(c)
-    # normal case
-    if c.name == cname: return c
-    if c.is_inner:
-      # full name of inner class, e.g., Demo$CancelAction
-      if _cname == cls_r: return c
-      # inner class w/o outer class name, e.g., Align
-      if cname in cls_r.split('_'): return c
+  # normal case
+  poss = [reg.by_name.get(cname)]
+  # full name of inner class, e.g., Demo$CancelAction
+  poss.append(reg.by_repr.get(_cname))
+  # inner class w/o outer class name, e.g., Align
+  poss.append(reg.by_part.get(cname))
+  poss = [ pos for pos in poss if pos is not None ]
+  if poss:
+    cls = reg.clss[min(poss)]
+    if reg.deps: reg.deps[-1].clss[id(cls)] = cls
+    return cls
+  # cache entries being computed depend on this name being undefined
+  if reg.deps: reg.deps[-1].names.update([cname, _cname])
   return None
-
@@ -14,7 +14,9 @@ import lib.visit as v
 from .. import util
 from ..anno import parse_anno
 
-from . import class_nonce, register_class, class_lookup
+from . import class_nonce, register_class, classes_touched, class_lookup
+from . import hierarchy_touched, MemberList, HierarchyList, declarations_touched
+from . import registry, cached, depends
 import expression as exp
 import statement as st
 import field
@@ -45,18 +47,34 @@ class Clazz(v.BaseNode):
     # implementing interfaces
     self._itfs = kwargs.get("itfs", []) # list_of(unicode)
     # fields
-    self._flds = kwargs.get("flds", []) # list_of(Field)
+    self._flds = MemberList(self, kwargs.get("flds", [])) # list_of(Field)
     # methods
-    self._mtds = kwargs.get("mtds", []) # list_of(Method)
+    self._mtds = MemberList(self, kwargs.get("mtds", [])) # list_of(Method)
     # inner classes
-    self._inners = kwargs.get("inners", []) # list_of(Clazz)
+    self._inners = HierarchyList(self, kwargs.get("inners", [])) # list_of(Clazz)
     # outer class
     self._outer = kwargs.get("outer", None)
     # client (or platform)
     self._client = kwargs.get("client", False)
+    # cached supertype closure, member indices, and transitive subclasses and inner classes
+    self._caches = {} # { name : (generation, value, Deps) }, see meta.cached
+    # cache entries, here or elsewhere, that depend on supertypes, subtypes (and inners),
+    # or members of this class: { dep : holder }
+    self._sup_deps = {}
+    self._sub_deps = {}
+    self._decl_deps = {}
+    # sanitized full name
+    self._repr = None
 
     register_class(self)
 
+  # cached closures and indices are stamped with generations of the registry
+  # where they were built, hence meaningless in other registries, e.g., a parent process
+  def __getstate__(self):
+    d = self.__dict__.copy()
+    for k in ["_caches", "_sup_deps", "_sub_deps", "_decl_deps"]: d[k] = {}
+    return d
+
   @property
   def id(self):
     return self._id
@@ -92,6 +110,7 @@ class Clazz(v.BaseNode):
   @mods.setter
   def mods(self, v):
     self._mods = v
+    declarations_touched(self)
 
   @property
   def is_private(self):
@@ -124,6 +143,8 @@ class Clazz(v.BaseNode):
   @name.setter
   def name(self, v):
     self._name = v
+    self.touch_repr()
+    classes_touched()
 
   @property
   def sup(self):
@@ -132,6 +153,7 @@ class Clazz(v.BaseNode):
   @sup.setter
   def sup(self, v):
     self._sup = v
+    hierarchy_touched(self)
 
   @property
   def subs(self):
@@ -140,6 +162,27 @@ class Clazz(v.BaseNode):
   @subs.setter
   def subs(self, v):
     self._subs = v
+    hierarchy_touched(self, "_sub_deps")
+
+  def add_sub(self, sub):
+    if sub in self._subs: return False
+    else:
+      self._subs.append(sub)
+      hierarchy_touched(self, "_sub_deps")
+      return True
+
+  # add the given subclasses at once, except for ones already there
+  def add_subs(self, subs):
+    reprs = set(map(repr, self._subs))
+    added = False
+    for sub in subs:
+      sub_r = repr(sub)
+      if sub_r in reprs: continue
+      reprs.add(sub_r)
+      self._subs.append(sub)
+      added = True
+    if added: hierarchy_touched(self, "_sub_deps")
+    return added
 
   @property
   def itfs(self):
@@ -147,7 +190,12 @@ class Clazz(v.BaseNode):
 
   @itfs.setter
   def itfs(self, v):
-    self_.itfs = v
+    self._itfs = v
+    hierarchy_touched(self)
+
+  def add_itf(self, itf):
+    self._itfs.append(itf)
+    hierarchy_touched(self)
 
   @property
   def sups(self):
@@ -176,7 +224,8 @@ class Clazz(v.BaseNode):
 
   @flds.setter
   def flds(self, v):
-    self._flds = v
+    self._flds = MemberList(self, v)
+    declarations_touched(self)
   
   def add_fld(self, fld):
     if fld in self._flds: return False
@@ -199,7 +248,8 @@ class Clazz(v.BaseNode):
 
   @mtds.setter
   def mtds(self, v):
-    self._mtds = v
+    self._mtds = MemberList(self, v)
+    declarations_touched(self)
   
   def add_mtd(self, mtd):
     if mtd in self._mtds: return False
@@ -221,7 +271,8 @@ class Clazz(v.BaseNode):
 
   @inners.setter
   def inners(self, v):
-    self._inners = v
+    self._inners = HierarchyList(self, v)
+    hierarchy_touched(self, "_sub_deps")
 
   @property
   def outer(self):
@@ -230,6 +281,8 @@ class Clazz(v.BaseNode):
   @outer.setter
   def outer(self, v):
     self._outer = v
+    self.touch_repr()
+    classes_touched()
 
   @property
   def is_inner(self):
@@ -264,10 +317,19 @@ class Clazz(v.BaseNode):
     full_name = u'.'.join(util.ffilter([self._pkg, cname]))
     return util.toJVM(full_name)
 
+  # cached until name or outer class is set
   def __repr__(self):
-    cname = self._name
-    if self._outer: cname = u'.'.join([self._outer.name, self._name])
-    return util.sanitize_ty(cname)
+    if self._repr is None:
+      cname = self._name
+      if self._outer: cname = u'.'.join([self._outer.name, self._name])
+      self._repr = util.sanitize_ty(cname)
+    return self._repr
+
+  # reprs of inner classes and methods depend on this class's name
+  def touch_repr(self):
+    self._repr = None
+    for mtd in self._mtds: mtd.touch_repr()
+    for inner in self._inners: inner.touch_repr()
 
   def __str__(self, s_printer=None):
     buf = cStringIO.StringIO()
@@ -297,26 +359,72 @@ class Clazz(v.BaseNode):
 
   def __eq__(self, other):
     # reflective: c == c
+    if self is other: return True
     return repr(self) == repr(other)
 
+  # transitive closure of supertypes: (names, reprs, p_id)
+  #   names: names of super classes/interfaces of this class and its ancestors
+  #   reprs: full names of (resolved) ancestors
+  #   p_id: the smallest index of primitives among this class and its ancestors
+  # cached until supertypes of this class or its ancestors are touched
+  def sup_closure(self):
+    return cached(self._caches, "sup_closure", self.__sup_closure, ["_sup_deps"])
+
+  # ancestors are recorded as dependencies when looked up
+  def __sup_closure(self):
+    depends([self])
+    names, reprs, p_ids = set([]), set([]), []
+    visited = set([id(self)])
+    worklist = [self]
+    while worklist:
+      cls = worklist.pop()
+      if cls.name in C.primitives: p_ids.append(C.primitives.index(cls.name))
+      for sname in cls.sups:
+        names.add(sname)
+        sup = class_lookup(sname)
+        if not sup: continue
+        reprs.add(repr(sup))
+        if id(sup) in visited: continue
+        visited.add(id(sup))
+        worklist.append(sup)
+
+    p_id = min(p_ids) if p_ids else None
+    return names, reprs, p_id
+
+  # all the subclasses, transitively, in order of breadth-first discovery
+  # cached until subclasses of this class or its descendants are touched; should not be mutated
+  def descendants(self):
+    return cached(self._caches, "descendants", self.__descendants, ["_sub_deps"])
+
+  def __descendants(self):
+    clss = util.flatten_classes(self._subs, "subs")
+    depends([self] + clss)
+    return clss
+
+  # all the inner classes, transitively, in order of breadth-first discovery
+  # cached until inner classes of this class or its inners are touched; should not be mutated
+  def all_inners(self):
+    return cached(self._caches, "all_inners", self.__all_inners, ["_sub_deps"])
+
+  def __all_inners(self):
+    clss = util.flatten_classes(self._inners, "inners")
+    depends([self] + clss)
+    return clss
+
   def __lt__(self, other):
     # topmost: c < Object
     if other.name in C.J.OBJ: return True 
+    names, reprs, p_id = self.sup_closure()
     # pre-defined, e.g., primitives
-    if self._name in C.primitives and other.name in C.primitives:
-      s_id = C.primitives.index(self._name)
+    if p_id is not None and other.name in C.primitives:
       o_id = C.primitives.index(other.name)
-      if s_id < o_id: return True
+      if p_id < o_id: return True
 
     # superclass: c (extends | implements) d
-    if self._sup and self._sup == other.name: return True
-    if other.name in self._itfs: return True
+    if other.name in names: return True
 
     # transitive: c < x and x <= d
-    def check_sup(sname):
-      sup = class_lookup(sname)
-      return sup and sup <= other
-    return util.exists(check_sup, util.ffilter([self._sup] + self._itfs))
+    return repr(other) in reprs
 
   def __le__(self, other):
     return self == other or self < other
@@ -395,6 +503,30 @@ class Clazz(v.BaseNode):
       return mod in mtd.mods
     return filter(mod_finder, self._mtds)
 
+  # members declared in this class, by name: (mtds, flds)
+  #   mtds: { mname : [Method] } in the order of declarations
+  #   flds: { fname : Field } the first declaration wins
+  # cached until member declarations of this class are touched
+  def members(self):
+    return cached(self._caches, "members", self.__members, ["_decl_deps"])
+
+  def __members(self):
+    depends([self])
+    mtds, flds = {}, {}
+    for mtd in self._mtds: mtds.setdefault(mtd.name, []).append(mtd)
+    for fld in self._flds: flds.setdefault(fld.name, fld)
+    return mtds, flds
+
+  # the first non-empty result of f along the superclass chain
+  def find_in_hierarchy(self, f, default=None):
+    cls = self
+    while cls:
+      res = f(cls)
+      if res: return res
+      if not cls.sup: break
+      cls = class_lookup(cls.sup)
+    return default
+
   @takes("Clazz", callable, optional(callable), optional(anything))
   def in_hierarchy(self, pred, calc=None, default=None):
     if pred(self):
@@ -411,10 +543,8 @@ class Clazz(v.BaseNode):
   @takes("Clazz", unicode)
   @returns(optional("Field"))
   def fld_by_name(self, fname):
-    def match(fld): return fld.name == fname
-    def finder(cls): return util.exists(match, cls.flds)
-    def getter(cls): return util.find(match, cls.flds)
-    return self.in_hierarchy(finder, getter)
+    def getter(cls): return cls.members()[1].get(fname)
+    return self.find_in_hierarchy(getter)
 
   # find the field by type
   @takes("Clazz", unicode)
@@ -429,10 +559,8 @@ class Clazz(v.BaseNode):
   @takes("Clazz", unicode)
   @returns(list_of("Method"))
   def mtd_by_name(self, mname):
-    def match(mtd): return mtd.name == mname
-    def finder(cls): return util.exists(match, cls.mtds)
-    def getter(cls): return filter(match, cls.mtds)
-    return self.in_hierarchy(finder, getter, [])
+    def getter(cls): return cls.members()[0].get(mname, [])[:]
+    return self.find_in_hierarchy(getter, [])
 
   # find the method by signature
   @takes("Clazz", unicode, list_of(unicode))
@@ -457,7 +585,7 @@ class Clazz(v.BaseNode):
           # aux type is allowed to be downcasted: a) formal parameter
           elif cls_f.is_aux:
             aux_subtyped = False
-            cls_f_subss = util.flatten_classes(cls_f.subs, "subs")
+            cls_f_subss = cls_f.descendants()
             for cls_s in cls_f_subss:
               aux_subtyped = aux_subtyped or cls_a <= cls_s
             if aux_subtyped: continue
@@ -465,7 +593,7 @@ class Clazz(v.BaseNode):
           # aux type is allowed to be downcasted: b) actual argument
           elif cls_a.is_aux:
             aux_subtyped = False
-            cls_a_subss = util.flatten_classes(cls_a.subs, "subs")
+            cls_a_subss = cls_a.descendants()
             for cls_s in cls_a_subss:
               aux_subtyped = aux_subtyped or cls_s <= cls_f
             if aux_subtyped: continue
@@ -475,12 +603,11 @@ class Clazz(v.BaseNode):
         # end of for loop; means, all parameters are compatible
         return True
 
-      return mtd.name == mname and len(mtd.param_typs) == len(sig) and \
+      return len(mtd.param_typs) == len(sig) and \
           subtype_cmp(mtd.param_typs, sig)
 
-    def finder(cls): return util.exists(match, cls.mtds)
-    def getter(cls): return util.find(match, cls.mtds)
-    return self.in_hierarchy(finder, getter)
+    def getter(cls): return next(ifilter(match, cls.members()[0].get(mname, [])), None)
+    return self.find_in_hierarchy(getter)
 
   @property
   def inits(self):
@@ -535,7 +662,10 @@ class Clazz(v.BaseNode):
         if len(args) <= len(_args): args = _args
     except (AttributeError, IndexError): pass
     f = exp.gen_E_id(tname)
-    args = map(exp.to_expression, args)
+    _args = exp.to_expressions(args)
+    # one by one, if malformed, so that well-formed ones are still passed
+    if _args is None: _args = map(exp.to_expression, args)
+    args = _args
     return exp.gen_E_new(exp.gen_E_call(f, args)), args
 
   # a wrapper of call_init, considering interface implementers
@@ -547,7 +677,7 @@ class Clazz(v.BaseNode):
     else:
       cls = class_lookup(tname)
       if cls and (cls.is_itf or cls.is_abstract): # try to find implementers
-        subss = util.flatten_classes(cls.subs, "subs")
+        subss = cls.descendants()
         init_e, args = None, []
         for impl in ifilterfalse(lambda c: c.is_itf or c.is_abstract, subss):
           _e, _args = Clazz.call_init(impl.name, params)
@@ -663,12 +793,21 @@ def __find_mtd(cname, f):
   return []
 
 
+# memoized method resolutions: { (cname, mname, sig) : [Method] }
+# valid until the hierarchy or member declarations of any class looked up
+# during the resolution are touched
+def __memo_find_mtd(key, f):
+  find = lambda: __find_mtd(key[0], f)
+  aspects = ["_sup_deps", "_sub_deps", "_decl_deps"]
+  return cached(registry().resolved, key, find, aspects)[:]
+
+
 # find the method by the given class name and method name
 @takes(unicode, unicode)
 @returns(list_of("Method"))
 def find_mtds_by_name(cname, mname):
   f = lambda cls: cls.mtd_by_name(mname)
-  return __find_mtd(cname, f)
+  return __memo_find_mtd((cname, mname, None), f)
 
 
 # find the method by the given class name, method name, and parameter types
@@ -676,7 +815,7 @@ def find_mtds_by_name(cname, mname):
 @returns(list_of("Method"))
 def find_mtds_by_sig(cname, mname, sig):
   f = lambda cls: util.ffilter([cls.mtd_by_sig(mname, sig)])
-  return __find_mtd(cname, f)
+  return __memo_find_mtd((cname, mname, tuple(sig)), f)
 
 
 # find the base class of the family in which the given class is involved
@@ -786,7 +925,7 @@ def parse_class(node):
     # (implements Id+)?
     elif n_ty == C.T.IMP:
       for itf in util.implode_id(_node).split(','):
-        cls.itfs.append(itf)
+        cls.add_itf(itf)
 
     elif n_ty == C.T.DECL:
       parse_decl(cls, _node)
@@ -5,8 +5,6 @@ from functools import partial
 
 import antlr3
 from antlr3.tree import CommonTree as AST
-from grammar.JavaLexer import JavaLexer as Lexer
-from grammar.JavaParser import JavaParser as Parser
 
 from lib.typecheck import *
 import lib.const as C
@@ -16,7 +14,7 @@ import lib.visit as v
 from .. import util
 from ..anno import parse_anno
 
-from . import class_lookup
+from . import class_lookup, types_version
 import clazz
 
 # e ::= anno | ?? | {| e* |} | c | id
@@ -29,13 +27,68 @@ C.bop = ["||", "&&", '|', '^', '&'] \
       + ["<<", ">>>", ">>"]
 C.rop = ["==", "!=", "<=", ">=", '<', '>']
 
+# same object, or lists of same objects, e.g., arguments visited but not replaced
+def same(x, y):
+  if x is y: return True
+  if type(x) is list and type(y) is list and len(x) == len(y):
+    return all([ a is b for a, b in zip(x, y) ])
+  return False
+
+
+# expressions directly in the given attribute value, e.g., le or a of CALL
+def subexps(x):
+  if isinstance(x, Expression): return [x]
+  if type(x) is list: return [ e for e in x if isinstance(e, Expression) ]
+  return []
+
+
 class Expression(v.BaseNode):
 
   def __init__(self, k, **kwargs):
     self._kind = k
+    # expressions that have this one as a subtree
+    self._parents = []
+    # types memoized per method context: (version, { mid : type })
+    self._typ_memo = (None, {})
     for key in kwargs:
       setattr(self, key, kwargs[key])
 
+  # replacing a subtree (or any other attribute) invalidates types memoized
+  # at this expression and the ones enclosing it, but nowhere else
+  def __setattr__(self, key, val):
+    if key[0] != '_':
+      old = self.__dict__.get(key)
+      if not same(old, val):
+        for e in subexps(old): e._parents.remove(self)
+        for e in subexps(val): e._parents.append(self)
+        self.__invalidate()
+    object.__setattr__(self, key, val)
+
+  def __invalidate(self):
+    seen = set([])
+    es = [self]
+    while es:
+      e = es.pop()
+      if id(e) in seen: continue
+      seen.add(id(e))
+      e._typ_memo = (None, {})
+      es.extend(e._parents)
+
+  # memoized types are valid only in the registry where they were inferred
+  # links to parents are rebuilt by them, so that a copied subtree is detached
+  def __getstate__(self):
+    d = self.__dict__.copy()
+    d["_typ_memo"] = (None, {})
+    d.pop("_parents", None)
+    return d
+
+  def __setstate__(self, d):
+    self.__dict__.update(d)
+    self.__dict__["_parents"] = []
+    for key, val in d.iteritems():
+      if key[0] == '_': continue
+      for e in subexps(val): e._parents.append(self)
+
   @property
   def kind(self):
     return self._kind
@@ -94,7 +147,19 @@ class Expression(v.BaseNode):
     return self.__str__()
 
   # retrieve the type of the Expression
+  # memoized per method context, until class hierarchy, member declarations,
+  # or types of variables and members are touched, or this subtree is replaced
   def typ(self, mtd):
+    ver = types_version()
+    _ver, memo = self._typ_memo
+    if _ver != ver:
+      memo = {}
+      self._typ_memo = (ver, memo)
+    key = mtd.id if mtd else None
+    if key not in memo: memo[key] = self.__typ(mtd)
+    return memo[key]
+
+  def __typ(self, mtd):
     curried = lambda e: e.typ(mtd)
     if self.kind == C.E.ANNO:
       anno = self.anno
@@ -476,13 +541,19 @@ def parse_e(node, cls=None):
 @takes(unicode)
 @returns(Expression)
 def to_expression(e):
-  s_stream = antlr3.StringStream(e)
-  lexer = Lexer(s_stream)
-  t_stream = antlr3.CommonTokenStream(lexer)
-  parser = Parser(t_stream)
   try:
-    ast = parser.expression()
-    return parse_e(ast.tree)
+    return parse_e(util.parse_snippet("expression", e))
+  except antlr3.RecognitionException:
+    traceback.print_stack()
+
+
+# parse and generate expressions at once
+# None if any of them is malformed, as to_expression does
+@takes(list_of(unicode))
+@returns(list_of(Expression))
+def to_expressions(es):
+  try:
+    return map(parse_e, util.parse_snippets("expression", es))
   except antlr3.RecognitionException:
     traceback.print_stack()
 
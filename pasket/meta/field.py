@@ -10,7 +10,7 @@ import lib.visit as v
 
 from .. import util
 
-from . import field_nonce, register_field
+from . import field_nonce, register_field, declarations_touched, types_touched
 import expression as exp
 import clazz
 
@@ -79,6 +79,7 @@ class Field(v.BaseNode):
   @typ.setter
   def typ(self, v):
     self._typ = v
+    types_touched()
 
   @property
   def name(self):
@@ -87,6 +88,7 @@ class Field(v.BaseNode):
   @name.setter
   def name(self, v):
     self._name = v
+    declarations_touched(self._clazz)
 
   @property
   def init(self):
@@ -10,7 +10,8 @@ import lib.visit as v
 
 from .. import util
 
-from . import method_nonce, register_method, class_lookup
+from . import method_nonce, register_method, class_lookup, declarations_touched
+from . import LocalDict, types_touched, registry
 import statement as st
 
 class Method(v.BaseNode):
@@ -27,15 +28,24 @@ class Method(v.BaseNode):
     self._params = kwargs.get("params", [])
     self._throws = kwargs.get("throws", [])
     # updated while parsing the body
-    self._locals = { \
+    self._locals = LocalDict({ \
         C.J.N: C.J.OBJ, \
         C.J.THIS: self._clazz.name, \
         C.J.SUP: self._clazz.sup \
-    }
+    })
     self._body = []
+    # sanitized full name, and variables along with versions of declarations/types
+    self._repr = None
+    self._vars = None
 
     register_method(self)
 
+  # variables are stamped with versions of the registry where they were merged
+  def __getstate__(self):
+    d = self.__dict__.copy()
+    d["_vars"] = None
+    return d
+
   @property
   def id(self):
     return self._id
@@ -47,6 +57,8 @@ class Method(v.BaseNode):
   @clazz.setter
   def clazz(self, v):
     self._clazz = v
+    self._repr = None
+    types_touched()
 
   @property
   def annos(self):
@@ -79,6 +91,7 @@ class Method(v.BaseNode):
   @typ.setter
   def typ(self, v):
     self._typ = v
+    types_touched()
 
   @property
   def name(self):
@@ -87,6 +100,8 @@ class Method(v.BaseNode):
   @name.setter
   def name(self, v):
     self._name = v
+    self._repr = None
+    declarations_touched(self._clazz)
 
   @property
   def is_init(self):
@@ -100,6 +115,13 @@ class Method(v.BaseNode):
   def params(self):
     return self._params
 
+  @params.setter
+  def params(self, v):
+    self._params = v
+    self._repr = None
+    declarations_touched(self._clazz)
+    types_touched()
+
   @property
   def param_typs(self):
     typs, _ = util.split(self._params)
@@ -121,16 +143,25 @@ class Method(v.BaseNode):
 
   @locals.setter
   def locals(self, v):
-    self._locals = v
+    self._locals = LocalDict(v)
+    types_touched()
 
+  # cached until member declarations or types of variables are touched
+  # callers should not mutate the result
   @property
   def vars(self):
+    reg = registry()
+    ver = (reg.decls_ver, reg.types_ver)
+    if self._vars and self._vars[0] == ver: return self._vars[1]
+
     d_flds = { fld.name: fld.typ for fld in self._clazz.flds }
     d_params = { nm: ty for (ty, nm) in self._params }
     # the order of merging is important
     # in this way, variables declared later overwrite fields and parameters
     d_merged = dict(d_flds, **d_params)
-    return dict(d_merged, **self._locals)
+    d_vars = dict(d_merged, **self._locals)
+    self._vars = (ver, d_vars)
+    return d_vars
 
   @property
   def body(self):
@@ -144,10 +175,16 @@ class Method(v.BaseNode):
   def has_return(self):
     return util.exists(op.attrgetter("has_return"), self.body)
 
+  # cached until name, class, or parameters are set, or the class is renamed
   def __repr__(self):
-    mname, cname = self._name, repr(self._clazz)
-    params = map(util.sanitize_ty, self.param_typs)
-    return u'_'.join([mname, cname] + params)
+    if self._repr is None:
+      mname, cname = self._name, repr(self._clazz)
+      params = map(util.sanitize_ty, self.param_typs)
+      self._repr = u'_'.join([mname, cname] + params)
+    return self._repr
+
+  def touch_repr(self):
+    self._repr = None
 
   def __str__(self, s_printer=str):
     buf = cStringIO.StringIO()
@@ -172,6 +209,7 @@ class Method(v.BaseNode):
     return buf.getvalue()
 
   def __eq__(self, other):
+    if self is other: return True
     return repr(self) == repr(other)
 
   def is_supercall(self, other):
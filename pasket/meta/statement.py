@@ -4,8 +4,6 @@ import operator as op
 
 import antlr3
 from antlr3.tree import CommonTree as AST
-from grammar.JavaLexer import JavaLexer as Lexer
-from grammar.JavaParser import JavaParser as Parser
 
 from lib.typecheck import *
 import lib.const as C
@@ -433,13 +431,9 @@ def parse(mtd, nodes):
 @takes("Method", unicode)
 @returns(list_of(Statement))
 def to_statements(mtd, s):
-  s_stream = antlr3.StringStream('{' + s + '}')
-  lexer = Lexer(s_stream)
-  t_stream = antlr3.CommonTokenStream(lexer)
-  parser = Parser(t_stream)
   try:
-    ast = parser.block()
-    return parse(mtd, ast.tree.getChildren())
+    tree = util.parse_snippet("block", '{' + s + '}')
+    return parse(mtd, tree.getChildren())
   except antlr3.RecognitionException:
     traceback.print_stack()
 
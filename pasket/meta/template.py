@@ -14,22 +14,44 @@ import lib.visit as v
 
 from .. import add_artifacts
 from .. import util
+from .. import profiling
 from ..anno import parse_anno
 
 from . import fields_reset, methods_reset, classes_reset, fields, methods, classes, class_lookup
+from . import registry, artifacts, artifacts_reset
 import statement as st
 from field import Field
 from method import Method
 from clazz import Clazz, parse_class, merge_layer, find_base
 
+# indices kept across Template.consist, so as to revisit only changed parts
+class ConsistIndex(object):
+
+  def __init__(self):
+    self.ids = None # ids of classes at the last run
+    self.ver = None # consist_version() at the end of the last run
+    self.types_ver = None
+    self.virtuals = [] # virtual declarations added so far
+    self.reprs = set([]) # reprs of declarations at the last run
+    self.stamps = {} # { id(cls) : (fields, # of them, methods, # of them) } visited
+
+
+# versions of everything that consistency depends on
+def consist_version():
+  reg = registry()
+  return (reg.hier_ver, reg.decls_ver, reg.types_ver)
+
+
 class Template(v.BaseNode):
 
+  @profiling.timed("Template")
   def __init__(self, ast):
     # reset ids and lists of meta-classes: Field, Method, and Clazz
 
     fields_reset()
     methods_reset()
     classes_reset()
+    artifacts_reset()
     self._frozen = False
 
     # class declarations in this template
@@ -43,6 +65,8 @@ class Template(v.BaseNode):
     self._acc_auxs = [] # [ Aux...1, ... ]
     # aux types for singleton pattern
     self._sng_auxs = [] # [ Aux...1, ... ]
+    # indices for re-consistency
+    self._consist_idx = ConsistIndex()
 
     # primitive classes
     cls_obj = Clazz(pkg=u"java.lang", name=C.J.OBJ)
@@ -125,17 +149,25 @@ class Template(v.BaseNode):
         self._classes.append(cls_e)
         add_artifacts([u"Event"])
 
+  # the index is stamped with versions of the registry where it was built
+  def __getstate__(self):
+    d = self.__dict__.copy()
+    d["_consist_idx"] = ConsistIndex()
+    return d
+
   # keep snapshots of instances of meta-classes
   def freeze(self):
     self._flds = fields()
     self._mtds = methods()
     self._clss = classes()
+    self._artifacts = artifacts()
 
   # restore snapshots of instances of meta-classes
   def unfreeze(self):
     fields_reset(self._flds)
     methods_reset(self._mtds)
     classes_reset(self._clss)
+    artifacts_reset(self._artifacts)
 
   @property
   def classes(self):
@@ -216,33 +248,54 @@ class Template(v.BaseNode):
   #   build class hierarchy
   #   discard interfaces without implementers
   #   discard methods that refer to undefined types
+  # types and classes are indexed, hence O(N + E) for N classes and E relations
+  # when called again, e.g., after rewriting, only changed parts are revisited
   def consist(self):
     clss = util.flatten_classes(self._classes, "inners")
+    idx = self._consist_idx
+    ids = frozenset(map(id, clss))
+    if idx.ver == consist_version() and idx.ids == ids: return
 
     # collect *all* types in the template
     # including inners as well as what appear at field/method declarations
     # (since we don't care about accessability, just flatten inner classes)
-  
+
     # for easier(?) membership test
     # { cls!r: Clazz(cname, ...), ... }
     decls = { repr(cls): cls for cls in clss }
+    # virtual declarations added so far
+    for cls in idx.virtuals: decls.setdefault(repr(cls), cls)
+
+    # names of top-level classes and (parts of) sanitized names of inner classes
+    tops, inners = set([]), set([])
+    def index(cls_r, cls):
+      if cls.is_inner:
+        inners.add(cls_r)
+        inners.update(cls_r.split('_'))
+      else: tops.add(cls_r)
+    for cls_r, cls in decls.iteritems(): index(cls_r, cls)
+
     def is_defined(tname):
-      _tname = util.sanitize_ty(tname)
-      for cls_r in decls.keys():
-        if decls[cls_r].is_inner:
-          if _tname == cls_r: return True
-          if _tname in cls_r.split('_'): return True
-        else:
-          if tname == cls_r: return True
-      return False
+      return util.sanitize_ty(tname) in inners or tname in tops
+
+    # virtual declarations of the last runs, to be reused when classes are revisited
+    # so as to add as many as a single run from scratch, e.g., for List<T> per occurrence
+    reusable = {} # { tname : [ Clazz ] }
+    for cls in idx.virtuals: reusable.setdefault(cls.name, []).append(cls)
 
     def add_decl(tname):
       if is_defined(tname): return
-      logging.debug("adding virtual declaration {}".format(tname))
-      cls = Clazz(name=tname)
-      # to avoid weird subtyping, e.g., int < Object
-      if tname in C.primitives: cls.sup = None
-      decls[repr(cls)] = cls
+      if reusable.get(tname):
+        cls = reusable[tname].pop(0)
+      else:
+        logging.debug("adding virtual declaration {}".format(tname))
+        cls = Clazz(name=tname)
+        # to avoid weird subtyping, e.g., int < Object
+        if tname in C.primitives: cls.sup = None
+        idx.virtuals.append(cls)
+      cls_r = repr(cls)
+      decls[cls_r] = cls
+      index(cls_r, cls)
       # add declarations in nested generics or arrays
       if util.is_collection(tname):
         map(add_decl, util.of_collection(tname)[1:])
@@ -250,23 +303,47 @@ class Template(v.BaseNode):
         add_decl(util.componentType(tname))
 
     # finding types that occur at field/method declarations
+    # only new classes or ones with new members, unless types have changed
+    # or some declarations have gone, hence some types may be undefined now
+    if idx.types_ver != registry().types_ver or not idx.reprs <= set(decls):
+      idx.stamps = {}
     for cls in clss:
+      stamp = (id(cls.flds), len(cls.flds), id(cls.mtds), len(cls.mtds))
+      if idx.stamps.get(id(cls)) == stamp: continue
       for fld in cls.flds:
         if not is_defined(fld.typ): add_decl(fld.typ)
       for mtd in cls.mtds:
         for (ty, nm) in mtd.params:
           if not is_defined(ty): add_decl(ty)
+      idx.stamps[id(cls)] = stamp
 
     # build class hierarchy: fill Clazz.subs
+    by_key = {} # { name or cls!r : [ pos ] }
+    for pos, sup in enumerate(clss):
+      by_key.setdefault(sup.name, []).append(pos)
+      sup_r = repr(sup)
+      if sup_r != sup.name: by_key.setdefault(sup_r, []).append(pos)
+
+    subs = {} # { pos of superclass : [ Clazz ] }
     for cls in clss:
       if not cls.sup and not cls.itfs: continue
       sups = map(util.sanitize_ty, cls.itfs)
       if cls.sup: sups.append(util.sanitize_ty(cls.sup))
       if not sups: continue
-      for sup in clss:
-        if sup == cls: continue
-        if sup.name in sups or repr(sup) in sups:
-          if cls not in sup.subs: sup.subs.append(cls)
+      cls_r = repr(cls)
+      poss = set([])
+      for sup in sups: poss.update(by_key.get(sup, []))
+      for pos in sorted(poss):
+        if repr(clss[pos]) == cls_r: continue
+        subs.setdefault(pos, []).append(cls)
+
+    for pos in sorted(subs.keys()):
+      clss[pos].add_subs(subs[pos])
+
+    idx.ids = ids
+    idx.reprs = set(decls)
+    idx.types_ver = registry().types_ver
+    idx.ver = consist_version()
 
     ## discard interfaces that have no implementers, without constants
     #for itf in ifilter(op.attrgetter("is_itf"), clss):
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+
+import cProfile
+import cStringIO
+import functools
+import json
+import os
+import pstats
+import re
+import resource
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+import lib.visit as v
+
+## phase-level instrumentation: wall time, CPU time, and peak RSS per phase,
+## along with Sketch statistics (printed at high verbosity) attributed to sketch files
+##
+## every demo has its own report, and so does the run as a whole (for merging),
+## summarized at result/phases.json
+##
+## with --profile, result/profile/demo.json as well
+##   demo:   demo name
+##   phases: [ { name, depth, calls, wall, cpu, cpu_children (s),
+##               rss, rss_children (peak so far, in KB) } ], in order of pipeline,
+##           i.e., parse, harness, rewrite, encode, solve, ctrl-flow, decode,
+##           where nested phases, e.g., toAST under parse, have higher depth
+##   sketch: [ { sk_dir, wall, cached, frontend/backend time, CEGIS iterations,
+##               backend stats, and DAG sizes per harness } ], per Sketch run in order
+##   files:  per sketch folder, per sketch file, size, # of holes, and harnesses declared there
+
+# Sketch options to print timing and DAG statistics
+sketch_opts = ["-V", "10"]
+
+# folder to keep reports (None: not profiling)
+_prof_dir = None
+
+def set_profile(path):
+  global _prof_dir
+  if path and not os.path.isdir(path): os.makedirs(path)
+  _prof_dir = path
+
+
+def enabled():
+  return _prof_dir is not None
+
+
+def report_path(demo):
+  return os.path.join(_prof_dir, demo + ".json")
+
+
+# folder to keep Python profiles (None: not profiling)
+_py_prof_dir = None
+
+# number of functions to summarize per profile
+py_top = 20
+
+def set_profile_python(path):
+  global _py_prof_dir
+  if path and not os.path.isdir(path): os.makedirs(path)
+  _py_prof_dir = path
+
+
+# profile the given step, e.g., a visitor, with cProfile, along with
+# the number of dispatches of visitors by node type
+# dumps demo_name.prof, to be read by pstats or other viewers,
+# and demo_name.txt, the top functions by cumulative time and the dispatches
+@contextmanager
+def profile_python(name):
+  if not _py_prof_dir:
+    yield
+    return
+
+  rpt = current()
+  if rpt: name = '_'.join([rpt.demo, name])
+  path = os.path.join(_py_prof_dir, name.replace(' ', '_'))
+  prof = cProfile.Profile()
+  v.count_dispatches(True)
+  prof.enable()
+  try: yield
+  finally:
+    prof.disable()
+    counts = v.dispatches()
+    v.count_dispatches(False)
+    prof.dump_stats(path + ".prof")
+
+    buf = cStringIO.StringIO()
+    stats = pstats.Stats(prof, stream=buf)
+    stats.sort_stats("cumulative").print_stats(py_top)
+    buf.write("dispatches (node type, exact or fallback):\n")
+    for (typ, how), n in sorted(counts.iteritems(), key=lambda (k, n): -n):
+      buf.write("{:>10} {} ({})\n".format(n, typ, how))
+    with open(path + ".txt", 'w') as f: f.write(buf.getvalue())
+    logging.info("profile of {}: {:.3f}s, {} dispatch(es) ({} fallback), {}.prof".format( \
+        name, stats.total_tt, sum(counts.values()), \
+        sum([ n for (_, how), n in counts.iteritems() if how == "fallback" ]), path))
+    buf.close()
+
+
+# (CPU time of this process, of its terminated children, peak RSS of each)
+def usage():
+  t = os.times()
+  self_ru = resource.getrusage(resource.RUSAGE_SELF)
+  child_ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+  return (t[0] + t[1], t[2] + t[3], self_ru.ru_maxrss, child_ru.ru_maxrss)
+
+
+class Report(object):
+
+  def __init__(self, demo):
+    self._demo = demo
+    self._phases = [] # [ { name, depth, calls, wall, ... } ]
+    self._depth = 0
+    self._sketch = [] # [ { sk_dir, wall, cached, ... } ], per Sketch run
+    self._files = {} # { sk_dir : { fname : { bytes, ... } } }
+
+  @property
+  def demo(self):
+    return self._demo
+
+  @property
+  def phases(self):
+    return self._phases
+
+  # resource usages of the given phase; the same phase may run several times
+  @contextmanager
+  def phase(self, name):
+    start, (cpu, cpu_ch, _, _) = time.time(), usage()
+    depth = self._depth
+    self.entry(name, depth) # so that phases are listed in order of beginning
+    self._depth = depth + 1
+    try: yield
+    finally:
+      self._depth = depth
+      _cpu, _cpu_ch, rss, rss_ch = usage()
+      self.add_phase(name, time.time() - start, \
+          _cpu - cpu, _cpu_ch - cpu_ch, rss, rss_ch, depth)
+
+  def entry(self, name, depth=0):
+    for ph in self._phases:
+      if ph["name"] == name: return ph
+    ph = { "name": name, "depth": depth, "calls": 0, \
+        "wall": 0, "cpu": 0, "cpu_children": 0, "rss": 0, "rss_children": 0 }
+    self._phases.append(ph)
+    return ph
+
+  def add_phase(self, name, wall, cpu=0, cpu_children=0, rss=0, rss_children=0, \
+      depth=0, calls=1):
+    ph = self.entry(name, depth)
+    ph["calls"] += calls
+    ph["wall"] += wall
+    ph["cpu"] += cpu
+    ph["cpu_children"] += cpu_children
+    ph["rss"] = max(ph["rss"], rss)
+    ph["rss_children"] = max(ph["rss_children"], rss_children)
+
+  # statistics of a single Sketch run on the given sketch folder, appended to the others
+  # a cached run reuses a previous output, hence spends no time unless the output tells
+  def add_sketch(self, sk_dir, output_path, wall, cached=False):
+    files = self._files[sk_dir] = sk_files(sk_dir)
+    stats = parse_output(output_path)
+    stats["sk_dir"] = sk_dir
+    stats["wall"] = wall
+    stats["cached"] = cached
+    # attribute DAG sizes to the files where harnesses are declared
+    harnesses = {}
+    for fname, info in files.iteritems():
+      for h in info["harnesses"]: harnesses[h] = { "file": fname }
+    for name, nodes in stats.pop("dags").iteritems():
+      h = to_harness(name, harnesses.keys())
+      if not h: continue
+      harnesses[h]["dag_nodes"] = max(nodes, harnesses[h].get("dag_nodes", 0))
+    stats["harnesses"] = harnesses
+    # the rest of total time, except for backend, is due to the frontend
+    if stats["total_ms"] is None: stats["total_ms"] = wall * 1000
+    total, be = stats["total_ms"], stats["backend_ms"]
+    if be is not None:
+      stats["frontend_ms"] = max(0, total - be)
+    self._sketch.append(stats)
+
+  def to_dict(self):
+    return { \
+      "demo": self._demo, \
+      "phases": self._phases, \
+      "sketch": self._sketch, \
+      "files": self._files }
+
+  def save(self, path):
+    tmp = "{}.{}".format(path, os.getpid())
+    with open(tmp, 'w') as f:
+      json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+    os.rename(tmp, path) # atomic, in case of concurrent runs
+
+  @staticmethod
+  def load(path):
+    with open(path, 'r') as f:
+      d = json.load(f)
+    rpt = Report(d["demo"])
+    rpt._phases = d["phases"]
+    rpt._sketch = d["sketch"]
+    rpt._files = d["files"]
+    return rpt
+
+  def __str__(self):
+    buf = [ "profile of {}:".format(self._demo) ]
+    buf.extend(self.rows())
+    ms = lambda t: "-" if t is None else "{:.0f}".format(t)
+    for s in self._sketch:
+      buf.append("{:>12} {}: {} ms (frontend: {}, backend: {}), {} iteration(s){}".format( \
+          "sketch", os.path.basename(s["sk_dir"]), ms(s["total_ms"]), \
+          ms(s["frontend_ms"]), ms(s["backend_ms"]), s["iterations"], \
+          " (cached)" if s["cached"] else ""))
+      dags = [ (h["dag_nodes"], n) for n, h in s["harnesses"].iteritems() if "dag_nodes" in h ]
+      for nodes, n in sorted(dags, reverse=True)[:5]:
+        buf.append("{:>12} {} nodes at {}".format("", nodes, n))
+    return '\n'.join(buf)
+
+  # rows of the summary table, one per phase, indented by depth
+  def rows(self):
+    rows = []
+    for ph in self._phases:
+      name = "  " * ph["depth"] + ph["name"]
+      rows.append("{:<28} {:>6} {:>9.3f}s {:>9.3f}s {:>9.3f}s {:>9} {:>9}".format( \
+          name, ph["calls"], ph["wall"], ph["cpu"], ph["cpu_children"], \
+          ph["rss"] / 1024, ph["rss_children"] / 1024))
+    return rows
+
+
+# reports of demos processed in this thread (or shipped back from workers),
+# and the one being recorded; per thread, so demos can be profiled concurrently
+_local = threading.local()
+
+def __state():
+  st = _local
+  if not hasattr(st, "reports"):
+    st.reports = []
+    st.current = None
+  return st
+
+
+def begin(demo):
+  st = __state()
+  st.current = Report(demo)
+  st.reports.append(st.current)
+  return st.current
+
+
+def current():
+  return __state().current
+
+
+def add_report(rpt):
+  __state().reports.append(rpt)
+
+
+def reports():
+  return __state().reports
+
+
+# record the given phase at the current report, if any
+@contextmanager
+def phase(name):
+  rpt = current()
+  if not rpt:
+    yield
+  else:
+    with rpt.phase(name): yield
+
+
+# decorator version of phase
+def timed(name):
+  def decorator(f):
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+      with phase(name): return f(*args, **kwargs)
+    return wrapper
+  return decorator
+
+
+# summary table of all the reports
+def summary():
+  buf = [ "{:<28} {:>6} {:>10} {:>10} {:>10} {:>9} {:>9}".format( \
+      "phase", "calls", "wall", "cpu", "cpu(sub)", "rss(MB)", "sub(MB)") ]
+  for rpt in reports():
+    buf.append(rpt.demo)
+    buf.extend([ "  " + row for row in rpt.rows() ])
+  return '\n'.join(buf)
+
+
+def save_summary(path):
+  d = { "time": time.time(), "reports": [ rpt.to_dict() for rpt in reports() ] }
+  tmp = "{}.{}".format(path, os.getpid())
+  with open(tmp, 'w') as f:
+    json.dump(d, f, indent=2, sort_keys=True)
+  os.rename(tmp, path) # atomic, in case of concurrent runs
+
+
+# declarations of harnesses, e.g., harness void sample_x () {
+regex_harness = re.compile(r"harness\s+void\s+(\w+)\s*\(")
+
+# size, # of holes, and harnesses declared, per sketch file
+def sk_files(sk_dir):
+  files = {}
+  for fname in sorted(os.listdir(sk_dir)):
+    if not fname.endswith(".sk"): continue
+    with open(os.path.join(sk_dir, fname), 'r') as f:
+      content = f.read()
+    files[fname] = { \
+      "bytes": len(content), \
+      "lines": content.count('\n'), \
+      "holes": content.count("??") + content.count("{|"), \
+      "harnesses": regex_harness.findall(content) }
+  return files
+
+
+# the frontend renames harnesses, e.g., sample_x -> sample_x__Wrapper
+def to_harness(name, harnesses):
+  cands = filter(lambda h: name.startswith(h), harnesses)
+  if not cands: return None
+  return max(cands, key=len)
+
+
+_num = r"([+-]?\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)"
+
+# frontend, e.g., Total time = 1234
+regex_ttime = re.compile(r"Total time = " + _num)
+# backend, e.g., Total elapsed time (ms):  1234.5
+regex_etime = re.compile(r"Total elapsed time \(ms\):\s*" + _num)
+# backend, per CEGIS iteration, e.g., FIND TIME 12 CHECK TIME 3 TOTAL TIME 15
+regex_iter = re.compile(r"FIND TIME " + _num + r" CHECK TIME " + _num)
+# backend, e.g., sample_x__Wrapper::SKETCH nodes = 1234
+regex_dag = re.compile(r"(\w+)::SKETCH nodes = (\d+)")
+# solver stats, e.g., elapsed time (s) ----------------> 1.23
+regex_stat = re.compile(r"^\s*(\w[^>]*?)\s*-{3,}>\s*(\S+)\s*$")
+
+# timing and DAG-size statistics at the given Sketch output
+# only the first run counts, since control-flows may be appended afterwards
+def parse_output(output_path):
+  stats = { \
+    "total_ms": None, "frontend_ms": None, "backend_ms": None, \
+    "iterations": 0, "find_ms": 0, "check_ms": 0, \
+    "backend": {}, "dags": {} }
+  if not os.path.isfile(output_path): return stats
+
+  with open(output_path, 'r') as f:
+    for line in f:
+      m = regex_ttime.search(line)
+      if m:
+        if stats["total_ms"] is None: stats["total_ms"] = float(m.group(1))
+        continue
+      m = regex_etime.search(line)
+      if m:
+        if stats["backend_ms"] is None: stats["backend_ms"] = float(m.group(1))
+        continue
+      m = regex_iter.search(line)
+      if m:
+        stats["iterations"] += 1
+        stats["find_ms"] += float(m.group(1))
+        stats["check_ms"] += float(m.group(2))
+        continue
+      for name, nodes in regex_dag.findall(line):
+        stats["dags"][name] = max(int(nodes), stats["dags"].get(name, 0))
+      m = regex_stat.match(line)
+      if m: stats["backend"].setdefault(m.group(1), m.group(2))
+
+  return stats
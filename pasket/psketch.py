@@ -1,13 +1,13 @@
 #!/usr/bin/env python
 
-import multiprocessing
 import os
 import logging
 import logging.config
 import shutil
 import subprocess
 import sys
-import time
+
+import scheduler
 
 def find_output_path(argv):
   for i, arg in enumerate(argv):
@@ -22,13 +22,10 @@ def repl_output_path(argv, path):
   return _argv
 
 
-def run(cmd, argv, trial=-1):
-  running = "cegis running..."
-  if trial >= 0: running = running + " ({})".format(trial+1)
-
+def run(cmd, argv):
   output_path = find_output_path(argv)
   try:
-    logging.info(running)
+    logging.info("cegis running...")
     subprocess.check_call([cmd] + argv)
     logging.info("cegis done: {}".format(output_path))
     return (output_path, True)
@@ -37,57 +34,37 @@ def run(cmd, argv, trial=-1):
     return (output_path, False)
 
 
-def p_run(cmd, argv):
+# n_trials trials in total, n_jobs at once; see scheduler.default_*
+def p_run(cmd, argv, n_jobs=None, n_trials=None):
   logging.debug("{} {}".format(cmd, ' '.join(argv)))
   output_path = find_output_path(argv)
 
-  n_cpu = multiprocessing.cpu_count()
-  pool = multiprocessing.Pool(max(1, int(n_cpu * 0.75)))
+  if not n_jobs: n_jobs = scheduler.default_jobs()
+  if not n_trials: n_trials = scheduler.default_trials(n_jobs)
+  trials = []
+  for i in xrange(n_trials):
+    _argv = repl_output_path(argv, output_path + str(i))
+    trials.append(scheduler.Trial(i, [cmd] + _argv))
 
-  def found( (fname, r) ):
-    if r: # found, copy that output file
-      shutil.copyfile(fname, output_path)
-      pool.close()
-      pool.terminate() # other running processes will become zombies here
-
-  trials = n_cpu * 32
-  results = []
-  temps = []
+  logging.info("cegis running... ({} trials, {} at once)".format(len(trials), n_jobs))
+  found = None
   try:
-    for i in xrange(trials):
-      _output_path = output_path + str(i)
-      temps.append(_output_path)
-      _argv = repl_output_path(argv, _output_path)
-      r = pool.apply_async(run, (cmd, _argv, i), callback=found)
-      results.append(r)
-      time.sleep(1)
-    pool.close()
+    found = scheduler.run(trials, n_jobs)
   except KeyboardInterrupt:
-    pool.close()
-    pool.terminate()
-  except AssertionError: # apply_async is called after pool was terminated
-    pass
-  finally:
-    pool.join()
-
-  # clean up temporary files, while merging synthesis result
-  res = False
-  logging.debug("# of processes: {}".format(len(results)))
-  for i, fname in enumerate(temps):
-    try:
-      _fname, r = results[i].get(1) # very short timeout to kill zombies
-      res = res or r
-      assert fname == _fname
-    except IndexError:
-      pass # in case where temps.append happens but the loop finishes just before pool.apply_async
-    except multiprocessing.TimeoutError: # zombie case
-      pass
-    finally:
-      if os.path.exists(fname):
-        os.remove(fname)
-        logging.debug("deleting {}".format(fname))
-
-  return (output_path, res)
+    logging.error("interrupted")
+
+  if found: # found, copy that output file
+    shutil.copyfile(find_output_path(found.cmd[1:]), output_path)
+    logging.info("cegis done: {}".format(output_path))
+
+  # clean up temporary files
+  for trial in trials:
+    fname = find_output_path(trial.cmd[1:])
+    if os.path.exists(fname):
+      os.remove(fname)
+      logging.debug("deleting {}".format(fname))
+
+  return (output_path, found is not None)
 
 
 if __name__ == "__main__":
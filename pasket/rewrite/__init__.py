@@ -1,9 +1,11 @@
 import logging
+import time
 
 from lib.typecheck import *
 import lib.const as C
 
 from .. import util
+from .. import profiling
 
 from accessor_adhoc import AccessorAdHoc
 from accessor_uni import AccessorUni
@@ -19,6 +21,8 @@ from semantic_checker import SemanticChecker
 @takes(str, list_of("Sample"), "Template", list_of(str))
 @returns(nothing)
 def visit(cmd, smpls, tmpl, patterns):
+  start = time.time()
+  util.snippet_stats_reset()
 
   ## non-trivial, framework-specific rewriting
   if cmd == "android":
@@ -30,7 +34,10 @@ def visit(cmd, smpls, tmpl, patterns):
     _visitors = []
     _visitors.append(System())
     _visitors.append(View())
-    map(lambda vis: tmpl.accept(vis), _visitors)
+    for vis in _visitors:
+      name = "rewrite " + vis.__class__.__name__
+      with profiling.phase(name), profiling.profile_python(name):
+        tmpl.accept(vis)
 
   p2v = {}
 
@@ -94,10 +101,21 @@ def visit(cmd, smpls, tmpl, patterns):
 
   for p in patterns:
     logging.info("rewriting {} pattern".format(p))
-    tmpl.accept(p2v[p])
+    name = "rewrite " + p
+    with profiling.phase(name), profiling.profile_python(name):
+      tmpl.accept(p2v[p])
 
   # final semantic checking
   logging.info("semantics checking")
   chker = SemanticChecker(cmd)
-  tmpl.accept(chker)
+  name = "rewrite semantics"
+  with profiling.phase(name), profiling.profile_python(name):
+    tmpl.accept(chker)
+
+  # how much of rewriting is spent on parsing generated code snippets
+  elapsed = time.time() - start
+  stats = util.snippet_stats()
+  logging.info("rewriting done: {:.2f}s, snippet parsing {:.2f}s ({:.1f}%)".format( \
+      elapsed, stats["time"], 100 * stats["time"] / max(elapsed, 1e-6)))
+  logging.debug("snippet(s): {snippets} (parsed: {parsed})".format(**stats))
 
@@ -301,7 +301,7 @@ class Observer(object):
     # if it's an interface with implementers
     if cls.is_itf and cls.subs:
       # collect all sub-classes
-      subss = util.flatten_classes(cls.subs, "subs")
+      subss = cls.descendants()
       # filter out sub-interfaces (e.g., Action < ActionListener)
       subss, _ = util.partition(lambda c: c.is_class, subss)
       # then collect actual methods from those sub-classes
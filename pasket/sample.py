@@ -7,26 +7,63 @@ from itertools import chain
 import ast
 import string
 import sys
+import threading
 import logging
 
 from lib.typecheck import *
 import lib.const as C
 
 import util
+import btrace
+import profiling
+from meta import hierarchy_version
+
+# share identical names, e.g., class and method names, amongst log records
+# at the given table, which lives as long as the parsing of a single sample
+# (built-in intern() is not applicable to unicode)
+def share(strs, s):
+  if strs is None: return s
+  return strs.setdefault(s, s)
+
+
+# (>|<) pkg...cls.mtd(val1, val2, ...)
+call_regex = re.compile(r"(>|<) (.*)\((.*)\)")
+# sort(val1, val2, ...)
+evt_regex = re.compile(r"(.*)\((.*)\)")
+# assume runtime instances are of the form: @Object(typ=..., idx=...)
+obj_regex = re.compile(r"@Object\(typ=(.+), idx=\d+\)")
+
+
+# split comma-separated values, while removing empty strings
+def split_vals(vals):
+  return [ v.strip() for v in vals.split(',') if v.strip() ]
+
 
 class CallBase(object):
 
+  __slots__ = ("_depth", "_pkg", "_cls", "_mtd", "_vals")
+
   # (>|<) pkg...cls.mtd(val1, val2, ...)
-  def __init__(self, line, depth=0):
+  # names are shared at the given table, if any
+  def __init__(self, line, depth=0, strs=None):
     self._depth = depth
-    m = re.match(r"(>|<) (.*)\((.*)\)", line)
+    m = call_regex.match(line)
     if m: # m.group(1) = '>' or '<'
-      self._pkg, self._cls, self._mtd = util.explode_mname(m.group(2))
-      vals = map(op.methodcaller("strip"), m.group(3).split(','))
-      self._vals = util.ffilter(vals) # to remove empty strings
+      pkg, cls, mtd = util.explode_mname(m.group(2))
+      self._pkg, self._cls, self._mtd = share(strs, pkg), share(strs, cls), share(strs, mtd)
+      self._vals = split_vals(m.group(3))
     else:
       raise Exception("wrong call sequences", line)
 
+  # w/o parsing, e.g., from a binary trace, whose string table already shares names
+  @classmethod
+  def of(klass, depth, pkg, cls, mtd, vals):
+    log = klass.__new__(klass)
+    log._depth = depth
+    log._pkg, log._cls, log._mtd = pkg, cls, mtd
+    log._vals = vals
+    return log
+
   def __str__(self):
     mid = []
     if self._pkg: mid.append(self._pkg)
@@ -64,27 +101,34 @@ class CallBase(object):
 
 # >
 class CallEnt(CallBase):
+  __slots__ = ()
+
   def __str__(self):
     return self.indent + "> " + super(CallEnt, self).__str__()
 
 
 # <
 class CallExt(CallBase):
+  __slots__ = ()
+
   def __str__(self):
     return self.indent + "< " + super(CallExt, self).__str__()
 
 
 class Evt(object):
 
+  __slots__ = ("_kind", "_vals", "_sources")
+
   # sort(val1, val2, ...)
+  # kinds are shared at the given table (strs), if any
   def __init__(self, **kwargs):
+    self._sources = None
     if "line" in kwargs.keys():
       line = kwargs["line"]
-      m = re.match(r"(.*)\((.*)\)", line)
+      m = evt_regex.match(line)
       if m:
-        self._kind = m.group(1)
-        vals = map(op.methodcaller("strip"), m.group(2).split(','))
-        self._vals = filter(None, vals) # to remove empty strings
+        self._kind = share(kwargs.get("strs"), m.group(1))
+        self._vals = split_vals(m.group(2))
       else:
         raise Exception("wrong environmental changes", line)
     else:
@@ -105,55 +149,37 @@ class Evt(object):
   @vals.setter
   def vals(self, v):
     self._vals = v
+    self._sources = None
 
   @property
   def sources(self):
-    # assume runtime instances are of the form: @Object(typ=..., idx=...)
-    def obj_finder(val):
-      m = re.match(r"@Object\(typ=(.+), idx=\d+\)", val)
-      if m: return m.group(1)
-      else: return None
-    return util.rm_dup(util.rm_none(map(obj_finder, self._vals)))
+    if self._sources is None:
+      def obj_finder(val):
+        m = obj_regex.match(val)
+        if m: return m.group(1)
+        else: return None
+      self._sources = util.rm_dup(util.rm_none(map(obj_finder, self._vals)))
+    return self._sources
 
 
 class Sample(object):
 
+  @profiling.timed("Sample")
   def __init__(self, fname, is_event):
     self._name, _ = os.path.splitext(os.path.basename(fname))
     self._logs = []  # list of CallEnt, CallExt, or Evt
     self._decls = {} # { cls1: (mtd1, mtd2, ...), ... }
     self._objs = {} # { cname0: ( hsh0, ... ), cname1: ( hsh1, ... ), ... }
     self._num_objs = 0
-
-    with open(fname) as f:
-      logging.debug("reading sample: " + os.path.normpath(f.name))
-      depth = 0
-      for line in f.readlines():
-        line = unicode(line.strip())
-        try:
-          if line[0] == '>':
-            log = CallEnt(line, depth)
-            depth = depth + 1
-          elif line[0] == '<':
-            depth = depth - 1
-            log = CallExt(line, depth)
-          elif line[0] in string.ascii_letters:
-            log = Evt(line=line)
-          else: continue # comments or something
-        except IndexError: continue # empty line
-
-        if line[0] == '>':
-          if log.is_init and is_event(log.mtd):
-            log = Evt(_kind=log.mtd, _vals=log.vals)
-        elif line[0] == '<':
-          if log.is_init and is_event(log.mtd): log = None
-
-        if isinstance(log, CallBase):
-          util.mk_or_append(self._decls, log.cls, log.mtd)
-
-        if log: self._logs.append(log)
+    # views over logs, computed on demand
+    self._IOs = None
+    self._evts = None
+    self._evt_kinds = None
+    self._evt_sources = None
+    self._found = {} # { (what, cond's module, code, defaults) : [...] }
 
     # indexing object appearances
+    idxs = {} # { cname0: { hsh0: @Object(typ=cname0, idx=0), ... }, ... }
     def wrap_obj(val):
       if '@' not in val: return val
       typ_w_pkg, hsh = val.split('@')
@@ -163,19 +189,70 @@ class Sample(object):
       if typ not in self._decls:
         self._decls[typ] = []
 
-      if typ in self._objs:
-        if hsh in self._objs[typ]:
-          idx = self._objs[typ].index(hsh)
-        else: # first appearance of this hash
-          idx = len(self._objs[typ])
-          self._objs[typ].append(hsh)
-      else: # first obj of this typ
-        idx = 0
-        self._objs[typ] = [hsh]
-      return u"@Object(typ={}, idx={})".format(typ, idx)
+      if typ not in idxs: # first obj of this typ
+        idxs[typ] = {}
+        self._objs[typ] = []
+      if hsh not in idxs[typ]: # first appearance of this hash
+        idx = len(self._objs[typ])
+        self._objs[typ].append(hsh)
+        # shared by all the appearances of this object
+        idxs[typ][hsh] = u"@Object(typ={}, idx={})".format(typ, idx)
+      return idxs[typ][hsh]
+
+    def add_log(log, wrap):
+      if isinstance(log, CallBase):
+        util.mk_or_append(self._decls, log.cls, log.mtd)
+      log.vals = map(wrap, log.vals)
+      self._logs.append(log)
+
+    if btrace.is_btrace(fname):
+      with btrace.Reader(fname) as r:
+        logging.debug("reading sample: " + os.path.normpath(fname))
+        strs = r.strs
+        # objects are wrapped once, in order of their first appearances
+        wrapped = {} # { obj id : @Object(...) }
+        def wrap_val(i):
+          if not i & btrace.OBJ: return strs[i]
+          i = i & ~btrace.OBJ
+          if i not in wrapped:
+            typ, hsh = r.objs[i]
+            wrapped[i] = wrap_obj(strs[typ] + '@' + strs[hsh])
+          return wrapped[i]
+
+        for kind, depth, pkg, cls, mtd, vals in r.records():
+          if kind == btrace.EVT:
+            add_log(Evt(_kind=mtd, _vals=vals), wrap_val)
+            continue
+          is_evt = cls == mtd and is_event(mtd)
+          if kind == btrace.EXT and is_evt: continue
+          if is_evt: log = Evt(_kind=mtd, _vals=vals)
+          elif kind == btrace.ENT: log = CallEnt.of(depth, pkg, cls, mtd, vals)
+          else: log = CallExt.of(depth, pkg, cls, mtd, vals)
+          add_log(log, wrap_val)
 
-    for log in self._logs:
-      log.vals = map(wrap_obj, log.vals)
+    else:
+      # single pass, without holding the whole file
+      with open(fname) as f:
+        logging.debug("reading sample: " + os.path.normpath(f.name))
+        strs = {} # names shared amongst the records of this sample
+        depth = 0
+        for line in f:
+          line = unicode(line.strip())
+          if not line: continue # empty line
+          if line[0] == '>':
+            log = CallEnt(line, depth, strs)
+            depth = depth + 1
+            if log.is_init and is_event(log.mtd):
+              log = Evt(_kind=log.mtd, _vals=log.vals)
+          elif line[0] == '<':
+            depth = depth - 1
+            log = CallExt(line, depth, strs)
+            if log.is_init and is_event(log.mtd): continue
+          elif line[0] in string.ascii_letters:
+            log = Evt(line=line, strs=strs)
+          else: continue # comments or something
+
+          add_log(log, wrap_obj)
 
     self._num_objs = reduce(lambda acc, hshs: acc + len(hshs), self._objs.values(), 0)
 
@@ -204,30 +281,67 @@ class Sample(object):
 
   @property
   def IOs(self):
-    ios, _ = util.partition(lambda s: isinstance(s, CallBase), self._logs)
-    return ios
+    if self._IOs is None:
+      self._IOs = [ log for log in self._logs if isinstance(log, CallBase) ]
+    return self._IOs
 
   @property
   def evts(self):
-    _, evts = util.partition(lambda s: isinstance(s, CallBase), self._logs)
-    return evts
+    if self._evts is None:
+      self._evts = [ log for log in self._logs if not isinstance(log, CallBase) ]
+    return self._evts
 
   @property
   def evt_kinds(self):
-    kinds = map(op.attrgetter("kind"), self.evts)
-    return util.rm_dup(kinds)
+    if self._evt_kinds is None:
+      kinds = map(op.attrgetter("kind"), self.evts)
+      self._evt_kinds = util.rm_dup(kinds)
+    return self._evt_kinds
 
   @property
   def evt_sources(self):
-    srcss = map(op.attrgetter("sources"), self.evts)
-    return util.rm_dup(util.flatten(srcss))
-
+    if self._evt_sources is None:
+      srcss = map(op.attrgetter("sources"), self.evts)
+      self._evt_sources = util.rm_dup(util.flatten(srcss))
+    return self._evt_sources
+
+  # results are cached if cond is a function w/o free variables, e.g., is_view_adder
+  # keyed by its code, rather than the function itself, since a lambda is
+  # re-created whenever its definition is evaluated, with a new (recyclable) id
   @takes("Sample", str, callable)
   @returns(list_of(object))
   def find(self, what, cond):
-    cond_ed = filter(cond, self._logs)
-    return map(op.attrgetter(what), cond_ed)
-
+    key = find_key(what, cond)
+    if key in self._found: return list(self._found[key])
+    found = [ getattr(log, what) for log in self._logs if cond(log) ]
+    if key is not None: self._found[key] = found
+    return list(found)
+
+
+# key of Sample.find results, None if not cacheable
+def find_key(what, cond):
+  code = getattr(cond, "__code__", None)
+  if code is None or cond.__closure__ is not None: return None
+  key = (what, cond.__module__, code, cond.__defaults__)
+  try: hash(key)
+  except TypeError: return None # e.g., default arguments of list
+  return key
+
+
+# sample files under the given path
+# a binary trace is preferred to the text log of the same name, unless outdated
+@takes(str)
+@returns(list_of(str))
+def get_files(path):
+  files = {} # { path w/o extension : path }
+  for fname in util.get_files_from_path(path, "txt"):
+    files[os.path.splitext(fname)[0]] = fname
+  for trc in util.get_files_from_path(path, btrace.ext):
+    base = os.path.splitext(trc)[0]
+    txt = files.get(base)
+    if not txt or (txt != trc and os.path.getmtime(trc) >= os.path.getmtime(txt)):
+      files[base] = trc
+  return [ files[base] for base in sorted(files.keys()) ]
 
 
 # a higher-order function that calculates the max number of something
@@ -256,11 +370,14 @@ def max_evts(smpls):
 @returns(int)
 def max_views(smpls):
   def find_view(smpl):
-    find_view_adder = lambda log: isinstance(log, CallEnt) and log.mtd == "addView"
-    return smpl.find("mtd", find_view_adder)
+    return smpl.find("mtd", is_view_adder)
   return max_smpls(smpls, find_view)
 
 
+def is_view_adder(log):
+  return isinstance(log, CallEnt) and log.mtd == "addView"
+
+
 # max number of object instances in the given samples
 @takes(list_of(Sample))
 @returns(int)
@@ -297,20 +414,19 @@ def evt_sources(smpls):
 
 
 # collect all the class and method declarations in the samples
-_decls = {} # { cls1 : [mtd1, mtd2, ...], cls2 : [...], ... }
+# per thread, hence demos can be processed concurrently
+_local = threading.local() # decls: { cls1 : [mtd1, mtd2, ...], cls2 : [...], ... }
 def reset():
-  global _decls
-  _decls = {}
+  _local.decls = {}
 
 
 @takes(list_of(Sample))
 @returns(dict_of(unicode, list_of(unicode)))
 def decls(smpls):
-  global _decls
-  if not _decls:
+  if not getattr(_local, "decls", None):
     declss = map(op.attrgetter("decls"), smpls)
-    _decls = util.merge_dict(declss)
-  return _decls
+    _local.decls = util.merge_dict(declss)
+  return _local.decls
 
 
 # check whether the given method appears in the samples
@@ -328,6 +444,78 @@ def mtd_appears(smpls, clss, mname):
   return any(filter(cls_appears, clss))
 
 
+# statistics of the given samples, computed at once
+# to answer queries during the encoding phase in constant time
+# built per encoding, i.e., per demo, see encoder.smpl_index
+class SampleIndex(object):
+
+  def __init__(self, smpls):
+    self._smpls = smpls[:] # to keep the samples of interest alive
+    self._max_IOs = max_IOs(smpls)
+    self._max_evts = max_evts(smpls)
+    self._max_views = max_views(smpls)
+    self._max_objs = max_objs(smpls) if smpls else 0
+    self._evt_kinds = evt_kinds(smpls)
+    self._evt_sources = evt_sources(smpls)
+    self._objs = objs(smpls)
+    # { cls1 : set([mtd1, mtd2, ...]), ... }
+    self._decls = {}
+    for smpl in smpls:
+      for cname, mnames in smpl.decls.iteritems():
+        self._decls.setdefault(cname, set([])).update(mnames)
+    # { id(cls) : (hierarchy version, methods logged at cls or its subclasses, cls) }
+    self._logged = {}
+
+  @property
+  def smpls(self):
+    return self._smpls
+
+  @property
+  def max_IOs(self):
+    return self._max_IOs
+
+  @property
+  def max_evts(self):
+    return self._max_evts
+
+  @property
+  def max_views(self):
+    return self._max_views
+
+  @property
+  def max_objs(self):
+    return self._max_objs
+
+  @property
+  def evt_kinds(self):
+    return self._evt_kinds
+
+  @property
+  def evt_sources(self):
+    return self._evt_sources
+
+  @property
+  def objs(self):
+    return self._objs
+
+  # mtd_appears w/o looking up the merged declarations
+  def mtd_appears(self, clss, mname):
+    return any(mname in self._decls.get(cls.name, ()) for cls in clss)
+
+  # check whether the given method appears in the samples,
+  # where it is declared or at any subclasses
+  def mtd_logged(self, mtd):
+    cls = mtd.clazz
+    ver = hierarchy_version()
+    key = id(cls)
+    if key not in self._logged or self._logged[key][0] != ver:
+      mnames = set([])
+      for c in [cls] + cls.descendants():
+        mnames.update(self._decls.get(c.name, ()))
+      self._logged[key] = (ver, mnames, cls)
+    return mtd.name in self._logged[key][1]
+
+
 @takes(list_of(Sample))
 @returns(dict_of(unicode, list_of(unicode)))
 def objs(smpls):
@@ -427,7 +615,7 @@ To import lib.*, run as follows:
 """
 if __name__ == "__main__":
   from optparse import OptionParser
-  usage = "usage: python -m pasket.sample (sample.txt | sample_folder)+ [opt]"
+  usage = "usage: python -m pasket.sample (sample.(txt|trc) | sample_folder)+ [opt]"
   parser = OptionParser(usage=usage)
   parser.add_option("-m", "--method",
     action="store_true", dest="method", default=False,
@@ -438,6 +626,9 @@ if __name__ == "__main__":
   parser.add_option("-o", "--object",
     action="store_true", dest="obj", default=False,
     help="print occurred objects")
+  parser.add_option("-b", "--bench",
+    action="store", dest="bench", default=0, type="int",
+    help="measure queries of the encoding phase, w/ and w/o index, N rounds")
 
   (opt, argv) = parser.parse_args()
 
@@ -454,7 +645,7 @@ if __name__ == "__main__":
 
   smpl_files = []
   for arg in argv:
-    smpl_files.extend(util.get_files_from_path(arg, "txt"))
+    smpl_files.extend(get_files(arg))
 
   reset()
   smpls = []
@@ -479,7 +670,54 @@ if __name__ == "__main__":
       instances = ", ".join(_objs[cname])
       print "{}: {}".format(cname, instances)
 
-  if not sum([opt.method, opt.event, opt.obj]):
+  if opt.bench:
+    import time
+    from meta.clazz import Clazz
+    from meta.method import Method
+    _decls = decls(smpls)
+    # synthetic hierarchy, so that queries walk subclasses:
+    # logged classes as leaves, under a tree of abstract ones, 4 subclasses each
+    clss = [ Clazz(name=cname) for cname in _decls.keys() ]
+    level = clss[:]
+    while len(level) > 1:
+      sups = []
+      for i in xrange(0, len(level), 4):
+        sup = Clazz(name=u"Base{}".format(len(clss)))
+        for cls in level[i:i+4]:
+          cls.sup = sup.name
+          sup.add_sub(cls)
+        clss.append(sup)
+        sups.append(sup)
+      level = sups
+    # abstract ones declare whatever their subclasses log, e.g., Activity.on*
+    mnames = {}
+    for cls in clss: # subclasses first
+      mnames[cls.name] = set(_decls.get(cls.name, []))
+      for sub in cls.subs: mnames[cls.name].update(mnames[sub.name])
+    mtds = [ Method(clazz=cls, name=mname) for cls in clss for mname in mnames[cls.name] ]
+
+    # queries made by encoder.to_sk and encoder.to_func
+    def w_o_index():
+      max_evts(smpls), max_views(smpls), max_IOs(smpls)
+      for mtd in mtds:
+        clss = util.flatten_classes([mtd.clazz], "subs")
+        mtd_appears(smpls, clss, mtd.name)
+        evt_sources(smpls)
+
+    def w_index():
+      idx = SampleIndex(smpls)
+      idx.max_evts, idx.max_views, idx.max_IOs
+      for mtd in mtds:
+        idx.mtd_logged(mtd)
+        idx.evt_sources
+
+    for desc, f in [("w/o index", w_o_index), ("w/ index", w_index)]:
+      start = time.time()
+      for _ in xrange(opt.bench): f()
+      elapsed = time.time() - start
+      print "{}: {:.3f} s ({} methods, {} rounds)".format(desc, elapsed, len(mtds), opt.bench)
+
+  if not sum([opt.method, opt.event, opt.obj, opt.bench]):
     for smpl in smpls:
       print "Sample: {}".format(smpl.name)
       print str(smpl)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+import logging
+import multiprocessing
+import os
+import signal
+import subprocess
+import time
+
+# standalone, i.e., no dependency on the other modules,
+# so that psketch.py, which is run by sketch as a separate program, can use it
+
+# how often running jobs are checked (in seconds)
+poll_interval = 0.1
+
+# how long to wait for a cancelled job before killing it forcibly
+grace_period = 3
+
+
+# number of jobs to run at once: $PASKET_JOBS or 3/4 of the cores
+def default_jobs():
+  try: return max(1, int(os.environ["PASKET_JOBS"]))
+  except (KeyError, ValueError): pass
+  return max(1, int(multiprocessing.cpu_count() * 0.75))
+
+
+# number of trials to run in total: $PASKET_TRIALS or 32 per job
+def default_trials(n_jobs):
+  try: return max(1, int(os.environ["PASKET_TRIALS"]))
+  except (KeyError, ValueError): pass
+  return n_jobs * 32
+
+
+class Trial(object):
+
+  def __init__(self, idx, cmd, stdout_path=None):
+    self._idx = idx
+    self._cmd = cmd
+    self._stdout_path = stdout_path # None: inherit stdout
+    self._f = None
+    self._proc = None
+    self._pgid = None # None once the process group is gone
+    self._start = None
+    self._elapsed = None
+    self._status = None # exit status; negative if killed by a signal
+    self._cancelled = False
+
+  def __str__(self):
+    if not self._proc: state = "not started"
+    elif self._cancelled: state = "cancelled ({})".format(self._status)
+    elif self._status is None: state = "running"
+    else: state = "exit {}".format(self._status)
+    return "trial {}: {} in {:.2f}s".format(self._idx+1, state, self.elapsed)
+
+  @property
+  def idx(self):
+    return self._idx
+
+  @property
+  def cmd(self):
+    return self._cmd
+
+  @property
+  def stdout_path(self):
+    return self._stdout_path
+
+  @property
+  def status(self):
+    return self._status
+
+  @property
+  def cancelled(self):
+    return self._cancelled
+
+  @property
+  def started(self):
+    return self._proc is not None
+
+  @property
+  def done(self):
+    return self._status is not None
+
+  # wall time
+  @property
+  def elapsed(self):
+    if self._elapsed is not None: return self._elapsed
+    if self._start is not None: return time.time() - self._start
+    return 0.0
+
+  def start(self):
+    if self._stdout_path: self._f = open(self._stdout_path, 'a')
+    self._start = time.time()
+    # in a new session, hence a new process group,
+    # so that the job can be killed along with its own children
+    self._proc = subprocess.Popen(self._cmd, stdout=self._f, preexec_fn=os.setsid)
+    # recorded now, since the leader's pid may be reused once it is reaped
+    self._pgid = self._proc.pid
+
+  def __finish(self, status):
+    self._status = status
+    self._elapsed = time.time() - self._start
+    if self._f:
+      self._f.close()
+      self._f = None
+
+  def __killpg(self, sig):
+    if self._pgid is None: return
+    try: os.killpg(self._pgid, sig)
+    except OSError: self._pgid = None # no such process group
+
+  # exit status if finished, otherwise None
+  def poll(self):
+    if self.done: return self._status
+    status = self._proc.poll()
+    if status is not None:
+      # kill leftovers in the process group, e.g., orphaned children,
+      # unless the group is already known to be gone
+      self.__killpg(signal.SIGKILL)
+      self.__finish(status)
+    return status
+
+  # ask the whole process group to terminate, w/o waiting for it
+  def terminate(self):
+    if not self._proc or self.done: return
+    self._cancelled = True
+    self.__killpg(signal.SIGTERM)
+
+  # kill the whole process group, then reap the job
+  def kill(self):
+    if not self._proc or self.done: return
+    if self._proc.poll() is None:
+      self.__killpg(signal.SIGKILL)
+      self._proc.wait()
+    self.__finish(self._proc.returncode)
+
+  # terminate, wait for the grace period, then kill if still running
+  def cancel(self):
+    cancel([self])
+
+
+# cancel the given trials at once: terminate all of them,
+# wait for a single grace period shared by all, then kill the leftovers
+def cancel(trials):
+  running = [ t for t in trials if t.started and not t.done ]
+  for t in running: t.terminate()
+  deadline = time.time() + grace_period
+  while time.time() < deadline:
+    if all(t.poll() is not None for t in running): break
+    time.sleep(poll_interval)
+  for t in running: t.kill()
+
+
+# run the given trials, at most n_jobs at once
+# once a trial succeeds (by default, exits with 0), cancel all the others
+# returns the successful trial, if any
+def run(trials, n_jobs=None, success=None):
+  if not n_jobs: n_jobs = default_jobs()
+  if not success: success = lambda t: t.status == 0
+
+  pending = list(trials)
+  running = []
+  found = None
+  try:
+    while not found and (pending or running):
+      while pending and len(running) < n_jobs:
+        trial = pending.pop(0)
+        logging.debug("trial {}: {}".format(trial.idx+1, ' '.join(trial.cmd)))
+        trial.start()
+        running.append(trial)
+
+      for trial in running[:]:
+        if trial.poll() is None: continue
+        running.remove(trial)
+        logging.debug(str(trial))
+        if success(trial):
+          found = trial
+          break
+
+      if not found and running: time.sleep(poll_interval)
+
+  finally: # found one, or interrupted
+    cancel(running)
+    for trial in running: logging.debug(str(trial))
+
+  started = filter(lambda t: t.started, trials)
+  logging.info("{} of {} trial(s) run, {} cancelled, {}".format( \
+      len(started), len(trials), len(filter(lambda t: t.cancelled, trials)), \
+      "found: trial {}".format(found.idx+1) if found else "not found"))
+  return found
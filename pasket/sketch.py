@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
-from functools import partial
-import multiprocessing
+import hashlib
 import os
 import logging
 import logging.config
@@ -10,7 +9,9 @@ import subprocess
 import shutil
 import stat
 import sys
-import time
+
+import profiling
+import scheduler
 
 default_opts = []
 
@@ -19,22 +20,67 @@ def set_default_option(opts):
   default_opts = opts
 
 
-# single sketch run, as a standalone tool
-def run(sk_dir, output_path, trial=-1):
+# folder to keep sketch outputs, keyed by sketch files and options (None: no caching)
+_cache_dir = None
+
+def set_cache(path):
+  global _cache_dir
+  if path and not os.path.isdir(path): os.makedirs(path)
+  _cache_dir = path
+
+
+# hash of all the files in the given sketch folder, along with sketch options
+# options that refer to files, e.g., custom codegen jar, are hashed by contents
+def cache_key(sk_dir, opts):
+  h = hashlib.sha1(os.path.basename(os.path.normpath(sk_dir)) + '\0')
+  for root, dirs, files in os.walk(sk_dir):
+    dirs.sort()
+    for fname in sorted(files):
+      path = os.path.join(root, fname)
+      h.update(os.path.relpath(path, sk_dir) + '\0')
+      with open(path, 'rb') as f: h.update(hashlib.sha1(f.read()).digest())
+  for opt in opts:
+    if os.path.isfile(opt):
+      with open(opt, 'rb') as f: h.update(hashlib.sha1(f.read()).digest())
+    else: h.update(opt + '\0')
+  return h.hexdigest()
+
+
+# restore the output of a previous run, if any
+def cache_load(key, output_path):
+  if not _cache_dir: return False
+  cached = os.path.join(_cache_dir, key + ".txt")
+  if not os.path.isfile(cached): return False
+  shutil.copyfile(cached, output_path)
+  return True
+
+
+def cache_store(key, output_path):
+  if not _cache_dir: return
+  cached = os.path.join(_cache_dir, key + ".txt")
+  tmp = "{}.{}".format(cached, os.getpid())
+  shutil.copyfile(output_path, tmp)
+  os.rename(tmp, cached) # atomic, in case of concurrent runs
+
+
+# command line for sketch
+def sketch_cmd(sk_dir):
   global default_opts
   _opt = default_opts[:]
   _opt.extend(["--fe-output", os.path.basename(sk_dir)])
   _opt.extend(["--fe-inc", sk_dir])
 
   sk = os.path.join(sk_dir, "sample.sk")
+  return ["sketch"] + _opt + [sk]
 
-  running = "sketch running..."
-  if trial >= 0: running = running + " ({})".format(trial+1)
 
+# single sketch run, as a standalone tool
+@profiling.timed("sketch.run")
+def run(sk_dir, output_path):
   res = False 
   with open(output_path, 'a') as f:
-    logging.info(running)
-    cmd = ["sketch"] + _opt + [sk]
+    logging.info("sketch running...")
+    cmd = sketch_cmd(sk_dir)
     logging.debug(' '.join(cmd))
     try:
       subprocess.check_call(cmd, stdout=f)
@@ -47,54 +93,35 @@ def run(sk_dir, output_path, trial=-1):
 
 
 # run sketch as a whole, in parallel, until one trial finds a solution
-def p_run(sk_dir, output_path):
-  n_cpu = multiprocessing.cpu_count()
-  pool = multiprocessing.Pool(max(1, int(n_cpu * 0.75)))
-
-  def found( (fname, r) ):
-    if r: # found, copy that output file
-      shutil.copyfile(fname, output_path)
-      pool.close()
-      pool.terminate() # other running processes will become zombies here
-
-  trials = n_cpu * 32
-  results = []
-  temps = []
+# n_trials trials in total, n_jobs at once; see scheduler.default_*
+def p_run(sk_dir, output_path, n_jobs=None, n_trials=None):
+  if not n_jobs: n_jobs = scheduler.default_jobs()
+  if not n_trials: n_trials = scheduler.default_trials(n_jobs)
+  cmd = sketch_cmd(sk_dir)
+  trials = []
+  for i in xrange(n_trials):
+    _output_path = u'.'.join([output_path, str(i), "txt"])
+    trials.append(scheduler.Trial(i, cmd, _output_path))
+
+  logging.info("sketch running... ({} trials, {} at once)".format(len(trials), n_jobs))
+  found = None
   try:
-    for i in xrange(trials):
-      suffix = util.get_datetime()
-      _output_path = u'.'.join([output_path, suffix, "txt"])
-      temps.append(_output_path)
-      r = pool.apply_async(run, (sk_dir, _output_path, i), callback=found)
-      results.append(r)
-      time.sleep(6)
-    pool.close()
+    found = scheduler.run(trials, n_jobs)
   except KeyboardInterrupt:
-    pool.close()
-    pool.terminate()
-  except AssertionError: # apply_async is called after pool was terminated
-    pass
-  finally:
-    pool.join()
-
-  # clean up temporary files, while merging synthesis result
-  res = False
-  logging.debug("# of processes: {}".format(len(results)))
-  for i, fname in enumerate(temps):
-    try:
-      _fname, r = results[i].get(1) # very short timeout to kill zombies
-      res = res or r
-      assert fname == _fname
-    except IndexError:
-      pass # in case where temps.append happens but the loop finishes just before pool.apply_async
-    except multiprocessing.TimeoutError: # zombie case
-      pass
-    finally:
-      if os.path.exists(fname):
-        os.remove(fname)
-        logging.debug("deleting {}".format(fname))
+    logging.error("interrupted")
 
-  return (output_path, res)
+  if found: # found, copy that output file
+    shutil.copyfile(found.stdout_path, output_path)
+    logging.info("sketch done: {}".format(output_path))
+
+  # clean up temporary files
+  for trial in trials:
+    fname = trial.stdout_path
+    if os.path.exists(fname):
+      os.remove(fname)
+      logging.debug("deleting {}".format(fname))
+
+  return (output_path, found is not None)
 
 
 # run backend in parallel
@@ -110,6 +137,7 @@ def be_p_run(sk_dir, output_path):
 
 
 # produce C code and run it to obtain actual control-flows
+@profiling.timed("ctrl_flow_run")
 def ctrl_flow_run(sk_dir, output_path, out_dir):
   global default_opts
   # running sketch with a fake solver
@@ -117,7 +145,9 @@ def ctrl_flow_run(sk_dir, output_path, out_dir):
   # remove assertions
   default_opts.append("--fe-kill-asserts")
   # produce C code, along with test harness
-  tmp_dir = os.path.join(out_dir, "tmp/") # should end with '/'
+  # per sketch folder, so that demos running in parallel do not collide
+  tmp_dir = os.path.join(out_dir, "tmp", os.path.basename(sk_dir), "") # should end with '/'
+  if not os.path.isdir(tmp_dir): os.makedirs(tmp_dir)
   default_opts.extend(["--fe-output-dir", tmp_dir])
   default_opts.append("--fe-output-test")
 
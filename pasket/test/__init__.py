@@ -6,6 +6,7 @@ from lib.typecheck import *
 
 from .. import util
 from .. import main
+from ..sample import get_files
 
 def is_event(mname):
   return util.is_class_name(mname) and "Event" in mname
@@ -32,7 +33,7 @@ def test(cmd, smpl_paths, tmpl_paths, patterns, out_dir, demo):
 
   # compare logs
   smpl_path = os.path.join(smpl_dir, cmd, demo)
-  for smpl in util.get_files_from_path(smpl_path, "txt"):
+  for smpl in get_files(smpl_path):
     res = compare.compare(smpl, log_fname)
     if res:
       logging.error("conflict with " + os.path.normpath(smpl))
@@ -6,7 +6,7 @@ import logging
 from lib.typecheck import *
 
 from .. import util
-from ..sample import Sample
+from ..sample import Sample, get_files
 
 from . import is_event
 
@@ -26,7 +26,7 @@ sim = "Simulator"
 def gen_aux(cmd, demo, java_dir):
   # extract events from the demo's samples
   smpl_path = os.path.join(smpl_dir, cmd, demo)
-  smpl_files = util.get_files_from_path(smpl_path, "txt")
+  smpl_files = get_files(smpl_path)
 
   smpls = []
   for fname in smpl_files:
@@ -1,9 +1,15 @@
+import cPickle as pickle
 import datetime
+import hashlib
 import logging
 import operator as op
 import os
 import re
 import shutil
+import sys
+import threading
+import time
+import traceback
 from functools import partial
 from itertools import chain, islice, ifilter, ifilterfalse
 
@@ -16,6 +22,8 @@ import lib.glob2 as glob2
 from lib.typecheck import *
 import lib.const as C
 
+import profiling
+
 """
 regarding paths and files
 """
@@ -279,21 +287,176 @@ def explode_mname(mname):
 handling ANTLR AST
 """
 
+# folder to keep parsed ASTs, keyed by file contents (None: no caching)
+_ast_cache_dir = None
+
+@takes(optional(str))
+@returns(nothing)
+def set_ast_cache(path):
+  global _ast_cache_dir
+  if path and not os.path.isdir(path): os.makedirs(path)
+  _ast_cache_dir = path
+
+
+# version of the generated lexer/parser, so that cached ASTs are invalidated
+# whenever the grammar (and thus the shape of ASTs) changes
+_grammar_ver = None
+
+@takes(nothing)
+@returns(str)
+def grammar_version():
+  global _grammar_ver
+  if not _grammar_ver:
+    h = hashlib.sha1()
+    for mod in [Lexer, Parser]:
+      src = os.path.splitext(sys.modules[mod.__module__].__file__)[0] + ".py"
+      with open(src, 'rb') as f: h.update(f.read())
+    _grammar_ver = h.hexdigest()
+  return _grammar_ver
+
+
+# AST -> [(type, text, # of children)...] in pre-order
+# flat, so as to (un)pickle deep trees without recursion
+@takes(AST)
+@returns(list_of(tuple))
+def flatten_ast(node):
+  nodes = []
+  stack = [node]
+  while stack:
+    n = stack.pop()
+    if n.isNil(): nodes.append( (None, None, n.getChildCount()) )
+    else: nodes.append( (n.getType(), n.getText(), n.getChildCount()) )
+    stack.extend(reversed(n.getChildren()))
+  return nodes
+
+
+# [(type, text, # of children)...] -> AST
+@takes(list_of(tuple))
+@returns(AST)
+def unflatten_ast(nodes):
+  def mk_node( (ty, text, _) ):
+    if ty is None: return AST(None)
+    return AST(antlr3.CommonToken(type=ty, text=text))
+
+  root = mk_node(nodes[0])
+  stack = [ [root, nodes[0][2]] ] # [ [parent, # of children to be added] ]
+  for item in islice(nodes, 1, None):
+    while not stack[-1][1]: stack.pop()
+    stack[-1][1] = stack[-1][1] - 1
+    node = mk_node(item)
+    stack[-1][0].addChild(node)
+    if item[2]: stack.append([node, item[2]])
+  return root
+
+
+@takes(str)
+@returns(AST)
+def parse_file(fname):
+  f_stream = antlr3.FileStream(fname)
+  lexer = Lexer(f_stream)
+  t_stream = antlr3.CommonTokenStream(lexer)
+  parser = Parser(t_stream)
+  try: _ast = parser.compilationUnit()
+  except antlr3.RecognitionException:
+    traceback.print_stack()
+    sys.exit(1)
+  return _ast.tree
+
+
+# parse the given file, unless the same contents were parsed before
+@takes(str)
+@returns(AST)
+def parse_file_cached(fname):
+  if not _ast_cache_dir: return parse_file(fname)
+
+  with open(fname, 'rb') as f: contents = f.read()
+  key = hashlib.sha1(grammar_version() + contents).hexdigest()
+  cached = os.path.join(_ast_cache_dir, key + ".ast")
+  if os.path.isfile(cached):
+    try:
+      with open(cached, 'rb') as f: return unflatten_ast(pickle.load(f))
+    except Exception: # broken cache entry; just parse again
+      logging.debug("ignoring broken cache: " + cached)
+
+  tree = parse_file(fname)
+  tmp = "{}.{}".format(cached, os.getpid())
+  with open(tmp, 'wb') as f:
+    pickle.dump(flatten_ast(tree), f, pickle.HIGHEST_PROTOCOL)
+  os.rename(tmp, cached) # atomic, in case of concurrent runs
+  return tree
+
+
+"""
+parsing snippets of Java code, e.g., statements and expressions to be added
+"""
+
+# parsed snippets and statistics regarding them, per thread
+_snippet_local = threading.local()
+
+def __snippet_state():
+  st = _snippet_local
+  if not hasattr(st, "cache"):
+    st.cache = {} # { (rule, text) : flattened AST }
+    st.stats = { "snippets": 0, "parsed": 0, "time": 0.0 }
+  return st
+
+
+@takes(nothing)
+@returns(dict_of(str, (int, float)))
+def snippet_stats():
+  return dict(__snippet_state().stats)
+
+
+@takes(nothing)
+@returns(nothing)
+def snippet_stats_reset():
+  __snippet_state().stats.update(snippets=0, parsed=0, time=0.0)
+
+
+# parse the given snippets with the given parser rule, e.g., block or expression
+# ASTs are freshly built per request, hence free to be modified
+# a lexer/parser pair is built per call, and reset per snippet, if any to parse;
+# hence no state is shared with other calls, e.g., on other threads or after errors
+@takes(str, list_of((str, unicode)))
+@returns(list_of(AST))
+def parse_snippets(rule, texts):
+  st = __snippet_state()
+  lexer, parser = None, None
+  trees = []
+  for text in texts:
+    st.stats["snippets"] += 1
+    key = (rule, text)
+    if key not in st.cache:
+      start = time.time()
+      s_stream = antlr3.StringStream(text)
+      if not lexer:
+        lexer = Lexer(s_stream)
+        parser = Parser(antlr3.CommonTokenStream(lexer))
+      else: # both reset their states
+        lexer.setCharStream(s_stream)
+        parser.setTokenStream(antlr3.CommonTokenStream(lexer))
+      tree = getattr(parser, rule)().tree
+      st.cache[key] = flatten_ast(tree)
+      st.stats["parsed"] += 1
+      st.stats["time"] += time.time() - start
+    trees.append(unflatten_ast(st.cache[key]))
+  return trees
+
+
+@takes(str, (str, unicode))
+@returns(AST)
+def parse_snippet(rule, text):
+  return parse_snippets(rule, [text])[0]
+
+
+@profiling.timed("toAST")
 @takes(list_of(str))
 @returns(AST)
 def toAST(files):
   ast = antlr3.tree.CommonTree(None)
   for fname in files:
     logging.debug("reading: " + os.path.normpath(fname))
-    f_stream = antlr3.FileStream(fname)
-    lexer = Lexer(f_stream)
-    t_stream = antlr3.CommonTokenStream(lexer)
-    parser = Parser(t_stream)
-    try: _ast = parser.compilationUnit()
-    except antlr3.RecognitionException:
-      traceback.print_stack()
-      sys.exit(1)
-    ast.addChild(_ast.tree)
+    ast.addChild(parse_file_cached(fname))
   return ast
 
 
@@ -420,13 +583,18 @@ def flatten(lstlst):
 @takes(list_of("Clazz"), str)
 @returns(list_of("Clazz"))
 def flatten_classes(clss, attr):
-  mapped = map(op.attrgetter(attr), clss)
-  if not mapped: return clss
-  else:
-    flattened = flatten(mapped)
-    diff = list(set(flattened) - set(clss))
-    if not diff: return clss
-    else: return flatten_classes(clss + diff, attr)
+  # breadth-first, hence classes appear in order of discovery
+  res = clss[:]
+  visited = set(map(id, clss))
+  i = 0
+  while i < len(res):
+    for cls in getattr(res[i], attr):
+      if id(cls) in visited: continue
+      visited.add(id(cls))
+      res.append(cls)
+    i = i + 1
+  if len(res) == len(clss): return clss
+  return res
 
 
 """
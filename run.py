@@ -39,6 +39,31 @@ def main():
   parser.add_option("--no-sketch",
     action="store_false", dest="sketch", default=True,
     help="proceed the whole process without running Sketch")
+  parser.add_option("--no-cache",
+    action="store_false", dest="cache", default=True,
+    help="parse templates, encode, and run Sketch from scratch, without reusing previous results")
+  parser.add_option("--no-typecheck",
+    action="store_false", dest="typecheck", default=True,
+    help="turn off run-time type checking of @takes/@returns")
+  parser.add_option("--typecheck-sample",
+    action="store", dest="typecheck_sample", default=None, type="int",
+    help="type-check only one in every N calls")
+  parser.add_option("--subcls",
+    action="store", dest="subcls", default="dense",
+    type="choice", choices=["dense", "csr", "interval"],
+    help="how to encode the subtype relation: dense, csr, or interval")
+  parser.add_option("--bench-subcls",
+    action="store_true", dest="bench_subcls", default=False,
+    help="compare encodings of the subtype relation, w/ and w/o Sketch")
+  parser.add_option("--profile",
+    action="store_true", dest="profile", default=False,
+    help="report phase timings and Sketch statistics per demo")
+  parser.add_option("--profile-python",
+    action="store_true", dest="profile_python", default=False,
+    help="profile each rewriting visitor, along with dispatches by node type")
+  parser.add_option("-j", "--jobs",
+    action="store", dest="jobs", default=1, type="int",
+    help="number of demos to process in parallel")
   parser.add_option("--timeout",
     action="store", dest="timeout", default=None, type="int",
     help="Sketch timeout")
@@ -87,6 +112,11 @@ def main():
     return subprocess.call(["ant", opt.cmd])
 
   else: # android, gui, or pattern
+    # type checking is decided when modules are loaded, i.e., before importing pasket
+    import lib.typecheck
+    if not opt.typecheck: lib.typecheck.configure("off")
+    elif opt.typecheck_sample: lib.typecheck.configure(opt.typecheck_sample)
+
     if opt.sim or opt.sanity:
       if opt.sanity: opt.sim = opt.pattern[-1]
       import pasket.test as test
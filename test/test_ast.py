@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+root_dir = os.path.join(os.path.dirname(__file__), "..")
+tmpl_dir = os.path.join(root_dir, "template")
+
+sys.path.insert(0, root_dir)
+import antlr3
+from antlr3.tree import CommonTree as AST
+from grammar.JavaLexer import JavaLexer as Lexer
+from grammar.JavaParser import JavaParser as Parser
+
+from pasket import util
+
+def mk_node(ty, text, children=[]):
+  node = AST(antlr3.CommonToken(type=ty, text=text))
+  for child in children: node.addChild(child)
+  return node
+
+
+# parse the given snippet w/o any caching
+def parse(rule, text):
+  lexer = Lexer(antlr3.StringStream(text))
+  parser = Parser(antlr3.CommonTokenStream(lexer))
+  return getattr(parser, rule)().tree
+
+
+class TestFlatten(unittest.TestCase):
+
+  def test_round_trip(self):
+    root = AST(None) # nil, e.g., a list of compilation units
+    root.addChild(mk_node(1, u"class", [mk_node(2, u"A"), mk_node(3, u"{", [mk_node(4, u"x")])]))
+    root.addChild(mk_node(5, u"interface", [mk_node(2, u"I")]))
+    nodes = util.flatten_ast(root)
+    tree = util.unflatten_ast(nodes)
+    self.assertEqual(root.toStringTree(), tree.toStringTree())
+    self.assertEqual(nodes, util.flatten_ast(tree))
+    self.assertEqual(map(lambda n: n.getType(), root.getChildren()), \
+        map(lambda n: n.getType(), tree.getChildren()))
+
+  def test_deep(self):
+    root = mk_node(1, u"0")
+    node = root
+    for i in xrange(sys.getrecursionlimit() * 2):
+      child = mk_node(1, unicode(i+1))
+      node.addChild(child)
+      node = child
+    nodes = util.flatten_ast(root)
+    self.assertEqual(nodes, util.flatten_ast(util.unflatten_ast(nodes)))
+
+
+class TestASTCache(unittest.TestCase):
+
+  def setUp(self):
+    self.cache_dir = tempfile.mkdtemp()
+    self.files = util.get_files_from_path(os.path.join(tmpl_dir, "pattern", "observer"), "java")
+
+  def tearDown(self):
+    util.set_ast_cache(None)
+    shutil.rmtree(self.cache_dir)
+
+  def test_cached(self):
+    self.assertTrue(self.files)
+    expected = map(lambda f: util.parse_file(f).toStringTree(), self.files)
+    util.set_ast_cache(self.cache_dir)
+    for _ in xrange(2): # miss, then hit
+      trees = map(util.parse_file_cached, self.files)
+      self.assertEqual(expected, map(lambda t: t.toStringTree(), trees))
+      self.assertEqual(len(set(expected)), len(os.listdir(self.cache_dir)))
+
+  def test_broken(self):
+    util.set_ast_cache(self.cache_dir)
+    fname = self.files[0]
+    expected = util.parse_file_cached(fname).toStringTree()
+    for cached in os.listdir(self.cache_dir):
+      with open(os.path.join(self.cache_dir, cached), 'wb') as f: f.write("broken")
+    self.assertEqual(expected, util.parse_file_cached(fname).toStringTree())
+
+
+class TestSnippets(unittest.TestCase):
+
+  def setUp(self):
+    util.snippet_stats_reset()
+
+  def test_same_as_parse(self):
+    es = [u"x", u"a.b(c, 1)", u"new Foo()", u"a.b(c, 1)"]
+    trees = util.parse_snippets("expression", es)
+    self.assertEqual(map(lambda e: parse("expression", e).toStringTree(), es), \
+        map(lambda t: t.toStringTree(), trees))
+    stats = util.snippet_stats()
+    self.assertEqual(len(es), stats["snippets"])
+    self.assertEqual(len(set(es)), stats["parsed"])
+
+  def test_fresh(self):
+    s = u"{ int x = 0; return x; }"
+    tree = util.parse_snippet("block", s)
+    expected = tree.toStringTree()
+    tree.addChild(mk_node(1, u"junk"))
+    self.assertEqual(expected, util.parse_snippet("block", s).toStringTree())
+    self.assertEqual(1, util.snippet_stats()["parsed"])
+
+  def test_after_error(self):
+    try: util.parse_snippets("block", [u"{ int x = ; }"])
+    except antlr3.RecognitionException: pass
+    s = u"{ return a + b; }"
+    self.assertEqual(parse("block", s).toStringTree(), \
+        util.parse_snippet("block", s).toStringTree())
+
+
+if __name__ == '__main__':
+  unittest.main()
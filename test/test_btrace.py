@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+root_dir = os.path.join(os.path.dirname(__file__), "..")
+smpl_dir = os.path.join(root_dir, "sample")
+
+sys.path.insert(0, root_dir)
+from pasket import btrace
+from pasket import util
+from pasket.sample import Sample, CallBase, call_regex, evt_regex, split_vals
+
+# nested calls, objects, environmental changes, an event as <init>,
+# and lines to be skipped, e.g., empty ones and comments
+log = u"""\
+> demo.Main.main()
+  > javax.swing.JButton.JButton(javax.swing.JButton@1965391223, "OK")
+  < javax.swing.JButton.JButton()
+
+  > javax.swing.JButton.setActionCommand(javax.swing.JButton@1965391223, "disable")
+  < javax.swing.JButton.setActionCommand()
+  > java.awt.event.ActionEvent.ActionEvent(java.awt.event.ActionEvent@42, javax.swing.JButton@1965391223)
+  < java.awt.event.ActionEvent.ActionEvent()
+  > demo.Main$1.run(demo.Main$1@7)
+  < demo.Main$1.run()
+< demo.Main.main()
+# comment
+KeyEvent(javax.swing.JButton@1965391223, 65, null)
+> Outer.get(3.14, true, "a, b")
+< Outer.get(javax.swing.JButton@69709808)
+"""
+
+def is_event(mname):
+  return mname.endswith("Event")
+
+
+class TestBtrace(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.txt = os.path.join(self.tmp_dir, "sample.txt")
+    with open(self.txt, 'w') as f: f.write(log)
+    self.trc = os.path.join(self.tmp_dir, "sample." + btrace.ext)
+    btrace.convert(self.txt, self.trc)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  # (kind, depth, pkg, cls, mtd, [val]) per line of the text log
+  def parse_text(self, txt):
+    recs = []
+    depth = 0
+    with open(txt) as f:
+      for line in f:
+        line = unicode(line.strip())
+        if not line: continue
+        if line[0] in "><":
+          pkg, cls, mtd = util.explode_mname(call_regex.match(line).group(2))
+          vals = split_vals(call_regex.match(line).group(3))
+          if line[0] == '>':
+            recs.append( (btrace.ENT, depth, pkg, cls, mtd, vals) )
+            depth = depth + 1
+          else:
+            depth = depth - 1
+            recs.append( (btrace.EXT, depth, pkg, cls, mtd, vals) )
+        elif line[0].isalpha():
+          m = evt_regex.match(line)
+          recs.append( (btrace.EVT, depth, None, None, m.group(1), split_vals(m.group(2))) )
+    return recs
+
+  # records of the binary trace, where values are restored as in the text log
+  def read_trace(self, trc):
+    recs = []
+    with btrace.Reader(trc) as r:
+      def to_val(i):
+        if not i & btrace.OBJ: return r.strs[i]
+        typ, hsh = r.objs[i & ~btrace.OBJ]
+        return r.strs[typ] + '@' + r.strs[hsh]
+      for kind, depth, pkg, cls, mtd, vals in r.records():
+        recs.append( (kind, depth, pkg, cls, mtd, map(to_val, vals)) )
+      self.assertEqual(len(r), len(recs))
+    return recs
+
+  def test_is_btrace(self):
+    self.assertTrue(btrace.is_btrace(self.trc))
+    self.assertFalse(btrace.is_btrace(self.txt))
+
+  def test_records(self):
+    self.assertEqual(self.parse_text(self.txt), self.read_trace(self.trc))
+
+  def test_interning(self):
+    with btrace.Reader(self.trc) as r:
+      self.assertEqual(len(r.strs), len(set(r.strs)))
+      self.assertEqual(len(r.objs), len(set(r.objs)))
+
+  def assertSameSample(self, txt, trc):
+    s_txt = Sample(txt, is_event)
+    s_trc = Sample(trc, is_event)
+    self.assertEqual(str(s_txt), str(s_trc))
+    self.assertEqual(map(type, s_txt.logs), map(type, s_trc.logs))
+    depth = lambda log: log.indent if isinstance(log, CallBase) else None
+    self.assertEqual(map(depth, s_txt.logs), map(depth, s_trc.logs))
+    self.assertEqual(s_txt.decls, s_trc.decls)
+    self.assertEqual(s_txt.objs, s_trc.objs)
+    self.assertEqual(s_txt.num_objs, s_trc.num_objs)
+    self.assertEqual(s_txt.evt_kinds, s_trc.evt_kinds)
+    self.assertEqual(s_txt.evt_sources, s_trc.evt_sources)
+
+  def test_sample(self):
+    self.assertSameSample(self.txt, self.trc)
+
+  def test_sample_repo(self):
+    txts = util.get_files_from_path(os.path.join(smpl_dir, "gui", "button_demo"), "txt")
+    self.assertTrue(txts)
+    for txt in txts:
+      trc = os.path.join(self.tmp_dir, os.path.basename(txt) + '.' + btrace.ext)
+      btrace.convert(txt, trc)
+      self.assertEqual(self.parse_text(txt), self.read_trace(trc))
+      self.assertSameSample(txt, trc)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+import os
+import random
+import sys
+import unittest
+
+root_dir = os.path.join(os.path.dirname(__file__), "..")
+
+sys.path.insert(0, root_dir)
+from antlr3.tree import CommonTree as AST
+
+import lib.const as C
+from pasket import util
+from pasket.meta import classes
+from pasket.meta.template import Template
+from pasket.meta.clazz import Clazz
+from pasket.meta.method import Method
+from pasket.meta.field import Field
+
+# Template.consist before indexing, which checks every pair of classes
+def old_consist(tmpl):
+  clss = util.flatten_classes(tmpl.classes, "inners")
+  decls = { repr(cls): cls for cls in clss }
+  def is_defined(tname):
+    _tname = util.sanitize_ty(tname)
+    for cls_r in decls.keys():
+      if decls[cls_r].is_inner:
+        if _tname == cls_r: return True
+        if _tname in cls_r.split('_'): return True
+      else:
+        if tname == cls_r: return True
+    return False
+
+  def add_decl(tname):
+    if is_defined(tname): return
+    cls = Clazz(name=tname)
+    if tname in C.primitives: cls.sup = None
+    decls[repr(cls)] = cls
+    if util.is_collection(tname):
+      map(add_decl, util.of_collection(tname)[1:])
+    elif util.is_array(tname):
+      add_decl(util.componentType(tname))
+
+  for cls in clss:
+    for fld in cls.flds:
+      if not is_defined(fld.typ): add_decl(fld.typ)
+    for mtd in cls.mtds:
+      for (ty, nm) in mtd.params:
+        if not is_defined(ty): add_decl(ty)
+
+  for cls in clss:
+    if not cls.sup and not cls.itfs: continue
+    sups = map(util.sanitize_ty, cls.itfs)
+    if cls.sup: sups.append(util.sanitize_ty(cls.sup))
+    if not sups: continue
+    for sup in clss:
+      if sup == cls: continue
+      if sup.name in sups or repr(sup) in sups:
+        if cls not in sup.subs: sup.subs.append(cls)
+
+
+names = [ u"C{}".format(i) for i in xrange(30) ]
+# declared ones, primitives, undefined ones, nested in generics or arrays, and inners
+typs = names + [C.J.i, C.J.z, u"Foo", u"List<Bar>", u"Baz[]", u"Map<C1,Qux>", \
+    u"C3.In", u"In", u"C4_In"]
+
+# random classes, along with members and inner classes, at the given template
+def populate(tmpl, seed):
+  rnd = random.Random(seed)
+  for cname in names:
+    sup = rnd.choice(names + [C.J.OBJ, u"Undefined"])
+    itfs = rnd.sample(names, rnd.randint(0, 2))
+    cls = Clazz(name=cname, sup=sup, itfs=itfs)
+    for i in xrange(rnd.randint(0, 3)):
+      cls.flds.append(Field(clazz=cls, typ=rnd.choice(typs), name=u"f{}".format(i)))
+    params = [ (rnd.choice(typs), u"x{}".format(i)) for i in xrange(rnd.randint(0, 2)) ]
+    cls.mtds.append(Method(clazz=cls, name=u"m", params=params))
+    if rnd.random() < 0.3:
+      inner = Clazz(name=u"In", outer=cls, sup=rnd.choice(names))
+      inner.flds.append(Field(clazz=inner, typ=rnd.choice(typs), name=u"g"))
+      cls.inners.append(inner)
+    tmpl.classes.append(cls)
+
+
+# an empty template, i.e., only with Object
+def empty():
+  return Template(AST(None))
+
+
+# every class in the registry, along with its subclasses
+def snapshot():
+  return sorted([ (repr(cls), sorted(map(repr, cls.subs))) for cls in classes() ])
+
+
+class TestConsist(unittest.TestCase):
+
+  def test_same_as_old(self):
+    for seed in xrange(10):
+      tmpl = empty()
+      populate(tmpl, seed)
+      old_consist(tmpl)
+      expected = snapshot()
+
+      tmpl = empty()
+      populate(tmpl, seed)
+      tmpl.consist()
+      self.assertEqual(expected, snapshot())
+
+  def test_rerun(self):
+    tmpl = empty()
+    populate(tmpl, 0)
+    tmpl.consist()
+    expected = snapshot()
+    # nothing has changed, hence no duplicated virtual declarations
+    tmpl.consist()
+    self.assertEqual(expected, snapshot())
+
+  # after changes, same as the old one on the same classes from scratch
+  def test_incremental(self):
+    # a new member and a new class, hence revisiting only them
+    def add(tmpl):
+      cls = util.find(lambda c: c.name == u"C5", tmpl.classes)
+      cls.flds.append(Field(clazz=cls, typ=u"Zed", name=u"z"))
+      new = Clazz(name=u"New", sup=u"C1", itfs=[u"C2"])
+      new.mtds.append(Method(clazz=new, name=u"m", params=[(u"Set<Yet>", u"y")]))
+      tmpl.classes.append(new)
+
+    # a type changed, hence revisiting all the classes
+    def retype(tmpl):
+      cls = util.find(lambda c: c.name == u"C7", tmpl.classes)
+      fld = Field(clazz=cls, typ=u"Zed", name=u"z")
+      cls.flds.append(fld)
+      fld.typ = u"List<Zed>[]"
+
+    for change in [add, retype]:
+      for seed in xrange(5):
+        tmpl = empty()
+        populate(tmpl, seed)
+        change(tmpl)
+        old_consist(tmpl)
+        expected = snapshot()
+
+        tmpl = empty()
+        populate(tmpl, seed)
+        tmpl.consist()
+        change(tmpl)
+        tmpl.consist()
+        self.assertEqual(expected, snapshot())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import copy
+import cPickle as pickle
+import unittest
+
+root_dir = os.path.join(os.path.dirname(__file__), "..")
+
+sys.path.insert(0, root_dir)
+import lib.const as C
+from pasket.meta import types_version
+from pasket.meta import expression as exp
+
+# new xs[0], where xs is of the given type
+def mk(ty):
+  xs = exp.gen_E_id(u"xs", ty)
+  idx = exp.gen_E_idx(xs, exp.gen_E_c(0))
+  return xs, idx, exp.gen_E_new(idx)
+
+def memoized(e):
+  return bool(e._typ_memo[1])
+
+
+class TestTypMemo(unittest.TestCase):
+
+  def test_memoized(self):
+    _, idx, new = mk(u"int[]")
+    self.assertEqual(C.J.i, new.typ(None))
+    self.assertTrue(memoized(new))
+    self.assertTrue(memoized(idx))
+
+  # replacing a subtree elsewhere keeps memoized types as well as the version
+  def test_unrelated(self):
+    _, _, new = mk(u"int[]")
+    new.typ(None)
+    ver = types_version()
+    xs, idx, _ = mk(u"int[]")
+    idx.e = exp.gen_E_id(u"ys", u"long[]")
+    xs.ty = u"long[]"
+    self.assertTrue(memoized(new))
+    self.assertEqual(ver, types_version())
+
+  def test_ancestors(self):
+    xs, idx, new = mk(u"int[]")
+    self.assertEqual(C.J.i, new.typ(None))
+    xs.ty = u"long[]"
+    self.assertFalse(memoized(idx))
+    self.assertFalse(memoized(new))
+    self.assertEqual(C.J.j, new.typ(None))
+
+  def test_replaced(self):
+    xs, idx, new = mk(u"int[]")
+    self.assertEqual(C.J.i, new.typ(None))
+    ys = exp.gen_E_id(u"ys", u"boolean[]")
+    idx.e = ys
+    self.assertEqual(C.J.z, new.typ(None))
+    self.assertEqual([], xs._parents)
+    self.assertEqual([idx], ys._parents)
+    # the detached one no longer affects its former parent
+    xs.ty = u"long[]"
+    self.assertTrue(memoized(new))
+    self.assertEqual(C.J.z, new.typ(None))
+
+  def test_unchanged(self):
+    xs, idx, new = mk(u"int[]")
+    new.typ(None)
+    idx.e = xs
+    self.assertTrue(memoized(new))
+    self.assertEqual([idx], xs._parents)
+
+  # a copied subtree is detached, while pickled trees keep their links
+  def test_copy(self):
+    xs, idx, new = mk(u"int[]")
+    new.typ(None)
+    _idx = copy.deepcopy(idx)
+    self.assertEqual([], _idx._parents)
+    _idx.e.ty = u"long[]"
+    self.assertEqual(C.J.j, _idx.typ(None))
+    self.assertTrue(memoized(new))
+
+    _new = pickle.loads(pickle.dumps(new, pickle.HIGHEST_PROTOCOL))
+    self.assertEqual(C.J.i, _new.typ(None))
+    _new.e.e.ty = u"long[]"
+    self.assertEqual(C.J.j, _new.typ(None))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+import os
+import random
+import sys
+import unittest
+
+root_dir = os.path.join(os.path.dirname(__file__), "..")
+
+sys.path.insert(0, root_dir)
+import lib.const as C
+from pasket.meta import classes, classes_reset, classes_touched, class_lookup
+from pasket.meta import clazz
+from pasket.meta.clazz import Clazz
+from pasket.meta.method import Method
+
+mnames = [u"m", u"n", u"o"]
+
+def add_mtd(rnd, cls):
+  ty = rnd.choice([ c.name for c in classes() ])
+  mtd = Method(clazz=cls, name=rnd.choice(mnames), params=[(ty, u"x")])
+  cls.mtds.append(mtd)
+
+# random classes, along with methods, some of which refer to undefined ones
+def populate(rnd, n):
+  classes_reset()
+  Clazz(name=C.J.OBJ, sup=None)
+  for i in xrange(n):
+    cands = [ c.name for c in classes() ] + [u"Undefined{}".format(i)]
+    cls = Clazz(name=u"C{}".format(i), sup=rnd.choice(cands))
+    for _ in xrange(rnd.randint(0, 2)): add_mtd(rnd, cls)
+
+# names of supertypes, transitively, without caches
+def ancestors(cls):
+  names, work = set([]), [cls]
+  while work:
+    c = work.pop()
+    for sname in c.sups:
+      if sname in names: continue
+      names.add(sname)
+      sup = class_lookup(sname)
+      if sup: work.append(sup)
+  return names
+
+def mutate(rnd):
+  clss = classes()
+  cls = rnd.choice(clss[1:])
+  # w/o cycles, as the superclass chain is walked without visited marks
+  def sups_of(name):
+    return [ c for c in clss if c.name != name and name not in ancestors(c) ]
+  k = rnd.randint(0, 6)
+  if k == 0: rnd.choice(clss).add_sub(cls)
+  elif k == 1: cls.add_itf(rnd.choice(sups_of(cls.name)).name)
+  elif k == 2: cls.sup = rnd.choice(sups_of(cls.name)).name
+  elif k == 3: add_mtd(rnd, cls)
+  elif k == 4 and cls.mtds: rnd.choice(cls.mtds).name = rnd.choice(mnames)
+  elif k == 5: # may resolve names that were undefined
+    name = u"Undefined{}".format(rnd.randint(0, len(clss)))
+    Clazz(name=name, sup=rnd.choice(sups_of(name)).name)
+  else: cls.inners.append(Clazz(name=u"In", outer=cls))
+
+# answers to queries, which go through the caches
+# resolutions first, so that they fill the others while being resolved
+def answers():
+  clss = classes()
+  ans = []
+  for c in clss:
+    for mname in mnames:
+      ans.append(map(repr, clazz.find_mtds_by_name(c.name, mname)))
+      for d in clss[:5]:
+        ans.append(map(repr, clazz.find_mtds_by_sig(c.name, mname, [d.name])))
+  for c in clss:
+    ans.append([ c <= d for d in clss ])
+    ans.append(map(repr, c.descendants()))
+    ans.append(map(repr, c.all_inners()))
+    mtds, flds = c.members()
+    ans.append(sorted([ (k, map(repr, v)) for k, v in mtds.iteritems() ]))
+  return ans
+
+# answers from scratch, i.e., after dropping all the cache entries
+def fresh_answers():
+  classes_touched()
+  return answers()
+
+
+class TestHierarchy(unittest.TestCase):
+
+  def test_same_as_fresh(self):
+    for seed in xrange(10):
+      rnd = random.Random(seed)
+      populate(rnd, 12)
+      for i in xrange(20):
+        answers() # fill the caches, so as to check invalidations
+        mutate(rnd)
+        ans = answers()
+        self.assertEqual(fresh_answers(), ans, (seed, i))
+
+  # touching a class keeps cache entries of unrelated ones
+  def test_scoped(self):
+    classes_reset()
+    obj = Clazz(name=C.J.OBJ, sup=None)
+    a = Clazz(name=u"A")
+    b = Clazz(name=u"B", sup=u"A")
+    c = Clazz(name=u"C", sup=u"B")
+    d = Clazz(name=u"D")
+    a.add_sub(b)
+    b.add_sub(c)
+    for x in [a, b, c, d]:
+      x.mtds.append(Method(clazz=x, name=u"m"))
+    for x in [a, b, c, d]:
+      x.sup_closure()
+      x.descendants()
+      clazz.find_mtds_by_name(x.name, u"m")
+    cached = lambda x, k: k in x._caches
+
+    # a new method at C: its index and resolutions via C only
+    n = Method(clazz=c, name=u"n")
+    c.mtds.append(n)
+    resolved = clazz.registry().resolved
+    self.assertFalse(cached(c, "members"))
+    self.assertTrue(all(cached(x, "members") for x in [a, b, d]))
+    self.assertTrue(all(cached(x, "sup_closure") for x in [a, b, c, d]))
+    self.assertNotIn((u"C", u"m", None), resolved)
+    self.assertTrue(all((x, u"m", None) in resolved for x in [u"A", u"B", u"D"]))
+    self.assertIs(n, clazz.find_mtds_by_name(u"C", u"n")[0])
+
+    # a new subclass of A: descendants of A only, not supertypes of any
+    e = Clazz(name=u"E", sup=u"A")
+    a.add_sub(e)
+    self.assertFalse(cached(a, "descendants"))
+    self.assertTrue(cached(b, "descendants"))
+    self.assertTrue(all(cached(x, "sup_closure") for x in [a, b, c, d]))
+    self.assertEqual([b, e, c], a.descendants())
+
+    # a new superclass of B: closures of B and C only
+    b.sup = u"D"
+    self.assertFalse(cached(b, "sup_closure"))
+    self.assertFalse(cached(c, "sup_closure"))
+    self.assertTrue(cached(a, "sup_closure"))
+    self.assertTrue(c <= d)
+    self.assertFalse(c <= a)
+
+  # closures that refer to undefined names are revisited once they are declared
+  def test_dangling(self):
+    classes_reset()
+    Clazz(name=C.J.OBJ, sup=None)
+    a = Clazz(name=u"A", sup=u"Later")
+    self.assertEqual(set([u"Later"]), a.sup_closure()[0])
+    later = Clazz(name=u"Later", sup=u"Base")
+    base = Clazz(name=u"Base")
+    self.assertTrue(a <= later)
+    self.assertTrue(a <= base)
+    self.assertIs(later, class_lookup(u"Later"))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+root_dir = os.path.join(os.path.dirname(__file__), "..")
+
+sys.path.insert(0, root_dir)
+from pasket import sample
+from pasket import encoder
+from pasket.sample import Sample, SampleIndex, CallEnt, CallExt
+from pasket.meta.clazz import Clazz
+from pasket.meta.method import Method
+
+log = u"""\
+> demo.Main.main()
+  > android.widget.LinearLayout.addView(android.widget.LinearLayout@1, android.widget.Button@2)
+  < android.widget.LinearLayout.addView()
+  > android.widget.Button.setText(android.widget.Button@2, "OK")
+  < android.widget.Button.setText()
+  > android.widget.LinearLayout.addView(android.widget.LinearLayout@1, android.widget.Button@3)
+  < android.widget.LinearLayout.addView()
+< demo.Main.main()
+KeyEvent(android.widget.Button@2, 65)
+"""
+
+def is_event(mname):
+  return mname.endswith("Event")
+
+
+class TestSample(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    fname = os.path.join(self.tmp_dir, "sample.txt")
+    with open(fname, 'w') as f: f.write(log)
+    self.smpl = Sample(fname, is_event)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def test_find(self):
+    found = self.smpl.find("mtd", sample.is_view_adder)
+    self.assertEqual([u"addView", u"addView"], found)
+    # results are copies, hence free to be modified
+    found.append(u"junk")
+    self.assertEqual([u"addView", u"addView"], self.smpl.find("mtd", sample.is_view_adder))
+
+  def test_find_lambda(self):
+    # the same lambda, re-created per iteration, shares a single entry
+    for _ in xrange(3):
+      found = self.smpl.find("mtd", lambda log: isinstance(log, CallExt))
+    self.assertEqual(4, len(found))
+    self.assertEqual(1, len(self.smpl._found))
+
+  def test_find_distinct(self):
+    # same code, but different defaults or free variables, hence not mixed up
+    def mk(mname):
+      return lambda log: isinstance(log, CallEnt) and log.mtd == mname
+    self.assertEqual([u"setText"], self.smpl.find("mtd", mk(u"setText")))
+    self.assertEqual([u"main"], self.smpl.find("mtd", mk(u"main")))
+    conds = [ lambda log, m=m: isinstance(log, CallEnt) and log.mtd == m \
+        for m in [u"setText", u"main"] ]
+    self.assertEqual([u"setText"], self.smpl.find("mtd", conds[0]))
+    self.assertEqual([u"main"], self.smpl.find("mtd", conds[1]))
+
+  # names and objects are shared amongst records, but only within a sample
+  def test_shared(self):
+    adds = [ log for log in self.smpl.IOs if log.mtd == u"addView" ]
+    self.assertEqual(4, len(adds))
+    self.assertTrue(all(log.mtd is adds[0].mtd for log in adds))
+    self.assertIs(self.smpl.IOs[1].vals[1], self.smpl.evts[0].vals[0])
+    fname = os.path.join(self.tmp_dir, "sample.txt")
+    other = Sample(fname, is_event)
+    self.assertEqual(adds[0].mtd, other.IOs[1].mtd)
+    self.assertIsNot(adds[0].mtd, other.IOs[1].mtd)
+
+  def test_index(self):
+    smpls = [self.smpl]
+    idx = SampleIndex(smpls)
+    self.assertEqual(sample.max_IOs(smpls), idx.max_IOs)
+    self.assertEqual(sample.max_evts(smpls), idx.max_evts)
+    self.assertEqual(sample.max_views(smpls), idx.max_views)
+    self.assertEqual(sample.max_objs(smpls), idx.max_objs)
+    self.assertEqual(sample.evt_kinds(smpls), idx.evt_kinds)
+    self.assertEqual(sample.evt_sources(smpls), idx.evt_sources)
+    self.assertEqual(sample.objs(smpls), idx.objs)
+
+  def test_mtd_logged(self):
+    idx = SampleIndex([self.smpl])
+    vg = Clazz(name=u"ViewGroup")
+    ll = Clazz(name=u"LinearLayout", sup=u"ViewGroup")
+    vg.add_sub(ll)
+    # logged at a subclass
+    add = Method(clazz=vg, name=u"addView")
+    self.assertTrue(idx.mtd_logged(add))
+    self.assertTrue(idx.mtd_appears([vg, ll], u"addView"))
+    self.assertFalse(idx.mtd_appears([vg], u"addView"))
+    self.assertFalse(idx.mtd_logged(Method(clazz=vg, name=u"removeView")))
+    # hierarchy changes are reflected
+    other = Clazz(name=u"Other")
+    self.assertFalse(idx.mtd_logged(Method(clazz=other, name=u"addView")))
+    other.add_sub(Clazz(name=u"Button", sup=u"Other"))
+    self.assertTrue(idx.mtd_logged(Method(clazz=other, name=u"setText")))
+
+  # encoding a different set of samples, e.g., the next demo, rebuilds the index
+  def test_index_per_demo(self):
+    smpls = [self.smpl]
+    idx = encoder.smpl_index(smpls)
+    self.assertIs(idx, encoder.smpl_index(smpls))
+    fname = os.path.join(self.tmp_dir, "next.txt")
+    with open(fname, 'w') as f: f.write(u"> demo.Next.run()\n< demo.Next.run()\n")
+    _smpls = [Sample(fname, is_event)]
+    _idx = encoder.smpl_index(_smpls)
+    self.assertIsNot(idx, _idx)
+    self.assertEqual(0, _idx.max_views)
+    self.assertEqual(2, idx.max_views)
+
+
+if __name__ == '__main__':
+  unittest.main()
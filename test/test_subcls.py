@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import os
+import random
+import re
+import sys
+import unittest
+
+root_dir = os.path.join(os.path.dirname(__file__), "..")
+
+sys.path.insert(0, root_dir)
+import lib.const as C
+from pasket import encoder
+from pasket.meta import classes, classes_reset
+from pasket.meta.clazz import Clazz
+
+# evaluate subcls(i, j) of the given Sketch encoding, as Python expressions
+def subcls(src, i, j):
+  env = {}
+  for name, body in re.findall(r"#define (\w+) (\{.*\})", src):
+    body = body.replace('{', '[').replace('}', ']')
+    env[name] = eval(body.replace("true", "True").replace("false", "False"))
+  body = src[src.index("bit " + C.typ.subcls):]
+  env.update(i=i, j=j)
+  for s in re.findall(r"^\s*(int \w+ = .*?|return .*?);$", body, re.M):
+    s = s.replace("&&", " and ").replace("||", " or ").replace("false", "False")
+    if s.startswith("int "):
+      k, e = s[len("int "):].split(" = ")
+      env[k] = eval(e, env)
+    else: return bool(eval(s[len("return "):], env))
+
+
+names = [C.J.OBJ, C.J.i, C.J.j, u"A", u"B", u"C", u"D", u"E", u"F", u"I", u"J", u"K"]
+itfs = [u"I", u"J", u"K"]
+
+# random classes and interfaces, along with primitive types
+def populate(seed):
+  rnd = random.Random(seed)
+  classes_reset()
+  clss = []
+  for cname in names[:rnd.randint(4, len(names))]:
+    kind = C.T.ITF if cname in itfs else C.T.CLS
+    sup = None
+    if cname != C.J.OBJ:
+      sups = [ c.name for c in clss if c.name not in C.primitives ]
+      sup = rnd.choice([None] + sups)
+    cls = Clazz(kind=kind, name=cname, sup=sup)
+    for itf in rnd.sample(itfs, rnd.randint(0, 2)):
+      if itf != cname and any(c.name == itf for c in clss): cls.add_itf(itf)
+    clss.append(cls)
+  return clss
+
+
+class TestSubcls(unittest.TestCase):
+
+  def test_rows(self):
+    for seed in xrange(30):
+      clss = populate(seed)
+      rows = encoder.subcls_rows(clss)
+      for i, cls_i in enumerate(clss):
+        for j, cls_j in enumerate(clss):
+          self.assertEqual(cls_i <= cls_j, j in rows[i])
+
+  def test_encodings(self):
+    for seed in xrange(30):
+      clss = populate(seed)
+      for enc in encoder.subcls_encodings:
+        src = encoder.gen_subcls(enc, clss)
+        for i, cls_i in enumerate(clss):
+          for j, cls_j in enumerate(clss):
+            self.assertEqual(cls_i <= cls_j, subcls(src, i, j), (enc, seed, i, j))
+
+  # encoded over the given classes, even though more have been registered
+  def test_given_classes(self):
+    clss = populate(0)
+    src = encoder.gen_subcls("dense", clss)
+    Clazz(name=u"Later", sup=C.J.OBJ)
+    self.assertEqual(len(clss) + 1, len(classes()))
+    self.assertEqual(src, encoder.gen_subcls("dense", clss))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+
+root_dir = os.path.join(os.path.dirname(__file__), "..")
+
+sys.path.insert(0, root_dir)
+import lib.visit as v
+
+# A <- B <- C, A <- D, and E
+class A(v.BaseNode): pass
+class B(A): pass
+class C(B): pass
+class D(A): pass
+class E(v.BaseNode): pass
+
+class Visitor(object):
+
+  @v.on("node")
+  def visit(self, node):
+    """
+    This is the generic method to initialize the dynamic dispatcher
+    """
+
+  @v.when(A)
+  def visit(self, node):
+    return "A"
+
+  @v.when(B)
+  def visit(self, node):
+    return "B"
+
+  @v.when(E)
+  def visit(self, node):
+    return "E"
+
+# node at the middle of the arguments, hence not dispatched in a single frame
+class Folder(object):
+
+  @v.on("node")
+  def fold(self, node, acc):
+    """
+    This is the generic method to initialize the dynamic dispatcher
+    """
+
+  @v.when(A)
+  def fold(self, node, acc):
+    return acc + ["A"]
+
+  @v.when(D)
+  def fold(self, node, acc):
+    return acc + ["D"]
+
+# resolution before tables, i.e., exact match, then every target of superclasses
+def old_dispatch(dispatcher, *args, **kw):
+  typ = args[dispatcher.param_index].__class__
+  d = dispatcher.targets.get(typ)
+  if d is not None:
+    return d(*args, **kw)
+  else:
+    t = dispatcher.targets
+    return [t[k](*args, **kw) for k in t.iterkeys() if issubclass(typ, k)]
+
+
+class TestDispatcher(unittest.TestCase):
+
+  def tearDown(self):
+    v.count_dispatches(False)
+
+  def test_exact(self):
+    vis = Visitor()
+    self.assertEqual("A", A().accept(vis))
+    self.assertEqual("B", vis.visit(B()))
+    self.assertEqual("E", vis.visit(E()))
+
+  def test_fallback(self):
+    vis = Visitor()
+    # C is not registered, hence targets of A and B
+    self.assertEqual(sorted(["A", "B"]), sorted(vis.visit(C())))
+    self.assertEqual(["A"], vis.visit(D()))
+    self.assertEqual([], vis.visit(object()))
+
+  def test_same_as_old(self):
+    vis, fld = Visitor(), Folder()
+    d_vis, d_fld = Visitor.visit.dispatcher, Folder.fold.dispatcher
+    self.assertTrue(d_vis.is_binary)
+    self.assertFalse(d_fld.is_binary)
+    # repeatedly, so as to hit tables filled by earlier resolutions
+    for _ in xrange(2):
+      for typ in [A, B, C, D, E, object]:
+        node = typ()
+        self.assertEqual(old_dispatch(d_vis, vis, node), vis.visit(node))
+        self.assertEqual(old_dispatch(d_fld, fld, node, []), fld.fold(node, []))
+        self.assertEqual(old_dispatch(d_fld, fld, node, acc=[]), fld.fold(node, acc=[]))
+
+  def test_add_target(self):
+    class Late(object):
+      @v.on("node")
+      def visit(self, node):
+        """
+        This is the generic method to initialize the dynamic dispatcher
+        """
+      @v.when(A)
+      def visit(self, node):
+        return "A"
+    vis = Late()
+    self.assertEqual(["A"], vis.visit(C()))
+    # a new target invalidates fallbacks resolved so far
+    d = Late.visit.dispatcher
+    d.add_target(B, lambda self, node: "B")
+    self.assertEqual(old_dispatch(d, vis, C()), vis.visit(C()))
+    self.assertEqual("B", vis.visit(B()))
+
+  def test_count(self):
+    vis = Visitor()
+    v.count_dispatches(True)
+    for node in [A(), B(), C(), C()]: node.accept(vis)
+    counts = v.dispatches()
+    self.assertEqual(1, counts[("A", "exact")])
+    self.assertEqual(1, counts[("B", "exact")])
+    self.assertEqual(2, counts[("C", "fallback")])
+
+
+if __name__ == '__main__':
+  unittest.main()